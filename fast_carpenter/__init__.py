@@ -8,16 +8,17 @@ __email__ = 'fast-hep@cern.ch'
 
 from .define.variables import Define
 from .define.systematics import SystematicWeights
+from .define.variations import ShapeVariations
 from .selection.stage import CutFlow, SelectPhaseSpace
-from .summary import BinnedDataframe, BuildAghast, EventByEventDataframe
+from .summary import BinnedDataframe, BuildAghast, BuildHistogram, EventByEventDataframe
 from .version import __version__, version_info
 
 
-__all__ = ["Define", "SystematicWeights", "CutFlow",
-           "SelectPhaseSpace", "BinnedDataframe", "BuildAghast",
+__all__ = ["Define", "SystematicWeights", "ShapeVariations", "CutFlow",
+           "SelectPhaseSpace", "BinnedDataframe", "BuildAghast", "BuildHistogram",
            "__version__", "version_info"]
 
 
-known_stages = [Define, SystematicWeights, CutFlow,
+known_stages = [Define, SystematicWeights, ShapeVariations, CutFlow,
                 SelectPhaseSpace, BinnedDataframe, BuildAghast,
-                EventByEventDataframe]
+                BuildHistogram, EventByEventDataframe]
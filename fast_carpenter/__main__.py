@@ -10,6 +10,9 @@ import fast_curator
 import logging
 from .backends import get_backend, KNOW_BACKENDS_NAMES
 from .data_import import get_data_import_plugin
+from .branch_usage import sequence_branch_usage
+from .define.variations import expand_shape_variations
+from .subexpressions import eliminate_common_subexpressions
 from .utils import mkdir_p
 from .bookkeeping import write_booking
 from .version import __version__
@@ -59,6 +62,12 @@ def create_parser():
                         help="Which data import plugin to use (uproot3, uproot4, etc")
     parser.add_argument("--data-import-plugin-cfg", default=None, type=str,
                         help="Configuration file for the data import plugin")
+    parser.add_argument("--compact-masks", default=False, action='store_true',
+                        help="Remove events rejected by a CutFlow from the data seen by subsequent stages, "
+                             "rather than masking them")
+    parser.add_argument("--share-subexpressions", default=False, action='store_true',
+                        help="Compute subexpressions repeated across stages only once per block, "
+                             "as hidden temporary variables")
 
     return parser
 
@@ -68,9 +77,13 @@ def main(args=None):
 
     sequence, seq_cfg = fast_flow.read_sequence_yaml(args.sequence_cfg, output_dir=args.outdir,
                                                      backend="fast_carpenter", return_cfg=True)
+    sequence = expand_shape_variations(sequence)
+    if args.share_subexpressions:
+        sequence = eliminate_common_subexpressions(sequence)
     datasets = fast_curator.read.from_yaml(args.dataset_cfg)
     backend = get_backend(args.mode)
     data_import_plugin = get_data_import_plugin(args.data_import_plugin, args.data_import_plugin_cfg)
+    data_import_plugin.branch_usage = sequence_branch_usage(sequence)
 
     mkdir_p(args.outdir)
     if args.bookkeeping:
@@ -11,6 +11,7 @@ import awkward as awk
 import numpy as np
 
 from fast_carpenter.data_import import DataImportBase, get_data_import_plugin
+from fast_carpenter.data_import._prefetch import PrefetchingTree
 from fast_carpenter.tree_adapter import create_masked
 
 
@@ -21,7 +22,7 @@ class BEvents(object):
     non_branch_attrs = [
         "tree", "nevents_in_tree", "nevents_per_block", "nblocks",
         "start_block", "stop_block", "iblock", "start_entry", "stop_entry",
-        "_branch_cache", "_nonbranch_cache", "size", "config",
+        "_branch_cache", "_nonbranch_cache", "size", "config", "_source", "data_import",
     ]
 
     def __init__(
@@ -29,7 +30,8 @@ class BEvents(object):
         branch_cache={},
     ):
         self.tree = tree
-        self.nevents_in_tree = len(tree)
+        # len() of an uproot4 tree is its number of branches, not entries
+        self.nevents_in_tree = tree.num_entries if hasattr(tree, "num_entries") else len(tree)
         self.nevents_per_block = int(nevents_per_block) \
             if nevents_per_block >= 0 \
             else self.nevents_in_tree
@@ -167,35 +169,55 @@ class EventRanger():
 
 
 class BEventsWrapped(BEvents):
-    def __init__(self, tree, *args, **kwargs):
+    def __init__(self, tree, *args, compact_masks=False, data_import=None, **kwargs):
         ranges = EventRanger()
 
         super(BEventsWrapped, self).__init__(tree, *args, **kwargs)
         ranges.set_owner(self)
+        self._source = tree
+        self.data_import = data_import
         tree = create_masked(
             {
                 "tree": tree,
                 "start": self.start_entry,
                 "stop": self.stop_entry,
                 "adapter": "uproot4",
+                "compact": compact_masks,
             }
         )
         self.tree = tree
 
     def _block_changed(self):
+        if self.iblock > -1:
+            self.tree.set_range(self.start_entry, self.stop_entry)
+            if hasattr(self._source, "prefetch"):
+                self._source.prefetch(self.start_entry, self.stop_entry)
+                if self._source.looks_ahead and self.iblock + 1 < self.nblocks:
+                    next_stop = min(self.stop_entry + self.nevents_per_block, self.nevents_in_tree)
+                    self._source.prefetch(self.stop_entry, next_stop)
         self.tree.reset_mask()
         self.tree.reset_cache()
 
     def __getitem__(self, i):
-        result = super(BEventsWrapped, self).__getitem__(self, i)
+        result = super(BEventsWrapped, self).__getitem__(i)
         self._block_changed()
         return result
 
     def __iter__(self):
-        for value in super(BEventsWrapped, self).__iter__():
+        try:
+            for value in super(BEventsWrapped, self).__iter__():
+                self._block_changed()
+                yield value
             self._block_changed()
-            yield value
-        self._block_changed()
+        finally:
+            self.close()
+
+    def close(self):
+        """ Stops the background reads once all blocks have been processed. """
+        if isinstance(self._source, PrefetchingTree):
+            self._source.close()
+        if self.data_import is not None:
+            self.data_import.close()
 
     @property
     def start_entry(self):
@@ -210,6 +232,7 @@ class BEventsWrapped(BEvents):
 
 class EventBuilder(object):
     data_import_plugin: DataImportBase = None
+    compact_masks: bool = False
 
     def __init__(self, config):
         self.config = config
@@ -231,6 +254,8 @@ class EventBuilder(object):
             self.config.nevents_per_block,
             self.config.start_block,
             self.config.stop_block,
+            compact_masks=EventBuilder.compact_masks,
+            data_import=EventBuilder.data_import_plugin,
         )
         events.config = self.config
         return events
@@ -269,6 +294,7 @@ def execute(sequence, datasets, args, plugins: Dict[str, Any] = None):
 
     if args.ncores < 1:
         args.ncores = 1
+    EventBuilder.compact_masks = getattr(args, "compact_masks", False)
 
     sequence = [(s, s.collector() if hasattr(s, "collector") else DummyCollector()) for s in sequence]
 
@@ -75,10 +75,11 @@ class stages_accumulator(cop.AccumulatorABC):
 
 
 class FASTProcessor(cop.ProcessorABC):
-    def __init__(self, sequence):
+    def __init__(self, sequence, compact_masks=False):
 
         self._columns = list()
         self._sequence = sequence
+        self._compact_masks = compact_masks
         accumulator_dict = {'stages': cop.dict_accumulator({})}
         self._accumulator = cop.dict_accumulator(accumulator_dict)
 
@@ -94,12 +95,13 @@ class FASTProcessor(cop.ProcessorABC):
         output = self.accumulator.identity()
         connector = CoffeaConnector(df)
 
-        # tree = MaskedUprootTree(df._tree, EventRanger(start, stop, stop - start))
+        # the connector only holds the entries of this chunk, so the range is relative to it
         tree = create_masked(
             dict(
                 tree=connector,
-                start=connector.start,
-                stop=connector.stop
+                start=0,
+                stop=connector.num_entries,
+                compact=self._compact_masks,
             ))
 
         dsname = connector.dataset
@@ -205,7 +207,7 @@ def create_executor(args):
 
 
 def execute(sequence, datasets, args, plugins):
-    fp = FASTProcessor(sequence)
+    fp = FASTProcessor(sequence, compact_masks=getattr(args, "compact_masks", False))
 
     executor, exe_args = create_executor(args)
 
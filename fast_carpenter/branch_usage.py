@@ -0,0 +1,52 @@
+"""
+Works out which branches of the input trees a processing sequence reads, so
+that they can be read in one go for each block rather than one at a time.
+
+Stages take part by providing a ``branch_usage()`` method which returns the
+expressions the stage evaluates and the names of the variables it defines.
+"""
+import logging
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from .expressions import get_branches
+
+logger = logging.getLogger(__name__)
+
+
+class BranchUsage(object):
+    """
+    The expressions used and variables defined by each stage of a sequence, in order.
+    """
+
+    def __init__(self, steps: Sequence[Tuple[List[str], List[str]]]) -> None:
+        self.steps = [(list(expressions), list(defined)) for expressions, defined in steps]
+
+    def branches(self, valid: Iterable[str]) -> List[str]:
+        """
+        Returns the branches out of ``valid`` that the sequence reads, skipping
+        variables defined by an earlier stage.
+        """
+        valid = set(valid)
+        needed = {}
+        for expressions, defined in self.steps:
+            for expression in expressions:
+                needed.update((branch, None) for branch in get_branches(expression, valid))
+            valid.difference_update(defined)
+        return list(needed)
+
+
+def sequence_branch_usage(sequence: Sequence) -> Optional[BranchUsage]:
+    """
+    Collects the branch usage of each stage in the sequence.
+
+    Returns ``None`` if any stage cannot say which variables it uses, in which
+    case branches have to be read as the stages ask for them.
+    """
+    steps = []
+    for stage in sequence:
+        if not hasattr(stage, "branch_usage"):
+            name = getattr(stage, "name", stage.__class__.__name__)
+            logger.info(f"Stage {name} does not declare the variables it uses, branches will be read on demand")
+            return None
+        steps.append(stage.branch_usage())
+    return BranchUsage(steps)
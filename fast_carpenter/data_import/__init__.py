@@ -1,4 +1,9 @@
+from importlib import import_module
 from pathlib import Path
+from typing import Any, Dict
+
+import yaml
+
 from ._base import DataImportBase
 from ._uproot4 import Uproot4DataImport
 from ._uproot3 import Uproot3DataImport
@@ -16,19 +21,37 @@ def register_data_import_plugin(plugin_name: str, plugin_class: DataImportBase)
     _DATA_IMPORT_PLUGINS[plugin_name] = plugin_class
 
 
-def _process_plugin_config(plugin_name: str, plugin_config: Path) -> None:
+def _process_plugin_config(plugin_name: str, plugin_config: Path) -> Dict[str, Any]:
     """
         Process the plugin configuration file.
         Reads the "register" and "plugin_name" sections to register and configure the plugin.
+
+        The "register" section maps plugin names to the classes implementing them,
+        given as "module.ClassName".  The "plugin_name" section is returned as the
+        configuration of the plugin, e.g. for uproot4::
+
+            uproot4:
+              max_open_files: 8
+              prefetch: true
     """
     if plugin_config is None:
-        return
+        return {}
+    plugin_config = Path(plugin_config)
     if not plugin_config.exists():
         raise ValueError(f"Plugin config file {plugin_config} does not exist")
     if not plugin_config.is_file():
         raise ValueError(f"Plugin config file {plugin_config} is not a file")
 
-    raise NotImplementedError("Plugin config file processing not implemented yet")
+    with open(plugin_config, "r") as infile:
+        config = yaml.safe_load(infile) or {}
+    if not isinstance(config, dict):
+        raise ValueError(f"Plugin config file {plugin_config} does not contain a dictionary")
+
+    for name, class_path in config.get("register", {}).items():
+        module_name, _, class_name = class_path.rpartition(".")
+        register_data_import_plugin(name, getattr(import_module(module_name), class_name))
+
+    return config.get(plugin_name, None) or {}
 
 
 def get_data_import_plugin(plugin_name: str, plugin_config: Path) -> DataImportBase:
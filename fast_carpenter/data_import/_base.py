@@ -1,12 +1,18 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
+
+from ..branch_usage import BranchUsage
 
 
 class DataImportBase(ABC):
     """
     This Abstract Base Class is the base class for all data import classes.
+
+    If ``branch_usage`` is set, it describes the branches the processing
+    sequence will read, so that they can be read in bulk for each block.
     """
     config: Dict[str, Any]
+    branch_usage: Optional[BranchUsage] = None
 
     def __init__(self, config: Dict[str, Any]) -> None:
         self.config = config
@@ -24,3 +30,10 @@ class DataImportBase(ABC):
         This method is called by the importer to open the files.
         """
         pass
+
+    def close(self) -> None:
+        """
+        This method is called once all blocks of a job have been read, to release
+        anything (e.g. background threads) held only while reading.
+        """
+        pass
@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PrefetchingTree(object):
+    """
+    Wraps a tree so that the branches for an upcoming range of entries can be
+    read (and decompressed) on a background thread.
+
+    The branches to prefetch are the ones given up front plus every branch
+    read so far.  At most ``max_blocks`` prefetched ranges are held besides the
+    one currently being read, older ones are dropped.  Without an executor,
+    :meth:`prefetch` reads the branches straight away, in a single call.
+    """
+
+    def __init__(self, tree: Any, executor: Optional[ThreadPoolExecutor] = None, max_blocks: int = 1,
+                 keys: Optional[Iterable[str]] = None) -> None:
+        self.tree = tree
+        self.executor = executor
+        self.max_blocks = max_blocks
+        self.known_keys = OrderedDict((key, None) for key in keys or [])
+        self._prefetched = OrderedDict()
+
+    @property
+    def looks_ahead(self) -> bool:
+        """ Whether upcoming blocks can be read in the background, while the current one is processed. """
+        return self.executor is not None and self.max_blocks > 0
+
+    @property
+    def num_entries(self) -> int:
+        return self.tree.num_entries
+
+    def keys(self, *args, **kwargs):
+        return self.tree.keys(*args, **kwargs)
+
+    def __iter__(self):
+        return iter(self.tree)
+
+    def __len__(self):
+        return len(self.tree)
+
+    def __getitem__(self, key):
+        return PrefetchingBranch(self, key)
+
+    def prefetch(self, entry_start: int, entry_stop: int) -> None:
+        """
+        Starts reading the known branches for [entry_start, entry_stop) in the background.
+        """
+        entry_range = (entry_start, entry_stop)
+        if not self.known_keys or entry_range in self._prefetched:
+            return
+        keys = list(self.known_keys)
+        self._prefetched[entry_range] = (keys, self._submit(
+            self.tree.arrays, keys, entry_start=entry_start, entry_stop=entry_stop, library="ak", how=dict
+        ))
+        while len(self._prefetched) > self.max_blocks + 1:
+            _, (_, future) = self._prefetched.popitem(last=False)
+            future.cancel()
+
+    def close(self) -> None:
+        """
+        Cancels the reads that have not started yet and drops the prefetched blocks.
+        """
+        for _, future in self._prefetched.values():
+            future.cancel()
+        self._prefetched.clear()
+
+    def _submit(self, function, *args, **kwargs) -> Future:
+        if self.executor is not None:
+            return self.executor.submit(function, *args, **kwargs)
+        future = Future()
+        try:
+            future.set_result(function(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _take_prefetched(self, keys: List[str], entry_range: Tuple[int, int]) -> Dict[str, Any]:
+        if entry_range not in self._prefetched:
+            return {}
+        prefetched_keys, future = self._prefetched[entry_range]
+        if not any(key in prefetched_keys for key in keys):
+            return {}
+        try:
+            arrays = future.result()
+        except Exception as e:
+            logger.debug(f"Prefetching entries {entry_range} failed, reading them directly: {e}")
+            del self._prefetched[entry_range]
+            return {}
+        return {key: arrays[key] for key in keys if key in arrays}
+
+    def arrays(self, keys, entry_start=None, entry_stop=None, **kwargs):
+        arrays = self._take_prefetched(keys, (entry_start, entry_stop))
+        missing = [key for key in keys if key not in arrays]
+        if missing:
+            kwargs["how"] = dict
+            arrays.update(self.tree.arrays(missing, entry_start=entry_start, entry_stop=entry_stop, **kwargs))
+        self.known_keys.update((key, None) for key in keys)
+        return {key: arrays[key] for key in keys}
+
+    def array(self, key, entry_start=None, entry_stop=None, **kwargs):
+        arrays = self._take_prefetched([key], (entry_start, entry_stop))
+        if key in arrays:
+            return arrays[key]
+        array = self.tree[key].array(entry_start=entry_start, entry_stop=entry_stop, **kwargs)
+        self.known_keys[key] = None
+        return array
+
+
+class PrefetchingBranch(object):
+    """
+    One branch of a PrefetchingTree.
+    """
+
+    def __init__(self, tree: PrefetchingTree, key: str) -> None:
+        self.tree = tree
+        self.key = key
+
+    def array(self, entry_start=None, entry_stop=None, **kwargs):
+        return self.tree.array(self.key, entry_start=entry_start, entry_stop=entry_stop, **kwargs)
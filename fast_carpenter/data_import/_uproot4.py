@@ -1,33 +1,160 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
 from typing import Any, Dict, List
 
+from cachetools import LRUCache
+
 from ._base import DataImportBase
+from ._prefetch import PrefetchingTree
+from ..tree_adapter import ChainedTree
+
+DEFAULT_MAX_OPEN_FILES = 16
+
+
+class FileHandlePool(LRUCache):
+    """
+    Keeps the most recently used files (and the trees read from them) open,
+    closing the least recently used file once more than ``maxsize`` are open.
+
+    Trees are looked up from the prefetching threads as well as the main one,
+    so :meth:`tree` holds a lock while it opens, evicts or reads the pool.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_MAX_OPEN_FILES) -> None:
+        super().__init__(maxsize)
+        self._trees = {}
+        self._lock = threading.RLock()
+
+    def __missing__(self, path: str) -> Any:
+        import uproot
+        # Try to open the tree - some machines have configured limitations
+        # which prevent memmaps from begin created. Use a fallback - the
+        # localsource option
+        try:
+            rootfile = uproot.open(path)
+        except MemoryError:
+            rootfile = uproot.open(path, file_handler=uproot.source.chunk.Source)
+        self[path] = rootfile
+        return rootfile
+
+    def popitem(self):
+        path, rootfile = super().popitem()
+        for key in [key for key in self._trees if key[0] == path]:
+            del self._trees[key]
+        rootfile.close()
+        return path, rootfile
+
+    def tree(self, path: str, treename: str) -> Any:
+        with self._lock:
+            rootfile = self[path]
+            key = (path, treename)
+            if key not in self._trees:
+                self._trees[key] = rootfile[treename]
+            return self._trees[key]
+
+
+class PooledTrees(object):
+    """
+    The same tree in each of several files, opened through a FileHandlePool when accessed.
+    """
+
+    def __init__(self, pool: FileHandlePool, paths: List[str], treename: str) -> None:
+        self.pool = pool
+        self.paths = paths
+        self.treename = treename
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, index: int) -> Any:
+        return self.pool.tree(self.paths[index], self.treename)
+
+
+class PooledFiles(object):
+    """
+    The files opened for one job.  Indexing with a tree name gives that tree,
+    chained across all files if there is more than one.
+    """
+
+    def __init__(self, pool: FileHandlePool, paths: List[str], data_import: "Uproot4DataImport" = None) -> None:
+        self.pool = pool
+        self.paths = paths
+        self.data_import = data_import
+
+    def __getitem__(self, treename: str) -> Any:
+        if len(self.paths) == 1:
+            tree = self.pool.tree(self.paths[0], treename)
+        else:
+            tree = ChainedTree(PooledTrees(self.pool, self.paths, treename))
+        if self.data_import is None:
+            return tree
+        branch_usage = self.data_import.branch_usage
+        keys = branch_usage.branches(tree.keys()) if branch_usage is not None else None
+        if self.data_import.prefetch:
+            return PrefetchingTree(tree, self.data_import.executor, max_blocks=self.data_import.prefetch_blocks,
+                                   keys=keys)
+        if keys:
+            return PrefetchingTree(tree, max_blocks=0, keys=keys)
+        return tree
 
 
 class Uproot4DataImport(DataImportBase):
     """
     This class is a wrapper around the uproot library.
+
+    Opened files are kept in a pool of at most ``max_open_files`` (set in the
+    plugin config), so that successive blocks from the same file reuse its
+    handle.
+
+    If the branches used by the sequence are known (see ``branch_usage``),
+    they are all read in a single call at the start of each block.
+
+    With ``prefetch: true``, the branches needed for the next block are read
+    by a pool of ``prefetch_workers`` background threads while the current
+    block is processed, holding at most ``prefetch_blocks`` blocks ahead.
+    The threads are stopped by :meth:`close`, once a job has read all its blocks.
     """
 
     def __init__(self, config: Dict[str, Any]) -> None:
         super().__init__(config)
+        self._process_config()
+        self.files = FileHandlePool(self.max_open_files)
+        self._executor = None
 
     def _process_config(self):
-        pass
+        config = self.config or {}
+        self.max_open_files = int(config.get("max_open_files", DEFAULT_MAX_OPEN_FILES))
+        self.prefetch = bool(config.get("prefetch", False))
+        self.prefetch_workers = int(config.get("prefetch_workers", 1))
+        self.prefetch_blocks = int(config.get("prefetch_blocks", 1))
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.prefetch_workers,
+                                                thread_name_prefix="fast_carpenter_prefetch")
+        return self._executor
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __getstate__(self):
+        # open files and threads stay with the process that created them
+        state = self.__dict__.copy()
+        del state["files"]
+        state["_executor"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.files = FileHandlePool(self.max_open_files)
 
     def open(self, paths: List[str]) -> Any:
         """
-        This method is called by the importer to open the file.
+        This method is called by the importer to open the files.
         """
-        import uproot
-        if len(paths) != 1:
-            # TODO - support multiple paths
-            raise AttributeError("Multiple paths not yet supported")
-        # Try to open the tree - some machines have configured limitations
-        # which prevent memmaps from begin created. Use a fallback - the
-        # localsource option
-        input_file = paths[0]
-        try:
-            rootfile = uproot.open(input_file)
-        except MemoryError:
-            rootfile = uproot.open(input_file, file_handler=uproot.source.chunk.Source)
-        return rootfile
+        if not paths:
+            raise ValueError("No input files given")
+        return PooledFiles(self.files, list(paths), self)
@@ -1,5 +1,6 @@
 from .variables import Define
 from .systematics import SystematicWeights
+from .variations import ShapeVariations
 
 
-__all__ = ["Define", "SystematicWeights"]
+__all__ = ["Define", "SystematicWeights", "ShapeVariations"]
@@ -0,0 +1,209 @@
+"""
+Reductions over lists of numbers compiled with `numba <https://numba.pydata.org/>`_.
+
+Each kernel makes a single pass over the list offsets and flat contents of an
+array, writing into a preallocated output.  If numba is not installed,
+:func:`reduce` returns ``None`` and the reductions fall back to the
+:class:`~fast_carpenter.tree_adapter.ArrayMethods` implementation.
+"""
+import numpy as np
+import awkward as ak
+
+from ..expressions import flatten
+
+try:
+    import numba
+    has_numba = True
+except ImportError as ex:
+    if "numba" not in str(ex):
+        raise
+    numba = None
+    has_numba = False
+
+__all__ = ["has_numba", "reduce", "nth", "nth_many", "SUPPORTED"]
+
+SUPPORTED = ["sum", "max", "min", "argmax", "count_nonzero"]
+
+
+def _nth(offsets, contents, index, padding, fill, out):
+    # as for JaggedNth, lists shorter than padding are first padded with fill on the right
+    for i in range(len(offsets) - 1):
+        start, stop = offsets[i], offsets[i + 1]
+        position = index if index >= 0 else max(stop - start, padding) + index
+        if position < stop - start:
+            out[i] = contents[start + position]
+        else:
+            out[i] = fill
+
+
+def _nth_many(offsets, contents, indices, fill, out):
+    # out has one row per index, so that each row is a contiguous column of the result
+    for i in range(len(offsets) - 1):
+        start, stop = offsets[i], offsets[i + 1]
+        for k in range(len(indices)):
+            if indices[k] < stop - start:
+                out[k, i] = contents[start + indices[k]]
+            else:
+                out[k, i] = fill
+
+
+def _sum(offsets, contents, out, present):
+    for i in range(len(offsets) - 1):
+        total = out[i]
+        for j in range(offsets[i], offsets[i + 1]):
+            total += contents[j]
+        out[i] = total
+
+
+def _count_nonzero(offsets, contents, out, present):
+    for i in range(len(offsets) - 1):
+        count = 0
+        for j in range(offsets[i], offsets[i + 1]):
+            if contents[j] != 0:
+                count += 1
+        out[i] = count
+
+
+def _max(offsets, contents, out, present):
+    for i in range(len(offsets) - 1):
+        start, stop = offsets[i], offsets[i + 1]
+        if start == stop:
+            present[i] = False
+            continue
+        best = contents[start]
+        for j in range(start + 1, stop):
+            if contents[j] > best:
+                best = contents[j]
+        out[i] = best
+
+
+def _min(offsets, contents, out, present):
+    for i in range(len(offsets) - 1):
+        start, stop = offsets[i], offsets[i + 1]
+        if start == stop:
+            present[i] = False
+            continue
+        best = contents[start]
+        for j in range(start + 1, stop):
+            if contents[j] < best:
+                best = contents[j]
+        out[i] = best
+
+
+def _argmax(offsets, contents, out, present):
+    for i in range(len(offsets) - 1):
+        start, stop = offsets[i], offsets[i + 1]
+        if start == stop:
+            present[i] = False
+            continue
+        best = start
+        for j in range(start + 1, stop):
+            if contents[j] > contents[best]:
+                best = j
+        out[i] = best - start
+
+
+if has_numba:
+    _nth = numba.njit(_nth)
+    _nth_many = numba.njit(_nth_many)
+    _kernels = {name: numba.njit(kernel) for name, kernel in
+                [("sum", _sum), ("count_nonzero", _count_nonzero),
+                 ("max", _max), ("min", _min), ("argmax", _argmax)]}
+
+
+def _output_dtype(method, dtype):
+    if method == "sum":
+        return np.zeros(0, dtype=np.int64 if dtype == bool else dtype).sum().dtype
+    if method in ("count_nonzero", "argmax"):
+        return np.int64
+    return np.uint8 if dtype == bool else dtype
+
+
+def _wrap(values, valid, present=None):
+    """
+    Builds the reduced array, with missing entries where the input entry was
+    missing or, if ``present`` is given, where there was nothing to reduce.
+    """
+    result = ak.layout.NumpyArray(values)
+    if valid is None and (present is None or present.all()):
+        return ak.Array(result)
+    selected = np.ones(len(values), dtype=bool) if present is None else present
+    positions = np.where(selected, np.arange(len(values)), -1)
+    if valid is not None:
+        full_positions = np.full(len(valid), -1, dtype=np.int64)
+        full_positions[valid] = positions
+        positions = full_positions
+    return ak.Array(ak.layout.IndexedOptionArray64(ak.layout.Index64(positions), result))
+
+
+def _flatten_lists(array):
+    """ Returns the validity mask, offsets, contents and type of the contents, or None. """
+    flattened = flatten(array)
+    if flattened is None or flattened[1] is None:
+        return None
+    valid, offsets, contents = flattened
+    dtype = contents.dtype
+    if dtype == bool:
+        contents = contents.view(np.uint8)
+    return valid, offsets, contents, dtype
+
+
+def reduce(method, array):
+    """
+    Reduces each list of the array with ``method``, one of :data:`SUPPORTED`.
+
+    Returns None if numba is not available or the array is not made of lists of numbers.
+    """
+    if not has_numba or method not in SUPPORTED:
+        return None
+    flattened = _flatten_lists(array)
+    if flattened is None:
+        return None
+    valid, offsets, contents, dtype = flattened
+    out = np.zeros(len(offsets) - 1, dtype=_output_dtype(method, dtype))
+    present = np.ones(len(out), dtype=bool)
+    _kernels[method](offsets, contents, out, present)
+    if method in ("max", "min") and dtype == bool:
+        out = out.astype(bool)
+    return _wrap(out, valid, present)
+
+
+def nth(array, index, padding, fill_missing, dtype):
+    """
+    Takes the element at ``index`` of each list, after padding it with
+    ``fill_missing`` to at least ``padding`` elements.
+
+    Returns None if numba is not available or the array is not made of lists of numbers.
+    """
+    if not has_numba:
+        return None
+    flattened = _flatten_lists(array)
+    if flattened is None:
+        return None
+    valid, offsets, contents, _ = flattened
+    out = np.empty(len(offsets) - 1, dtype=np.uint8 if dtype == np.bool_ else dtype)
+    _nth(offsets, contents, index, padding, out.dtype.type(fill_missing), out)
+    if dtype == np.bool_:
+        out = out.astype(bool)
+    return _wrap(out, valid)
+
+
+def nth_many(array, indices, fill_missing, dtype):
+    """
+    Takes the elements at several non-negative ``indices`` of each list in one
+    pass, or ``fill_missing`` where the list is too short.
+
+    Returns a list with one array per index, or None if numba is not available
+    or the array is not made of lists of numbers.
+    """
+    if not has_numba:
+        return None
+    flattened = _flatten_lists(array)
+    if flattened is None:
+        return None
+    valid, offsets, contents, _ = flattened
+    out = np.empty((len(indices), len(offsets) - 1), dtype=np.uint8 if dtype == np.bool_ else dtype)
+    _nth_many(offsets, contents, np.asarray(indices, dtype=np.int64), out.dtype.type(fill_missing), out)
+    if dtype == np.bool_:
+        out = out.view(bool)
+    return [_wrap(column, valid) for column in out]
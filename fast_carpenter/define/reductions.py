@@ -1,8 +1,10 @@
+import re
 import numpy as np
 import six
 from typing import List
 
 from ..tree_adapter import ArrayMethods
+from . import compiled_reductions
 
 __all__ = ["get_pandas_reduction"]
 
@@ -25,6 +27,9 @@ class JaggedNth(object):
 
     def __call__(self, array):
         padding = abs(self.index) + 1 if self.index >= 0 else abs(self.index)
+        result = compiled_reductions.nth(array, self.index, padding, self.fill_missing, self.dtype)
+        if result is not None:
+            return result
         result = ArrayMethods.pad(array, padding)
         result = ArrayMethods.fill_none(result, self.fill_missing, axis=-1)
         if self.dtype is not None:
@@ -32,12 +37,57 @@ class JaggedNth(object):
         return result[..., self.index]
 
 
+class JaggedNths(JaggedNth):
+    """
+    Takes several elements of each list at once, e.g. to define the momenta of
+    the three leading jets with one evaluation and one padding pass.
+    Returns one array per index.
+    """
+
+    def __init__(self, indices, fill_missing, force_float=True):
+        super(JaggedNths, self).__init__(max(indices), fill_missing, force_float=force_float)
+        self.indices = list(indices)
+
+    def __call__(self, array):
+        result = compiled_reductions.nth_many(array, self.indices, self.fill_missing, self.dtype)
+        if result is not None:
+            return result
+        padded = ArrayMethods.pad(array, max(self.indices) + 1, clip=True)
+        padded = ArrayMethods.fill_none(padded, self.fill_missing, axis=-1)
+        if self.dtype is not None:
+            padded = ArrayMethods.values_as_type(padded, self.dtype)
+        return [padded[..., index] for index in self.indices]
+
+
+def get_indices(reduction):
+    """
+    Returns the list of indices for a reduction that takes several elements,
+    given as a list of integers or a slice such as "0:3", or None for other reductions.
+    """
+    if isinstance(reduction, (list, tuple)):
+        if not reduction or not all(isinstance(index, six.integer_types) and index >= 0 for index in reduction):
+            return None
+        return list(reduction)
+    if isinstance(reduction, six.string_types):
+        match = re.fullmatch(r"\s*(\d*)\s*:\s*(\d+)\s*(?::\s*(\d+)\s*)?", reduction)
+        if not match:
+            return None
+        start, stop, step = match.groups()
+        indices = list(range(int(start or 0), int(stop), int(step or 1)))
+        return indices or None
+    return None
+
+
 class JaggedMethod(object):
     SUPPORTED: List[str] = ["sum", "prod", "any", "all", "count_nonzero",
                             "max", "min", "argmin", "argmax"]
     DEFAULTS = {
         "count_nonzero": {"axis": 1},
         "sum": {"axis": 1},
+        "prod": {"axis": 1},
+        "min": {"axis": 1},
+        "argmin": {"axis": 1},
+        "argmax": {"axis": 1},
     }
 
     def __init__(self, method):
@@ -45,6 +95,9 @@ class JaggedMethod(object):
         self._defaults = self.DEFAULTS.get(method, {})
 
     def __call__(self, array):
+        result = compiled_reductions.reduce(self.method_name, array)
+        if result is not None:
+            return result
         return getattr(ArrayMethods, self.method_name)(array, **self._defaults)
 
 
@@ -62,8 +115,12 @@ def get_awkward_reduction(stage_name, reduction, fill_missing=np.nan):
     if isinstance(reduction, six.integer_types):
         return JaggedNth(int(reduction), fill_missing)
 
+    indices = get_indices(reduction)
+    if indices is not None:
+        return JaggedNths(indices, fill_missing)
+
     if not isinstance(reduction, six.string_types):
-        msg = "{}: requested reduce method is not a string or an int"
+        msg = "{}: requested reduce method is not a string or an int, nor a list of non-negative ints"
         raise BadReductionConfig(msg.format(stage_name))
 
     if reduction in JaggedMethod.SUPPORTED:
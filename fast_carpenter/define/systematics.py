@@ -1,4 +1,6 @@
-from .variables import Define
+from collections import namedtuple
+import numpy as np
+from ..expressions import compile_expression, evaluate
 import six
 
 
@@ -18,10 +20,14 @@ class SystematicWeights():
     then the specific variation by replacing a given nominal weight with its corresponding "up" or "down" variation.
 
     Each variation of a weight should just be a string giving an expression to
-    use for that variation.  This stage then combines these into a single
-    expression by joining each set of variations with `"*"`, i.e. multiplying
-    them together.  The final results then use an internal :py:class:`Define`
-    stage to do the calculation.
+    use for that variation.  This stage evaluates each nominal weight once and
+    multiplies them together.  Each variation is then the product of all the
+    other nominal weights, taken from running products from the left and from
+    the right, times the varied weight.  So each block costs a number of
+    multiplications proportional to the number of weights plus the number of
+    variations, and no division by a (possibly zero) nominal weight is needed.
+    Weights that do not use any variable, such as ``"1.025"``, are multiplied
+    in as plain numbers.
 
     Parameters:
       weights (dictionary[str, dictionary]):  A Dictionary of weight variations
@@ -62,13 +68,84 @@ class SystematicWeights():
         self.name = name
         self.out_dir = out_dir
         weights = _normalize_weights(name, weights, tuple(extra_variations))
-        variations = _build_variations(name, weights, out_fmt=out_format)
-        self.variable_maker = Define(name + "_builder", out_dir, variations)
+        self._nominal_name, self._factors, self._variations = _build_factors(name, weights, out_fmt=out_format)
 
     def event(self, chunk):
         if not chunk.config.dataset.eventtype == "mc":
             return True
-        return self.variable_maker.event(chunk)
+        factors = [_evaluate(chunk.tree, factor) for factor in self._factors]
+        from_left, from_right = _running_products(factors)
+        chunk.tree.new_variable(self._nominal_name, _per_event(chunk.tree, from_left[-1]))
+        for variation in self._variations:
+            others = _multiply(from_left[variation.index], from_right[variation.index + 1])
+            varied = _evaluate(chunk.tree, variation.expression)
+            chunk.tree.new_variable(variation.name, _per_event(chunk.tree, _multiply(others, varied)))
+        return True
+
+    def branch_usage(self):
+        expressions = self._factors + [variation.expression for variation in self._variations]
+        return expressions, [self._nominal_name] + [variation.name for variation in self._variations]
+
+    def rewrite_expressions(self, substitutions):
+        self._factors = [compile_expression(substitutions.get(factor, factor)) for factor in self._factors]
+        self._variations = [variation._replace(expression=compile_expression(
+            substitutions.get(variation.expression, variation.expression))) for variation in self._variations]
+
+    def rename_outputs(self, renames):
+        self._nominal_name = renames.get(self._nominal_name, self._nominal_name)
+        self._variations = [variation._replace(name=renames.get(variation.name, variation.name))
+                            for variation in self._variations]
+
+
+def _evaluate(tree, expression):
+    """ Evaluates a weight, as a plain number if it does not use any variable. """
+    if not expression.branches:
+        return expression.evaluate_constant()
+    return evaluate(tree, expression)
+
+
+def _per_event(tree, weight):
+    """ Repeats a weight that is a plain number for every event. """
+    if np.isscalar(weight):
+        return np.full(len(tree), weight)
+    return weight
+
+
+def _multiply(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    return left * right
+
+
+def _running_products(factors):
+    """
+    Returns the products of the factors before each position (from the left) and
+    from each position onwards (from the right), with None standing for an empty product.
+    """
+    from_left = [None]
+    for factor in factors:
+        from_left.append(_multiply(from_left[-1], factor))
+    from_right = [None]
+    for factor in reversed(factors):
+        from_right.append(_multiply(factor, from_right[-1]))
+    return from_left, from_right[::-1]
+
+
+Variation = namedtuple("Variation", "name index expression")
+
+
+def _build_factors(stage_name, weights, out_fmt="weight_{}"):
+    """
+    Splits the weights into the nominal expression of each weight and the
+    variations, each of which replaces the nominal weight at a given index.
+    """
+    nominal_name = out_fmt.format("nominal")
+    factors = [compile_expression("(" + w["nominal"] + ")") for w in weights.values()]
+    variations = [Variation(out_fmt.format(name + "_" + var), index, compile_expression("(" + w[var] + ")"))
+                  for index, (name, w) in enumerate(weights.items()) for var in w if var != "nominal"]
+    return nominal_name, factors, variations
 
 
 def _normalize_weights(stage_name, variable_list, valid_vars):
@@ -79,21 +156,6 @@ def _normalize_weights(stage_name, variable_list, valid_vars):
             for name, cfg in variable_list.items()}
 
 
-def _build_variations(stage_name, weights, out_fmt="weight_{}"):
-    def _combine_weights(w):
-        return "(" + ")*(".join(w) + ")"
-
-    nominal_weights = {n: w["nominal"] for n, w in weights.items()}
-    variations = [{out_fmt.format("nominal"): _combine_weights(nominal_weights.values())}]
-    weights_to_vary = {(n, var): w[var] for n, w in weights.items() for var in w if var != "nominal"}
-    for (name, direction), variable in weights_to_vary.items():
-        combination = nominal_weights.copy()
-        combination[name] = variable
-        combination = _combine_weights(combination.values())
-        variations.append({out_fmt.format(name + "_" + direction): combination})
-    return variations
-
-
 def _normalize_one_variation(stage_name, cfg, name, valid_vars):
     if isinstance(cfg, six.string_types):
         return dict(nominal=cfg)
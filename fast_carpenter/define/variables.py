@@ -4,8 +4,8 @@ import six
 from collections import namedtuple
 import numpy as np
 from awkward0 import JaggedArray
-from ..expressions import get_branches, evaluate
-from .reductions import get_pandas_reduction, get_awkward_reduction
+from ..expressions import compile_expression, get_branches, evaluate, evaluate_flat_together
+from .reductions import get_pandas_reduction, get_awkward_reduction, get_indices
 
 
 class BadVariablesConfig(Exception):
@@ -35,6 +35,11 @@ class Define():
     has a list of values for each event, the result of the expression will only
     contain a single value per event.
 
+    A reducing expression can also take several elements of each list at once,
+    given as a list of indices or as a slice such as ``"0:3"``.  This creates one
+    variable per index, named by formatting the variable name with the index if
+    it contains ``{}``, or else by appending ``_<index>`` to it.
+
     Parameters:
       variables (list[dictionary]):  A list of single-length dictionaries whose
           key is the name of the resulting variable, and whose value is the
@@ -54,6 +59,7 @@ class Define():
           - Muon_is_good: (Muon_iso > 0.3) & (Muon_pt > 10)
           - NGoodMuons: {reduce: count_nonzero, formula: Muon_is_good}
           - First_Muon_pt: {reduce: 0, formula: Muon_pt}
+          - Muon{}_pt: {reduce: [0, 1, 2], formula: Muon_pt}
 
     See Also:
       * :mod:`fast_carpenter.define.reductions`-- for how reductions are handled and exactly what is valid.
@@ -65,15 +71,43 @@ class Define():
     def __init__(self, name, out_dir, variables):
         self.name = name
         self.out_dir = out_dir
-        self._variables = _build_calculations(name, variables, approach="awkward")
+        self._variables = [_compile_calculation(calc)
+                           for calc in _build_calculations(name, variables, approach="awkward")]
 
     def event(self, chunk):
-        for output, expression, reduction, fill_missing, mask in self._variables:
-            result = full_evaluate(chunk.tree, expression, fill_missing,
-                                   mask=mask, reduction=reduction)
-            chunk.tree.new_variable(output, result)
+        for group in _element_wise_groups(self._variables):
+            # element-wise variables that do not use each other share the flattening of their inputs
+            results = evaluate_flat_together(chunk.tree, [calc.expression for calc in group]) \
+                if len(group) > 1 else [None]
+            for (output, expression, reduction, fill_missing, mask), result in zip(group, results):
+                if result is None:
+                    result = full_evaluate(chunk.tree, expression, fill_missing,
+                                           mask=mask, reduction=reduction)
+                if isinstance(output, tuple):
+                    for name, column in zip(output, result):
+                        chunk.tree.new_variable(name, column)
+                    continue
+                chunk.tree.new_variable(output, result)
         return True
 
+    def branch_usage(self):
+        expressions = [expression for calc in self._variables for expression in (calc.expression, calc.mask)
+                       if expression]
+        names = [name for calc in self._variables
+                 for name in (calc.name if isinstance(calc.name, tuple) else (calc.name,))]
+        return expressions, names
+
+    def rewrite_expressions(self, substitutions):
+        self._variables = [_compile_calculation(calc._replace(
+            expression=substitutions.get(calc.expression, calc.expression),
+            mask=substitutions.get(calc.mask, calc.mask) if calc.mask else calc.mask,
+        )) for calc in self._variables]
+
+    def rename_outputs(self, renames):
+        self._variables = [calc._replace(name=tuple(renames.get(name, name) for name in calc.name)
+                                         if isinstance(calc.name, tuple) else renames.get(calc.name, calc.name))
+                           for calc in self._variables]
+
 
 class DefinePandas():
 
@@ -134,11 +168,46 @@ def _build_one_calc(stage_name, name, config, approach):
             reduction = get_pandas_reduction(stage_name, config["reduce"])
         else:
             reduction = get_awkward_reduction(stage_name, config["reduce"])
+            indices = get_indices(config["reduce"])
+            if indices is not None:
+                name = _indexed_names(name, indices)
     mask = config.get("mask", mask)
     fill_missing = config.get("fill_missing", fill_missing)
     return CalculationCfg(name, config["formula"], reduction, fill_missing, mask)
 
 
+def _indexed_names(name, indices):
+    if "{}" in name:
+        return tuple(name.format(index) for index in indices)
+    return tuple("{}_{}".format(name, index) for index in indices)
+
+
+def _compile_calculation(calc):
+    mask = compile_expression(calc.mask) if calc.mask else calc.mask
+    return calc._replace(expression=compile_expression(calc.expression), mask=mask)
+
+
+def _element_wise_groups(calculations):
+    """
+    Splits the calculations into runs of consecutive element-wise ones (without
+    a reduction or mask) where none uses a variable defined by another.  Every
+    other calculation is a group on its own.
+    """
+    group, defined = [], set()
+    for calc in calculations:
+        element_wise = not calc.reduction and not calc.mask
+        if group and (not element_wise or defined.intersection(calc.expression.branches)):
+            yield group
+            group, defined = [], set()
+        if not element_wise:
+            yield [calc]
+            continue
+        group.append(calc)
+        defined.add(calc.name)
+    if group:
+        yield group
+
+
 def full_evaluate(tree, expression, fill_missing, mask=None, reduction=None):
     result = evaluate(tree, expression)
     if mask:
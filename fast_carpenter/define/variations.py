@@ -0,0 +1,248 @@
+"""
+Shape systematics: input branches with varied ("up", "down", ...) versions.
+
+Rather than duplicating the whole processing sequence for each variation, a
+:class:`ShapeVariations` stage declares which branches are varied, and
+:func:`expand_shape_variations` then adds copies of only those later stages
+that depend on a varied branch.  Variables of the nominal pass that do not
+depend on it are reused as they are.
+
+Once a copied stage is a :class:`~fast_carpenter.CutFlow`, the events seen by
+the variation differ from the nominal ones, so every stage from there on is
+copied.  These copies run in a block of their own, between a
+:class:`BeginVariation` stage that saves the current event mask and an
+:class:`EndVariation` stage that restores it for the nominal pass.
+
+Copied stages are named ``<stage>__<label>``, where the label is
+``<declaring stage>_<variation>``, and so are the variables they define.
+Stages take part by providing ``branch_usage()`` and
+``rewrite_expressions(substitutions)`` (see :mod:`fast_carpenter.subexpressions`),
+and ``rename_outputs(renames)`` if they define variables.
+"""
+import logging
+import re
+from copy import deepcopy
+
+import six
+
+from ..selection.stage import CutFlow, SelectPhaseSpace
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["ShapeVariations", "BeginVariation", "EndVariation", "expand_shape_variations"]
+
+variable_re = re.compile(r"(?<![\w.])[A-Za-z_]\w*(?:\.\w+)*")
+
+
+class BadShapeVariationsConfig(Exception):
+    pass
+
+
+class ShapeVariations():
+    """Declares input branches that have varied versions, e.g. for an energy scale.
+
+    For each variation, later stages that depend on the varied branches are
+    repeated with the varied branches in their place, while everything else is
+    taken from the nominal pass.  Each repeated stage is named, and writes its
+    outputs, as ``<stage>__<label>`` where the label is the name of this stage
+    and the variation joined by an underscore.  Variables defined by repeated
+    stages are renamed in the same way.
+
+    After a repeated :class:`~fast_carpenter.CutFlow` the variation selects
+    different events to the nominal pass, so all stages from there on are
+    repeated for the variation, before the nominal ``CutFlow`` is applied.
+
+    Parameters:
+      branches (dictionary[str, dictionary]):  The varied branches.  The keys
+          are the nominal branches, and each value is a dictionary giving for
+          each variation (e.g. ``up`` or ``down``) the branch to use instead.
+
+    Other Parameters:
+      name (str):  The name of this stage (handled automatically by fast-flow)
+      out_dir (str):  Where to put the summary table (handled automatically by
+          fast-flow)
+
+    Example:
+      ::
+
+        jet_energy_scale:
+          branches:
+            Jet_Pt: {up: Jet_Pt_JESUp, down: Jet_Pt_JESDown}
+            Jet_E: {up: Jet_E_JESUp, down: Jet_E_JESDown}
+
+      A ``Define`` stage computing ``HT`` from ``Jet_Pt`` is then followed by
+      ones computing ``HT__jet_energy_scale_up`` and ``HT__jet_energy_scale_down``.
+
+    See Also:
+      :func:`expand_shape_variations`: which adds the repeated stages to the sequence.
+    """
+
+    def __init__(self, name, out_dir, branches):
+        self.name = name
+        self.out_dir = out_dir
+        self.variations = _build_variations(name, branches)
+
+    def event(self, chunk):
+        return True
+
+    def branch_usage(self):
+        return [], []
+
+
+def _build_variations(stage_name, branches):
+    if not isinstance(branches, dict) or not branches:
+        msg = "{}: branches should be a dictionary of varied branches, not '{}'"
+        raise BadShapeVariationsConfig(msg.format(stage_name, branches))
+    variations = {}
+    for nominal, varied in branches.items():
+        if not isinstance(varied, dict) or not varied:
+            msg = "{}: variations of '{}' should be a dictionary of variation names to branches, not '{}'"
+            raise BadShapeVariationsConfig(msg.format(stage_name, nominal, varied))
+        for variation, branch in varied.items():
+            if not isinstance(branch, six.string_types):
+                msg = "{}: variation '{}' of '{}' should be the name of a branch, not '{}'"
+                raise BadShapeVariationsConfig(msg.format(stage_name, variation, nominal, branch))
+            variations.setdefault("{}_{}".format(stage_name, variation), {})[nominal] = branch
+    return variations
+
+
+class BeginVariation():
+    """
+    Saves the event mask before the stages repeated for a variation change it.
+    """
+
+    subexpression_barrier = True
+
+    def __init__(self, name, out_dir):
+        self.name = name
+        self.out_dir = out_dir
+
+    def event(self, chunk):
+        chunk.tree.push_mask()
+        return True
+
+    def branch_usage(self):
+        return [], []
+
+
+class EndVariation():
+    """
+    Restores the event mask saved by the matching :class:`BeginVariation`.
+    """
+
+    subexpression_barrier = True
+
+    def __init__(self, name, out_dir):
+        self.name = name
+        self.out_dir = out_dir
+
+    def event(self, chunk):
+        chunk.tree.pop_mask()
+        return True
+
+    def branch_usage(self):
+        return [], []
+
+
+def rename_variables(expression, renames):
+    """ Replaces each variable of an expression that is a key of ``renames`` with its value. """
+    return variable_re.sub(lambda match: renames.get(match.group(0), match.group(0)), str(expression))
+
+
+def _takes_part(stage):
+    if not hasattr(stage, "branch_usage") or not hasattr(stage, "rewrite_expressions"):
+        return False
+    _, defined = stage.branch_usage()
+    return not defined or hasattr(stage, "rename_outputs")
+
+
+def _applies_mask(stage):
+    return isinstance(stage, CutFlow) and not isinstance(stage, SelectPhaseSpace)
+
+
+def _vary_stage(stage, label, renames):
+    """ Copies a stage, using the renamed variables and renaming the variables it defines. """
+    varied = deepcopy(stage)
+    varied.name = "{}__{}".format(stage.name, label)
+    expressions, defined = stage.branch_usage()
+    renames.update({name: "{}__{}".format(name, label) for name in defined})
+    substitutions = {}
+    for expression in expressions:
+        renamed = rename_variables(expression, renames)
+        if renamed != str(expression):
+            substitutions[expression] = renamed
+    if substitutions:
+        varied.rewrite_expressions(substitutions)
+    if defined:
+        varied.rename_outputs(renames)
+    return varied
+
+
+def _depends_on(stage, renames):
+    expressions, _ = stage.branch_usage()
+    return any(name in renames for expression in expressions for name in variable_re.findall(str(expression)))
+
+
+def _plan_variation(sequence, start, label, branches):
+    """
+    Works out the stages to add for one variation declared at position ``start``.
+
+    Returns a dictionary of the stages to add after each stage of the sequence,
+    and the position of the stage before which the remaining stages are
+    repeated (or None) together with those stages.
+    """
+    renames = dict(branches)
+    after = {}
+    for index in range(start + 1, len(sequence)):
+        stage = sequence[index]
+        if not _takes_part(stage) or not _depends_on(stage, renames):
+            continue
+        if _applies_mask(stage):
+            break
+        after[index] = [_vary_stage(stage, label, renames)]
+    else:
+        return after, None, []
+
+    repeated = [BeginVariation("{}__begin_{}".format(stage.name, label), stage.out_dir)]
+    for later in sequence[index:]:
+        if isinstance(later, ShapeVariations):
+            continue
+        if not _takes_part(later):
+            logger.warning(f"Stage {later.name} cannot be repeated for the variation {label}")
+            continue
+        repeated.append(_vary_stage(later, label, renames))
+    repeated.append(EndVariation("{}__end_{}".format(stage.name, label), stage.out_dir))
+    return after, index, repeated
+
+
+def expand_shape_variations(sequence):
+    """
+    Adds the stages needed for the shape variations declared in a sequence.
+
+    Each :class:`ShapeVariations` stage is replaced by copies of the later
+    stages that depend on the varied branches.  Stages without ``branch_usage``
+    and ``rewrite_expressions`` methods (or ``rename_outputs`` if they define
+    variables) are never repeated.
+
+    Returns the new sequence.
+    """
+    sequence = list(sequence)
+    before, after = {}, {}
+    for start, declaration in enumerate(sequence):
+        if not isinstance(declaration, ShapeVariations):
+            continue
+        for label, branches in declaration.variations.items():
+            stages_after, fork, repeated = _plan_variation(sequence, start, label, branches)
+            for index, stages in stages_after.items():
+                after.setdefault(index, []).extend(stages)
+            if fork is not None:
+                before.setdefault(fork, []).extend(repeated)
+
+    new_sequence = []
+    for index, stage in enumerate(sequence):
+        if isinstance(stage, ShapeVariations):
+            continue
+        new_sequence.extend(before.get(index, []))
+        new_sequence.append(stage)
+        new_sequence.extend(after.get(index, []))
+    return new_sequence
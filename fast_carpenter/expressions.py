@@ -4,15 +4,19 @@ import tokenize
 import awkward0
 import awkward as ak
 import logging
+import numexpr
+import weakref
 
+from cachetools import LRUCache
+from collections.abc import Mapping
 from io import StringIO
 
-from typing import List
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 
 logger = logging.getLogger(__name__)
 
 
-__all__ = ["get_branches", "evaluate"]
+__all__ = ["get_branches", "evaluate", "evaluate_flat_together", "compile_expression", "CompiledExpression"]
 
 
 constants = {"nan": np.nan,
@@ -128,6 +132,174 @@ class TreeToDictAdaptor():
         return result
 
 
+# memory budget (in bytes) for the flattened inputs and broadcasts kept for one block
+DEFAULT_FLATTENED_CACHE_SIZE = 256 * 1024 ** 2
+
+
+class IdentityCache(LRUCache):
+    """
+    Memoizes values computed from arrays, keyed by the identity of those arrays,
+    and bounded by the number of bytes the values hold.
+
+    An entry is dropped as soon as one of its arrays is garbage collected, e.g.
+    once a branch leaves the branch cache of its tree.  Each tree adapter holds
+    its own cache (see ``TreeToDictAdaptor.flattened_cache``).
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_FLATTENED_CACHE_SIZE) -> None:
+        super().__init__(maxsize=maxsize, getsizeof=IdentityCache.nbytes)
+
+    @staticmethod
+    def nbytes(entry: Tuple[Any, Any]) -> int:
+        value = entry[1]
+        values = value if isinstance(value, tuple) else (value,)
+        return sum(getattr(array, "nbytes", 0) for array in values)
+
+    def memoize(self, arrays: Sequence[Any], compute: Callable[[], Any]) -> Any:
+        """ Returns the value computed from the arrays, computing it if it is not held yet. """
+        key = tuple(id(array) for array in arrays)
+        entry = super().get(key)
+        if entry is not None and all(ref() is array for ref, array in zip(entry[0], arrays)):
+            return entry[1]
+        value = compute()
+        drop = self._dropper(key)
+        try:
+            self[key] = (tuple(weakref.ref(array, drop) for array in arrays), value)
+        except ValueError:
+            logger.debug(f"Not caching a value of {self.nbytes((None, value))} bytes, larger than the whole cache")
+        return value
+
+    def _dropper(self, key: Tuple[int, ...]) -> Callable[[Any], None]:
+        cache = weakref.ref(self)
+
+        def drop(_):
+            if cache() is not None:
+                cache().pop(key, None)
+        return drop
+
+
+_option_types = (ak.layout.ByteMaskedArray, ak.layout.BitMaskedArray, ak.layout.UnmaskedArray,
+                 ak.layout.IndexedOptionArray32, ak.layout.IndexedOptionArray64)
+_list_types = (ak.layout.ListArray32, ak.layout.ListArray64, ak.layout.ListArrayU32,
+               ak.layout.ListOffsetArray32, ak.layout.ListOffsetArray64, ak.layout.ListOffsetArrayU32)
+
+Flattened = Tuple[Optional[np.ndarray], Optional[np.ndarray], np.ndarray]
+
+
+def _flatten(array: Any) -> Optional[Flattened]:
+    layout = ak.to_layout(array, allow_record=False, allow_other=True)
+    if not isinstance(layout, ak.layout.Content):
+        return None
+    valid = None
+    if isinstance(layout, _option_types):
+        valid = ~ak.to_numpy(ak.is_none(ak.Array(layout)))
+        layout = layout.project()
+    offsets = None
+    if isinstance(layout, _list_types):
+        if layout.parameter("__array__") in ("string", "bytestring"):
+            return None
+        layout = layout.toListOffsetArray64(True)
+        offsets = np.asarray(layout.offsets)
+        layout = layout.content[:offsets[-1]]
+    if not isinstance(layout, ak.layout.NumpyArray) or layout.ndim != 1:
+        return None
+    return valid, offsets, np.asarray(layout)
+
+
+def flatten(array: Any, cache: Optional[IdentityCache] = None) -> Optional[Flattened]:
+    """
+    Splits an array of numbers, or of lists of numbers, into the mask of the
+    entries that are not missing (or None), the list offsets (or None) and the
+    flat contents.  Returns None for any other type of array.
+
+    If a cache is given, the result is kept there for as long as the array is alive.
+    """
+    if isinstance(array, np.ndarray) and array.ndim == 1 and array.dtype != object:
+        return None, None, array
+    if cache is None:
+        return _flatten(array)
+    return cache.memoize([array], lambda: _flatten(array))
+
+
+def broadcast_contents(contents: np.ndarray, offsets: np.ndarray,
+                       cache: Optional[IdentityCache] = None) -> np.ndarray:
+    """ Repeats one value per entry for each element of the entry's list, cached like :func:`flatten`. """
+    if cache is None:
+        return np.repeat(contents, np.diff(offsets))
+    return cache.memoize([contents, offsets], lambda: np.repeat(contents, np.diff(offsets)))
+
+
+def _flatten_arguments(arguments: List[Any], cache: Optional[IdentityCache] = None
+                       ) -> Optional[Dict[int, Flattened]]:
+    """ Flattens each array among the arguments, or returns None if one of them cannot be. """
+    flat_inputs = {}
+    for i, argument in enumerate(arguments):
+        if isinstance(argument, (ak.Array, np.ndarray)):
+            flat_inputs[i] = flatten(argument, cache)
+            if flat_inputs[i] is None:
+                return None
+    return flat_inputs
+
+
+def _same(lhs: Optional[np.ndarray], rhs: Optional[np.ndarray]) -> bool:
+    if lhs is None or rhs is None:
+        return lhs is rhs
+    return lhs is rhs or np.array_equal(lhs, rhs)
+
+
+def _common_structure(flat_inputs: Iterable[Flattened]) -> Optional[Tuple[Optional[np.ndarray], Optional[np.ndarray]]]:
+    """
+    Returns the mask of missing entries and the offsets shared by flattened
+    inputs, where inputs without lists are broadcast to the offsets of the others,
+    or None if the inputs do not share them.
+    """
+    flat_inputs = list(flat_inputs)
+    valid = next((inp[0] for inp in flat_inputs if inp[0] is not None), None)
+    offsets = next((inp[1] for inp in flat_inputs if inp[1] is not None), None)
+    for inp_valid, inp_offsets, _ in flat_inputs:
+        if not _same(inp_valid, valid):
+            return None
+        if inp_offsets is not None and not _same(inp_offsets, offsets):
+            return None
+    return valid, offsets
+
+
+def _flat_arguments(arguments: List[Any], flat_inputs: Dict[int, Flattened], offsets: Optional[np.ndarray],
+                    cache: Optional[IdentityCache] = None) -> List[Any]:
+    inputs = list(arguments)
+    for i, (_, inp_offsets, contents) in flat_inputs.items():
+        if offsets is not None and inp_offsets is None:
+            contents = broadcast_contents(contents, offsets, cache)
+        inputs[i] = contents
+    return inputs
+
+
+class FlatStructure(object):
+    """
+    The list offsets and missing entries shared by several flat results, which
+    turns each of them back into an array with that structure.
+    """
+
+    def __init__(self, valid: Optional[np.ndarray], offsets: Optional[np.ndarray]) -> None:
+        self.valid = valid
+        self.offsets = offsets
+        self._positions = None
+        if valid is not None:
+            self._positions = np.full(len(valid), -1, dtype=np.int64)
+            self._positions[valid] = np.arange(np.count_nonzero(valid))
+
+    def matches(self, valid: Optional[np.ndarray], offsets: Optional[np.ndarray]) -> bool:
+        return _same(valid, self.valid) and _same(offsets, self.offsets)
+
+    def wrap(self, contents: np.ndarray) -> ak.Array:
+        result = ak.layout.NumpyArray(contents)
+        if self.offsets is not None:
+            result = ak.layout.ListOffsetArray64(ak.layout.Index64(self.offsets), result)
+        if self._positions is not None:
+            result = ak.layout.IndexedOptionArray64(ak.layout.Index64(self._positions), result)
+        return ak.Array(result)
+
+
 attribute_re = re.compile(r"([a-zA-Z]\w*)\s*(\.\s*(\w+))+")
 
 
@@ -143,6 +315,171 @@ def preprocess_expression(expression):
     return clean_expr, alias_dict
 
 
+_numexpr_context = numexpr.necompiler.getContext({})
+
+
+class CompiledExpression(str):
+    """
+    An expression that is parsed once and can then be evaluated for every chunk of data.
+
+    It is still the original expression string, but also holds the cleaned expression (see
+    :func:`preprocess_expression`), the names of the variables it requires and the numexpr
+    programs compiled for each combination of input types seen so far.
+    """
+
+    def __init__(self, expression: str) -> None:
+        self.expression = str(expression)
+        self.cleaned, self.aliases = preprocess_expression(self.expression)
+        self.names, self._uses_vml = numexpr.necompiler.getExprNames(self.cleaned, _numexpr_context)
+        self.branches = [self.aliases.get(name, name) for name in self.names if name not in constants]
+        self._programs: Dict[tuple, Any] = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # numexpr programs cannot be pickled, they are simply recompiled when needed
+        state = self.__dict__.copy()
+        state["_programs"] = {}
+        return state
+
+    def program(self, signature: tuple) -> Any:
+        """ Returns the numexpr program for the given (name, type) signature, compiling it if needed. """
+        program = self._programs.get(signature)
+        if program is None:
+            program = numexpr.NumExpr(self.cleaned, signature, **_numexpr_context)
+            self._programs[signature] = program
+        return program
+
+    def _run(self, inputs: List[Any]) -> np.ndarray:
+        arguments = [np.asarray(x) for x in inputs]
+        signature = tuple((name, numexpr.necompiler.getType(arg)) for name, arg in zip(self.names, arguments))
+        program = self.program(signature)
+        with numexpr.necompiler.evaluate_lock:
+            return program(*arguments, order="K", casting="safe", ex_uses_vml=self._uses_vml)
+
+    @staticmethod
+    def _get_argument(tree, name):
+        try:
+            return tree[name]
+        except KeyError:
+            return constants[name]
+
+    def _evaluate_flat(self, arguments: List[Any], cache: Optional[IdentityCache] = None) -> Optional[ak.Array]:
+        """
+        Evaluates the expression directly on the flat contents of its inputs, if
+        they are all numbers or lists of numbers with the same offsets.
+        """
+        flat_inputs = _flatten_arguments(arguments, cache)
+        structure = _common_structure(flat_inputs.values()) if flat_inputs else None
+        if structure is None:
+            return None
+        valid, offsets = structure
+        return FlatStructure(valid, offsets).wrap(self._run(_flat_arguments(arguments, flat_inputs, offsets, cache)))
+
+    def evaluate_constant(self) -> np.generic:
+        """ Returns the value of an expression that does not use any variables, such as ``"1.025"``. """
+        if self.branches:
+            raise ValueError(f"'{self.expression}' is not constant, it uses {self.branches}")
+        return self._run([constants[name] for name in self.names])[()]
+
+    @staticmethod
+    def _length(tree) -> int:
+        if not isinstance(tree, Mapping):
+            return len(tree)
+        for column in tree.values():
+            return len(column)
+        raise ValueError("Cannot work out how many entries to broadcast a constant expression to")
+
+    def evaluate(self, tree) -> ak.Array:
+        """
+        Evaluates the expression using the tree as the namespace, broadcasting jagged inputs.
+
+        An expression without any variables, such as ``"1.025"``, gives its value for each entry of the tree.
+        """
+        if not self.branches:
+            return ak.Array(np.full(self._length(tree), self.evaluate_constant()))
+        arguments = [self._get_argument(tree, name) for name in self.names]
+        result = self._evaluate_flat(arguments, getattr(tree, "flattened_cache", None))
+        if result is not None:
+            return result
+
+        return broadcast_and_apply(arguments, self._run)
+
+
+def broadcast_and_apply(arguments: List[Any], function: Callable[[List[Any]], np.ndarray]) -> ak.Array:
+    """
+    Broadcasts the (possibly jagged) arrays among the arguments against each
+    other, and calls ``function`` with the flat numpy contents they broadcast to
+    (and the other arguments as they are), re-wrapping the result in the common structure.
+
+    This is the only place that uses awkward's private broadcasting machinery
+    (``ak._util``), which the awkward 1.x series pinned in ``setup.py`` provides.
+    """
+    arrays = [ak.to_layout(argument, allow_record=True, allow_other=True) for argument in arguments]
+
+    def getfunction(inputs):
+        if all(isinstance(x, ak.layout.NumpyArray) or not isinstance(x, ak.layout.Content) for x in inputs):
+            return lambda: (ak.layout.NumpyArray(function(inputs)),)
+        return None
+
+    behavior = ak._util.behaviorof(*arrays)
+    out = ak._util.broadcast_and_apply(arrays, getfunction, behavior, allow_records=False, pass_depth=False)
+    return ak._util.wrap(out[0], behavior)
+
+
+# the most expressions kept compiled at once
+MAX_COMPILED_EXPRESSIONS = 1024
+_compiled_expressions: LRUCache = LRUCache(MAX_COMPILED_EXPRESSIONS)
+
+
+def compile_expression(expression: Union[str, CompiledExpression]) -> CompiledExpression:
+    """ Returns the compiled form of an expression, re-using recently compiled expressions. """
+    if isinstance(expression, CompiledExpression):
+        return expression
+    compiled = _compiled_expressions.get(expression)
+    if compiled is None:
+        compiled = CompiledExpression(expression)
+        _compiled_expressions[expression] = compiled
+    return compiled
+
+
 def evaluate(tree, expression):
-    cleaned_expression, _ = preprocess_expression(expression)
-    return tree.evaluate(cleaned_expression, global_dict=constants)
+    return compile_expression(expression).evaluate(tree)
+
+
+def evaluate_flat_together(tree, expressions: Sequence[CompiledExpression]) -> List[Optional[ak.Array]]:
+    """
+    Evaluates several expressions on the flat contents of their inputs, like
+    :meth:`CompiledExpression.evaluate`, but looking up and flattening each
+    input once for all expressions, and re-using the offsets and mask of
+    missing entries between the results that share them.
+
+    Returns a result per expression, or None for those that need the general
+    evaluation (e.g. constant expressions, or inputs with different offsets).
+    """
+    cache = getattr(tree, "flattened_cache", None)
+    arguments, flattened = {}, {}
+    structures = []
+    results = []
+    for expression in expressions:
+        if not expression.branches:
+            results.append(None)
+            continue
+        for name in expression.names:
+            if name not in arguments:
+                arguments[name] = CompiledExpression._get_argument(tree, name)
+                # a single flattened input, none for a constant, or None if it cannot be flattened
+                flattened[name] = _flatten_arguments([arguments[name]], cache)
+        if any(flattened[name] is None for name in expression.names):
+            results.append(None)
+            continue
+        flat_inputs = {i: flattened[name][0] for i, name in enumerate(expression.names) if flattened[name]}
+        structure = _common_structure(flat_inputs.values()) if flat_inputs else None
+        if structure is None:
+            results.append(None)
+            continue
+        shared = next((known for known in structures if known.matches(*structure)), None)
+        if shared is None:
+            shared = FlatStructure(*structure)
+            structures.append(shared)
+        inputs = _flat_arguments([arguments[name] for name in expression.names], flat_inputs, shared.offsets, cache)
+        results.append(shared.wrap(expression._run(inputs)))
+    return results
@@ -0,0 +1,94 @@
+"""
+Event masks stored as packed bitsets, one bit per event, which take an eighth
+of the memory of a boolean array and can be combined a byte at a time.
+"""
+from typing import Any
+
+import awkward as ak
+import numpy as np
+
+# number of set bits in each possible byte
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class PackedMask(object):
+    """
+    A boolean mask over ``length`` events, packed into bytes with ``np.packbits``.
+
+    Missing values, e.g. from an option-type awkward array, are taken to be ``False``.
+    """
+    __slots__ = ("bits", "length")
+
+    def __init__(self, bits: np.ndarray, length: int) -> None:
+        if len(bits) != (length + 7) // 8:
+            raise ValueError(f"{len(bits)} bytes cannot hold a mask over {length} entries")
+        self.bits = bits
+        self.length = length
+
+    @classmethod
+    def from_bool(cls, mask: Any) -> "PackedMask":
+        if isinstance(mask, PackedMask):
+            return mask
+        if isinstance(mask, ak.Array):
+            mask = ak.to_numpy(ak.fill_none(mask, False))
+        mask = np.asarray(mask, dtype=bool)
+        return cls(np.packbits(mask), len(mask))
+
+    @classmethod
+    def ones(cls, length: int) -> "PackedMask":
+        bits = np.full((length + 7) // 8, 0xFF, dtype=np.uint8)
+        return cls(bits, length)._clear_padding()
+
+    def to_bool(self) -> np.ndarray:
+        return np.unpackbits(self.bits, count=self.length).astype(bool)
+
+    def __array__(self, dtype=None):
+        mask = self.to_bool()
+        return mask if dtype is None else mask.astype(dtype)
+
+    def __len__(self) -> int:
+        return self.length
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes
+
+    def count_nonzero(self) -> int:
+        return int(_POPCOUNT[self.bits].sum(dtype=np.int64))
+
+    def _other_bits(self, other: Any) -> np.ndarray:
+        other = PackedMask.from_bool(other)
+        if other.length != self.length:
+            raise ValueError(f"Cannot combine masks of length {self.length} and {other.length}")
+        return other.bits
+
+    def _clear_padding(self) -> "PackedMask":
+        spare = 8 * len(self.bits) - self.length
+        if spare:
+            self.bits[-1] &= np.uint8((0xFF << spare) & 0xFF)
+        return self
+
+    def __and__(self, other: Any) -> "PackedMask":
+        return PackedMask(self.bits & self._other_bits(other), self.length)
+
+    def __or__(self, other: Any) -> "PackedMask":
+        return PackedMask(self.bits | self._other_bits(other), self.length)
+
+    def __invert__(self) -> "PackedMask":
+        return PackedMask(~self.bits, self.length)._clear_padding()
+
+    def __iand__(self, other: Any) -> "PackedMask":
+        np.bitwise_and(self.bits, self._other_bits(other), out=self.bits)
+        return self
+
+    def __ior__(self, other: Any) -> "PackedMask":
+        np.bitwise_or(self.bits, self._other_bits(other), out=self.bits)
+        return self
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, PackedMask):
+            return NotImplemented
+        return self.length == other.length and np.array_equal(self.bits, other.bits)
+
+    def __repr__(self) -> str:
+        return f"PackedMask(length={self.length}, selected={self.count_nonzero()})"
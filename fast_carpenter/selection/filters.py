@@ -1,12 +1,15 @@
 import six
+import time
+from copy import deepcopy
 from typing import List, Tuple
 
 import numpy as np
 import pandas as pd
-from ..expressions import evaluate
-from ..define.reductions import get_awkward_reduction
-from ..tree_adapter import ArrayMethods
-from ..weights import extract_weights, get_unweighted_increment, get_weighted_increment
+from ..expressions import compile_expression, evaluate
+from ..define.reductions import JaggedNths, get_awkward_reduction
+from ..masks import PackedMask
+from ..tree_adapter import ArrayMethods, EntrySubset
+from ..weights import extract_weights
 
 
 def safe_and(left, right):
@@ -29,31 +32,34 @@ class Counter():
     _weight_names: List[str]
     _w_counts: np.ndarray
     _counts: int
+    _available: bool
 
     def __init__(self, weight_names: List[str]) -> None:
         self._weight_names = weight_names
         self._w_counts = np.zeros(len(weight_names))
         self._counts = 0
+        self._available = True
+
+    def mark_unavailable(self) -> None:
+        """ From now on the counts cannot be trusted, and are reported as NaN. """
+        self._available = False
 
-    # TODO: increment should take weights, not data
     def increment(self, data, is_mc, mask=None):
-        weights = extract_weights(data, self._weight_names)
+        increments = CounterIncrements(data, self._weight_names, is_mc)
+        increments.add(self, mask)
+        increments.fill()
 
-        try:
-            unweighted_increment = get_unweighted_increment(weights, mask)
-        except ValueError:
-            unweighted_increment = len(data)
+    def add_increment(self, unweighted_increment, weighted_increments=None):
         self._counts += unweighted_increment
-
-        if not self._weight_names or not is_mc:
+        if weighted_increments is None:
             self._w_counts += unweighted_increment
             return
-
-        weighted_increments = get_weighted_increment(weights, mask)
-        self._w_counts = ArrayMethods.sum([self._w_counts, weighted_increments], axis=0).to_numpy()
+        self._w_counts = self._w_counts + weighted_increments
 
     @property
     def counts(self) -> Tuple[int, float]:
+        if not self._available:
+            return (np.nan,) * (len(self._weight_names) + 1)
         if not self._weight_names:
             return (self._counts,)
         return (self._counts,) + tuple(self._w_counts)
@@ -61,11 +67,58 @@ class Counter():
     def add(self, rhs) -> None:
         self._w_counts = (np.sum(self._w_counts + rhs._w_counts).tolist(),)
         self._counts += rhs._counts
+        self._available = self._available and rhs._available
+
+
+class CounterIncrements():
+    """
+    Collects the masks for several counters during one pass over a block of
+    events, so that the weights are only read once and all counters are then
+    filled together, with a single matrix product of masks and weights.
+
+    Masks are held as packed bitsets and the unweighted counts come from their
+    popcount.  A mask of ``None`` selects all events, and missing values (in
+    masks or weights) count as ``False`` or zero.
+    """
+    # at most this many (mask x event) elements are multiplied in one go
+    max_block_elements = 2 ** 22
+
+    def __init__(self, data, weight_names: List[str], is_mc: bool) -> None:
+        self.n_entries = len(data)
+        self.weighted = bool(weight_names) and is_mc
+        self.weights = None
+        if self.weighted:
+            weights = extract_weights(data, weight_names)
+            columns = [ArrayMethods.fill_none(weight, 0).to_numpy() for weight in weights]
+            self.weights = np.stack(columns, axis=1).astype(np.float64)
+        self._counters = []
+        self._masks = []
+
+    def add(self, counter: Counter, mask=None) -> None:
+        if mask is None:
+            mask = PackedMask.ones(self.n_entries)
+        self._counters.append(counter)
+        self._masks.append(PackedMask.from_bool(mask))
+
+    def fill(self) -> None:
+        if not self._counters:
+            return
+        weighted = [None] * len(self._masks)
+        if self.weighted:
+            step = max(1, self.max_block_elements // max(self.n_entries, 1))
+            weighted = np.concatenate([
+                np.matmul(np.stack([mask.to_bool() for mask in self._masks[i:i + step]]).astype(np.float64),
+                          self.weights)
+                for i in range(0, len(self._masks), step)])
+        for counter, mask, total in zip(self._counters, self._masks, weighted):
+            counter.add_increment(mask.count_nonzero(), total)
+        self._counters = []
+        self._masks = []
 
 
 class BaseFilter(object):
 
-    def __init__(self, selection, depth, cut_id, weights):
+    def __init__(self, selection, depth, cut_id, weights, short_circuit=None):
         self._unique_id = ",".join(map(str, cut_id))
 
         self.selection = selection
@@ -74,6 +127,7 @@ class BaseFilter(object):
         self.totals_incl = Counter(weights)
         self.passed_incl = Counter(weights)
         self.weights = weights
+        self.short_circuit = short_circuit
 
     @property
     def index_values(self):
@@ -89,6 +143,14 @@ class BaseFilter(object):
             output += sum([sel.values for sel in self.selection], [])
         return output
 
+    @property
+    def expressions(self):
+        return sum([sel.expressions for sel in self.selection], [])
+
+    def rewrite_expressions(self, substitutions):
+        for sel in self.selection:
+            sel.rewrite_expressions(substitutions)
+
     @property
     def columns(self):
         nweights = len(self.weights) + 1
@@ -113,10 +175,33 @@ class BaseFilter(object):
                 sub_lhs.merge(sub_rhs)
         return self
 
-    def increment_counters(self, data, is_mc, excl, before, after):
-        self.passed_excl.increment(data, is_mc, excl)
-        self.passed_incl.increment(data, is_mc, after)
-        self.totals_incl.increment(data, is_mc, before)
+    def increment_counters(self, data, is_mc, excl, before, after, counters=None):
+        if counters is None:
+            counters = CounterIncrements(data, self.weights, is_mc)
+            self.increment_counters(data, is_mc, excl, before, after, counters=counters)
+            counters.fill()
+            return
+        counters.add(self.passed_excl, excl)
+        counters.add(self.passed_incl, after)
+        counters.add(self.totals_incl, before)
+
+    def mark_counts_unavailable(self):
+        self.passed_excl.mark_unavailable()
+        self.passed_incl.mark_unavailable()
+        self.totals_incl.mark_unavailable()
+
+    def _short_circuit_entries(self, sel, undecided):
+        """
+        Returns the entries a single cut still needs to be evaluated on, if
+        few enough entries are undecided, or ``None`` to evaluate it on all entries.
+        """
+        if self.short_circuit is None or not isinstance(sel, (SingleCut, ReduceSingleCut)):
+            return None
+        if not isinstance(undecided, np.ndarray):
+            undecided = ArrayMethods.fill_none(undecided, False).to_numpy()
+        if np.count_nonzero(undecided) > self.short_circuit * len(undecided):
+            return None
+        return np.flatnonzero(undecided)
 
     def __repr__(self):
         rep = ": {!r}"
@@ -135,7 +220,16 @@ class ReduceSingleCut(BaseFilter):
             selection.get("reduce"),
             fill_missing=False,
         )
-        self.formula = selection.get("formula")
+        if isinstance(self.reduction, JaggedNths):
+            raise RuntimeError(stage_name + ": A cut can only reduce to a single value per event")
+        self.formula = compile_expression(selection.get("formula"))
+
+    @property
+    def expressions(self):
+        return [self.formula]
+
+    def rewrite_expressions(self, substitutions):
+        self.formula = compile_expression(substitutions.get(self.formula, self.formula))
 
     def __call__(self, data, is_mc, **kwargs):
         mask = evaluate(data, self.formula)
@@ -147,44 +241,129 @@ class ReduceSingleCut(BaseFilter):
 
 
 class SingleCut(BaseFilter):
+    def __init__(self, selection, depth, cut_id, weights):
+        super(SingleCut, self).__init__(selection, depth, cut_id, weights)
+        self._expression = compile_expression(selection)
+
+    @property
+    def expressions(self):
+        return [self._expression]
+
+    def rewrite_expressions(self, substitutions):
+        self._expression = compile_expression(substitutions.get(self._expression, self._expression))
+
     def __call__(self, data, is_mc, **kwargs):
-        mask = evaluate(data, self.selection)
+        mask = evaluate(data, self._expression)
         return mask
 
     def __str__(self):
         return self.selection
 
 
+def _evaluate_on_entries(sel, data, is_mc, entries):
+    """
+    Evaluates a single cut on the given entries only, all other entries fail the cut.
+    """
+    result = sel(EntrySubset(data, entries), is_mc)
+    mask = np.zeros(len(data), dtype=bool)
+    mask[entries] = ArrayMethods.fill_none(result, False).to_numpy()
+    return mask
+
+
 class All(BaseFilter):
+    """
+    Passes events that pass every one of its cuts.
+
+    With ``optimize`` set to a number of blocks, and if all of its cuts are
+    single cuts, the time taken and fraction of events passing each cut is
+    measured over that many blocks.  Afterwards the cuts are evaluated in order
+    of increasing cost per rejected event, each one only on the events that
+    passed the cuts evaluated before it.  The counts of the individual cuts
+    then depend on that order rather than the declared one, so they are
+    reported as NaN from then on; the counts of the ``All`` itself are kept.
+    """
+
+    def __init__(self, selection, depth, cut_id, weights, short_circuit=None, optimize=None):
+        super(All, self).__init__(selection, depth, cut_id, weights, short_circuit=short_circuit)
+        if not all(isinstance(sel, (SingleCut, ReduceSingleCut)) for sel in selection):
+            optimize = None
+        self.optimize = optimize
+        self.evaluation_order = None
+        self._cut_times = np.zeros(len(selection))
+        self._cut_passed = np.zeros(len(selection))
+        self._measured_events = 0
+        self._measured_blocks = 0
+
     def __call__(self, data, is_mc,
-                 current_mask=None, combine_op=safe_and):
+                 current_mask=None, combine_op=safe_and, counters=None):
+        if self.evaluation_order is not None:
+            return self._call_in_evaluation_order(data, is_mc, counters)
+
         mask = np.ones(len(data), dtype=bool)
-        for sel in self.selection:
-            excl_mask = sel(data, is_mc,
-                            current_mask=combine_op(current_mask, mask),
-                            combine_op=safe_and)
+        for i, sel in enumerate(self.selection):
+            start = time.perf_counter()
+            entries = self._short_circuit_entries(sel, mask)
+            if entries is not None:
+                excl_mask = _evaluate_on_entries(sel, data, is_mc, entries)
+            else:
+                excl_mask = sel(data, is_mc,
+                                current_mask=combine_op(current_mask, mask),
+                                combine_op=safe_and, counters=counters)
+            if self.optimize:
+                self._cut_times[i] += time.perf_counter() - start
+                self._cut_passed[i] += ArrayMethods.count_nonzero(ArrayMethods.fill_none(excl_mask, False))
             new_mask = mask & excl_mask
             sel.increment_counters(data, is_mc, excl=excl_mask,
-                                   after=new_mask, before=mask)
+                                   after=new_mask, before=mask, counters=counters)
             mask = new_mask
+
+        if self.optimize:
+            self._measured_events += len(data)
+            self._measured_blocks += 1
+            if self._measured_blocks >= self.optimize:
+                self._choose_evaluation_order()
         return mask
 
+    def _choose_evaluation_order(self):
+        n_events = max(self._measured_events, 1)
+        cost = self._cut_times / n_events
+        rejection = 1 - self._cut_passed / n_events
+        self.evaluation_order = sorted(range(len(self.selection)),
+                                       key=lambda i: cost[i] / max(rejection[i], 1e-9))
+
+    def _call_in_evaluation_order(self, data, is_mc, counters):
+        n_events = len(data)
+        survivors = np.ones(n_events, dtype=bool)
+        for i in self.evaluation_order:
+            sel = self.selection[i]
+            entries = np.flatnonzero(survivors)
+            if len(entries) < n_events:
+                survivors &= _evaluate_on_entries(sel, data, is_mc, entries)
+            else:
+                survivors &= ArrayMethods.fill_none(sel(data, is_mc), False).to_numpy()
+            sel.mark_counts_unavailable()
+        return survivors
+
     def __str__(self):
         return "All"
 
 
 class Any(BaseFilter):
     def __call__(self, data, is_mc,
-                 current_mask=None, combine_op=safe_or):
+                 current_mask=None, combine_op=safe_or, counters=None):
         mask = np.zeros(len(data), dtype=bool)
         for sel in self.selection:
-            excl_mask = sel(data, is_mc,
-                            current_mask=current_mask,
-                            combine_op=combine_op)
+            entries = self._short_circuit_entries(sel, ~mask)
+            if entries is not None:
+                excl_mask = _evaluate_on_entries(sel, data, is_mc, entries)
+            else:
+                excl_mask = sel(data, is_mc,
+                                current_mask=current_mask,
+                                combine_op=combine_op, counters=counters)
             new_mask = mask | excl_mask
             sel.increment_counters(data, is_mc, excl=excl_mask,
                                    after=combine_op(new_mask, current_mask),
-                                   before=current_mask)
+                                   before=current_mask, counters=counters)
             mask = new_mask
         return mask
 
@@ -198,17 +377,28 @@ class OuterCounterIncrementer(BaseFilter):
         self._wrapped_selection = BaseFilter.__getattribute__(self, "selection")
 
     def __call__(self, data, is_mc):
-        mask = self._wrapped_selection(data, is_mc)
-        self._wrapped_selection.increment_counters(data, is_mc, excl=mask, after=mask, before=None)
+        counters = CounterIncrements(data, self.weights, is_mc)
+        mask = self._wrapped_selection(data, is_mc, counters=counters)
+        self._wrapped_selection.increment_counters(data, is_mc, excl=mask, after=mask, before=None,
+                                                   counters=counters)
+        counters.fill()
         return mask
 
     def __getattribute__(self, name):
-        if name in ["__call__", "_wrapped_selection"]:
+        if name in ["__call__", "_wrapped_selection", "__deepcopy__"]:
             return BaseFilter.__getattribute__(self, name)
         return BaseFilter.__getattribute__(self, "selection").__getattribute__(name)
 
+    def __deepcopy__(self, memo):
+        # copy the wrapper itself, rather than the selection its attributes are taken from
+        copied = object.__new__(OuterCounterIncrementer)
+        memo[id(self)] = copied
+        for key, value in BaseFilter.__getattribute__(self, "__dict__").items():
+            setattr(copied, key, deepcopy(value, memo))
+        return copied
+
 
-def build_selection(stage_name, config, weights=[]):
+def build_selection(stage_name, config, weights=[], short_circuit=None, optimize=None):
     """Creates event selectors based on the configuration.
 
     Parameters:
@@ -216,15 +406,20 @@ def build_selection(stage_name, config, weights=[]):
         config: The event selection configuration.
         weights: How to weight events, used to produce the resulting cut
             efficiency table.
+        short_circuit: If given, the fraction of events below which ``All``
+            and ``Any`` only evaluate their remaining single cuts on the events
+            whose outcome is still undecided.
+        optimize: If given, the number of blocks over which ``All`` measures
+            its cuts before evaluating them in the cheapest, most rejecting order.
 
     Raises:
         RuntimeError: if any of the configurations are invalid.
     """
-    selection = handle_config(stage_name, config, weights)
+    selection = handle_config(stage_name, config, weights, short_circuit=short_circuit, optimize=optimize)
     return OuterCounterIncrementer(selection, depth=-1, cut_id=[-1], weights=weights)
 
 
-def handle_config(stage_name, config, weights, depth=0, cut_id=[0]):
+def handle_config(stage_name, config, weights, depth=0, cut_id=[0], short_circuit=None, optimize=None):
     if isinstance(config, six.string_types):
         return SingleCut(config, depth, cut_id, weights)
     if not isinstance(config, dict):
@@ -240,9 +435,10 @@ def handle_config(stage_name, config, weights, depth=0, cut_id=[0]):
 
     selections = []
     for i, sel in enumerate(in_selections):
-        cut = handle_config(stage_name, sel, weights, depth + 1, cut_id=cut_id + [i])
+        cut = handle_config(stage_name, sel, weights, depth + 1, cut_id=cut_id + [i],
+                            short_circuit=short_circuit, optimize=optimize)
         selections.append(cut)
     if method == "All":
-        return All(selections, depth, cut_id, weights)
+        return All(selections, depth, cut_id, weights, short_circuit=short_circuit, optimize=optimize)
     if method == "Any":
-        return Any(selections, depth, cut_id, weights)
+        return Any(selections, depth, cut_id, weights, short_circuit=short_circuit)
@@ -166,6 +166,21 @@ class CutFlow(object):
           maintain the cut order, and often will not be useful in subsequent
           manipulation of the output table, so by default this is removed.
       counter (bool): Currently unused
+      short_circuit (float): Opt-in.  Once the fraction of events whose
+          outcome is still undecided (those still passing an ``All``, or not
+          yet passing an ``Any``) falls to this value or below, the remaining
+          single cuts are only evaluated on those events.  The
+          ``passed_incl`` and ``totals_incl`` columns are unchanged, but
+          ``passed_only_cut`` for such cuts then only counts the events that
+          reached them.
+      optimize (int): Opt-in.  The number of blocks over which to time each
+          cut of an ``All`` (made up of single cuts only) and measure how many
+          events pass it.  Afterwards such cuts are evaluated in order of
+          increasing cost per rejected event, each only on the events passing
+          the cuts evaluated before it.  The table keeps the declared order and
+          the row of the ``All`` itself is unchanged, but the rows of its cuts
+          are then NaN, since their counts in the declared order are no
+          longer known.
 
     Raises:
       BadCutflowConfig: If neither or both of ``selection`` and
@@ -185,7 +200,7 @@ class CutFlow(object):
 
     """
     def __init__(self, name, out_dir, selection_file=None, keep_unique_id=False,
-                 selection=None, counter=True, weights=None):
+                 selection=None, counter=True, weights=None, short_circuit=None, optimize=None):
         self.name = name
         self.out_dir = out_dir
         self.keep_unique_id = keep_unique_id
@@ -206,7 +221,14 @@ class CutFlow(object):
         if self._counter:
             self._weights = _create_weights(self.name, weights)
 
-        self.selection = build_selection(self.name, selection, weights=list(self._weights.values()))
+        if short_circuit is not None and not 0 <= short_circuit <= 1:
+            msg = "{}: short_circuit should be a fraction of events between 0 and 1, not {}"
+            raise BadCutflowConfig(msg.format(self.name, short_circuit))
+        if optimize is not None and (not isinstance(optimize, int) or optimize < 1):
+            msg = "{}: optimize should be a positive number of blocks, not {}"
+            raise BadCutflowConfig(msg.format(self.name, optimize))
+        self.selection = build_selection(self.name, selection, weights=list(self._weights.values()),
+                                         short_circuit=short_circuit, optimize=optimize)
 
     def collector(self):
         outfilename = "cuts_"
@@ -224,6 +246,15 @@ class CutFlow(object):
     def merge(self, rhs):
         self.selection.merge(rhs.selection)
 
+    def branch_usage(self):
+        return self.selection.expressions + list(self._weights.values()), []
+
+    def rewrite_expressions(self, substitutions):
+        self.selection.rewrite_expressions(substitutions)
+        self._weights = {label: substitutions.get(weight, weight) for label, weight in self._weights.items()}
+        # the selection and all of its counters share a single list of weight names
+        self.selection.weights[:] = list(self._weights.values())
+
 
 class SelectPhaseSpace(CutFlow):
     """Creates an event-mask and adds it to the data-space.
@@ -248,3 +279,10 @@ class SelectPhaseSpace(CutFlow):
         is_mc = chunk.config.dataset.eventtype == "mc"
         new_mask = self.selection(chunk.tree, is_mc)
         chunk.tree.new_variable(self.region_name, new_mask)
+
+    def branch_usage(self):
+        expressions, _ = super(SelectPhaseSpace, self).branch_usage()
+        return expressions, [self.region_name]
+
+    def rename_outputs(self, renames):
+        self.region_name = renames.get(self.region_name, self.region_name)
@@ -0,0 +1,312 @@
+"""
+Finds subexpressions that are repeated across the stages of a processing
+sequence, so that each is computed only once per block.
+
+Every shared subexpression becomes a hidden temporary variable: it is computed
+by a :class:`ComputeTemporaries` stage inserted just before the first stage
+using it, and dropped again by a :class:`FreeTemporaries` stage after the last
+one.  The expressions of the stages are rewritten to use the temporaries.
+
+Stages take part by providing ``branch_usage()`` (see
+:mod:`fast_carpenter.branch_usage`) and a ``rewrite_expressions(substitutions)``
+method, which swaps each of their expressions found in the ``substitutions``
+dictionary for its rewritten form.
+
+Stages with a true ``subexpression_barrier`` attribute, such as those
+saving and restoring the event mask around a shape variation, change the
+events seen by the stages after them.  No temporary is shared across them:
+subexpressions are only shared within the parts of the sequence in between.
+"""
+import ast
+from collections import namedtuple
+import logging
+import sys
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from .expressions import compile_expression, constants, evaluate
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["eliminate_common_subexpressions", "find_common_subexpressions",
+           "ComputeTemporaries", "FreeTemporaries", "Temporary"]
+
+temporary_prefix = "_cse_"
+
+Temporary = namedtuple("Temporary", "name expression first_stage last_stage")
+
+_candidate_nodes = (ast.BinOp, ast.UnaryOp, ast.Call, ast.Compare, ast.BoolOp)
+
+
+class ComputeTemporaries():
+    """
+    Computes temporary variables holding subexpressions shared by later stages.
+    """
+
+    def __init__(self, name, out_dir, temporaries):
+        self.name = name
+        self.out_dir = out_dir
+        self.temporaries = [(temp_name, compile_expression(expression)) for temp_name, expression in temporaries]
+
+    def event(self, chunk):
+        for temp_name, expression in self.temporaries:
+            chunk.tree.new_variable(temp_name, evaluate(chunk.tree, expression))
+        return True
+
+    def branch_usage(self):
+        return [expression for _, expression in self.temporaries], [name for name, _ in self.temporaries]
+
+
+class FreeTemporaries():
+    """
+    Drops temporary variables once no later stage needs them.
+    """
+
+    def __init__(self, name, out_dir, temporaries):
+        self.name = name
+        self.out_dir = out_dir
+        self.temporaries = list(temporaries)
+
+    def event(self, chunk):
+        for temp_name in self.temporaries:
+            chunk.tree.delete_variable(temp_name)
+        return True
+
+    def branch_usage(self):
+        return [], []
+
+
+# operator precedences, from loosest to tightest binding, as used by ast.unparse
+_OR, _AND, _NOT, _CMP, _BOR, _BXOR, _BAND, _SHIFT, _ARITH, _TERM, _FACTOR, _POWER, _ATOM = range(13)
+
+_binary_operators = {
+    ast.BitOr: ("|", _BOR), ast.BitXor: ("^", _BXOR), ast.BitAnd: ("&", _BAND),
+    ast.LShift: ("<<", _SHIFT), ast.RShift: (">>", _SHIFT),
+    ast.Add: ("+", _ARITH), ast.Sub: ("-", _ARITH),
+    ast.Mult: ("*", _TERM), ast.MatMult: ("@", _TERM), ast.Div: ("/", _TERM),
+    ast.FloorDiv: ("//", _TERM), ast.Mod: ("%", _TERM),
+    ast.Pow: ("**", _POWER),
+}
+_unary_operators = {ast.Not: ("not ", _NOT), ast.Invert: ("~", _FACTOR), ast.UAdd: ("+", _FACTOR),
+                    ast.USub: ("-", _FACTOR)}
+_comparisons = {ast.Eq: "==", ast.NotEq: "!=", ast.Lt: "<", ast.LtE: "<=", ast.Gt: ">", ast.GtE: ">=",
+                ast.Is: "is", ast.IsNot: "is not", ast.In: "in", ast.NotIn: "not in"}
+_boolean_operators = {ast.And: ("and", _AND), ast.Or: ("or", _OR)}
+
+
+def _unparse(node: ast.AST, precedence: int = _OR) -> str:
+    """
+    Writes a parsed expression back out as source, giving the same text as
+    ``ast.unparse`` (only available from Python 3.9) for the kinds of
+    expressions numexpr understands.
+
+    Raises:
+      ValueError: For any other kind of expression.
+    """
+    if isinstance(node, ast.Expression):
+        return _unparse(node.body, precedence)
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Constant):
+        return repr(node.value)
+    if sys.version_info < (3, 8) and isinstance(node, ast.Num):
+        return repr(node.n)
+    if sys.version_info < (3, 8) and isinstance(node, ast.NameConstant):
+        return repr(node.value)
+    if isinstance(node, ast.Attribute):
+        return _unparse(node.value, _ATOM) + "." + node.attr
+    if isinstance(node, ast.Call) and all(keyword.arg is not None for keyword in node.keywords):
+        arguments = [_unparse(arg) for arg in node.args]
+        arguments += [keyword.arg + "=" + _unparse(keyword.value) for keyword in node.keywords]
+        return _unparse(node.func, _ATOM) + "(" + ", ".join(arguments) + ")"
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _binary_operators:
+        symbol, own = _binary_operators[type(node.op)]
+        # powers group from the right, everything else from the left
+        left, right = (own + 1, own) if own == _POWER else (own, own + 1)
+        text = "{} {} {}".format(_unparse(node.left, left), symbol, _unparse(node.right, right))
+    elif isinstance(node, ast.UnaryOp) and type(node.op) in _unary_operators:
+        symbol, own = _unary_operators[type(node.op)]
+        text = symbol + _unparse(node.operand, own)
+    elif isinstance(node, ast.Compare) and all(type(op) in _comparisons for op in node.ops):
+        own = _CMP
+        text = _unparse(node.left, own + 1)
+        for op, comparator in zip(node.ops, node.comparators):
+            text += " {} {}".format(_comparisons[type(op)], _unparse(comparator, own + 1))
+    elif isinstance(node, ast.BoolOp) and type(node.op) in _boolean_operators:
+        symbol, own = _boolean_operators[type(node.op)]
+        # as in ast.unparse, each further operand binds a level tighter
+        text = " {} ".format(symbol).join(_unparse(value, own + 1 + i) for i, value in enumerate(node.values))
+    else:
+        raise ValueError("Cannot write out a {} expression".format(type(node).__name__))
+    return "(" + text + ")" if own < precedence else text
+
+
+def _parse(expression: str) -> Optional[ast.AST]:
+    try:
+        tree = ast.parse(str(expression), mode="eval")
+        _unparse(tree)
+    except (SyntaxError, ValueError):
+        logger.debug(f"Cannot parse expression '{expression}', it will not share subexpressions")
+        return None
+    return tree
+
+
+def _uses_variables(node: ast.AST) -> bool:
+    called = {id(child.func) for child in ast.walk(node) if isinstance(child, ast.Call)}
+    return any(isinstance(child, ast.Name) and id(child) not in called and child.id not in constants
+               for child in ast.walk(node))
+
+
+def _variables(tree: ast.AST) -> Set[str]:
+    return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+
+
+def _subexpressions(tree: ast.AST) -> List[str]:
+    return [_unparse(node) for node in ast.walk(tree)
+            if isinstance(node, _candidate_nodes) and _uses_variables(node)]
+
+
+class _Substitute(ast.NodeTransformer):
+    def __init__(self, text: str, name: str) -> None:
+        self.text = text
+        self.name = name
+
+    def generic_visit(self, node):
+        if isinstance(node, _candidate_nodes) and _unparse(node) == self.text:
+            return ast.Name(id=self.name, ctx=ast.Load())
+        return super(_Substitute, self).generic_visit(node)
+
+
+def find_common_subexpressions(steps: Sequence[Tuple[List[str], List[str]]], prefix: str = temporary_prefix
+                               ) -> Tuple[List[Temporary], List[Dict[str, str]]]:
+    """
+    Finds the subexpressions used more than once by the expressions of a sequence.
+
+    Subexpressions reading a variable that is defined by one of the stages
+    using them, or by a stage in between, are not shared.
+
+    Parameters:
+      steps: The expressions used and variables defined by each stage, as returned by ``branch_usage()``.
+      prefix: The start of the names of the temporaries.
+
+    Returns:
+      The temporaries to compute, in an order in which they can be computed,
+      and for each stage a dictionary mapping its expressions to their rewritten forms.
+    """
+    sites = []  # [stage index, original expression, parsed expression]
+    for stage, (expressions, _) in enumerate(steps):
+        for expression in expressions:
+            tree = _parse(expression)
+            if tree is not None:
+                sites.append([stage, str(expression), tree])
+    defined = [set(names) for _, names in steps]
+
+    def computable(text, stages):
+        # the temporary is computed before its first user, so nothing it reads
+        # may be defined (or redefined) by the stages from there to its last user
+        names = _variables(ast.parse(text, mode="eval"))
+        return not any(names & defined[stage] for stage in range(min(stages), max(stages) + 1))
+
+    definitions = []  # [temporary name, stages using it, parsed expression]
+    while True:
+        counts, stages = {}, {}
+        for users, tree in [([site[0]], site[2]) for site in sites] + [(d[1], d[2]) for d in definitions]:
+            for text in _subexpressions(tree):
+                counts[text] = counts.get(text, 0) + 1
+                stages.setdefault(text, set()).update(users)
+        shared = [text for text, count in counts.items() if count > 1 and computable(text, stages[text])]
+        if not shared:
+            break
+        text = max(shared, key=len)
+        name = prefix + str(len(definitions))
+        substitute = _Substitute(text, name)
+        for holder in sites + definitions:
+            holder[-1] = ast.fix_missing_locations(substitute.visit(holder[-1]))
+        definitions.append([name, stages[text], ast.parse(text, mode="eval")])
+
+    # a temporary is used by the stages, and by the temporaries built from it
+    dependencies = {name: _variables(tree) for name, _, tree in definitions}
+    depths = {}
+
+    def depth(name):
+        if name not in depths:
+            depths[name] = 1 + max([depth(dep) for dep in dependencies[name] if dep in dependencies], default=0)
+        return depths[name]
+
+    users = {name: [] for name, _, _ in definitions}
+    for stage, _, tree in sites:
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and node.id in users:
+                users[node.id].append(stage)
+    temporaries = []
+    for name, _, tree in sorted(definitions, key=lambda definition: -depth(definition[0])):
+        temporary = Temporary(name, _unparse(tree), min(users[name]), max(users[name]))
+        for dep in dependencies[name]:
+            if dep in users:
+                users[dep].append(temporary.first_stage)
+        temporaries.append(temporary)
+    temporaries.sort(key=lambda temp: (temp.first_stage, depth(temp.name)))
+
+    substitutions = [{} for _ in steps]
+    for stage, original, tree in sites:
+        rewritten = _unparse(tree)
+        if rewritten != _unparse(ast.parse(original, mode="eval")):
+            substitutions[stage][original] = rewritten
+    return temporaries, substitutions
+
+
+def eliminate_common_subexpressions(sequence: Sequence) -> List:
+    """
+    Rewrites the stages of a sequence to compute shared subexpressions only once.
+
+    Returns the new sequence, including the stages that compute and drop the
+    temporary variables.  Stages without ``branch_usage`` or
+    ``rewrite_expressions`` methods are left as they are, and subexpressions
+    are not shared across a stage with a true ``subexpression_barrier``.
+    """
+    segments = [[]]
+    for stage in sequence:
+        if getattr(stage, "subexpression_barrier", False):
+            segments.append(stage)
+            segments.append([])
+        else:
+            segments[-1].append(stage)
+
+    new_sequence = []
+    n_temporaries = 0
+    for index, segment in enumerate(segments):
+        if not isinstance(segment, list):
+            new_sequence.append(segment)
+            continue
+        prefix = temporary_prefix if index == 0 else "{}{}_".format(temporary_prefix, index // 2)
+        segment, n_shared = _eliminate_in_segment(segment, prefix)
+        new_sequence.extend(segment)
+        n_temporaries += n_shared
+    if n_temporaries:
+        logger.info(f"Sharing {n_temporaries} common subexpressions between stages")
+    return new_sequence
+
+
+def _eliminate_in_segment(sequence: List, prefix: str) -> Tuple[List, int]:
+    taking_part = [hasattr(stage, "branch_usage") and hasattr(stage, "rewrite_expressions") for stage in sequence]
+    steps = [stage.branch_usage() if part else ([], []) for stage, part in zip(sequence, taking_part)]
+    temporaries, substitutions = find_common_subexpressions(steps, prefix)
+    if not temporaries:
+        return sequence, 0
+
+    for stage, part, stage_substitutions in zip(sequence, taking_part, substitutions):
+        if part and stage_substitutions:
+            stage.rewrite_expressions(stage_substitutions)
+
+    new_sequence = []
+    for index, stage in enumerate(sequence):
+        to_compute = [(temp.name, temp.expression) for temp in temporaries if temp.first_stage == index]
+        if to_compute:
+            new_sequence.append(ComputeTemporaries("{}__temporaries".format(stage.name),
+                                                   stage.out_dir, to_compute))
+        new_sequence.append(stage)
+        to_free = [temp.name for temp in temporaries if temp.last_stage == index]
+        if to_free:
+            new_sequence.append(FreeTemporaries("{}__free_temporaries".format(stage.name),
+                                                stage.out_dir, to_free))
+    return new_sequence, len(temporaries)
@@ -1,5 +1,6 @@
 from .binned_dataframe import BinnedDataframe
 from .event_level_dataframe import EventByEventDataframe
 from .aghast import BuildAghast
+from .histogram import BuildHistogram
 
-__all__ = ["BuildAghast", "BinnedDataframe", "EventByEventDataframe"]
+__all__ = ["BuildAghast", "BinnedDataframe", "BuildHistogram", "EventByEventDataframe"]
@@ -130,5 +130,11 @@ class BuildAghast:
     def event(self, chunk):
         return self.builder.event(chunk)
 
+    def branch_usage(self):
+        return self.builder.branch_usage()
+
+    def rewrite_expressions(self, substitutions):
+        self.builder.rewrite_expressions(substitutions)
+
     def merge(self, rhs):
         self.builder.merge(rhs.builder)
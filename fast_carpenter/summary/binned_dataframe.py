@@ -3,13 +3,16 @@ Summarize the data by producing binned and possibly weighted counts of the data.
 """
 import os
 import re
+import itertools
+import awkward as ak
 import numpy as np
 import pandas as pd
-from pandas.api.types import is_object_dtype
 from . import binning_config as cfg
-
+from .import_pyarrow import has_pyarrow
 from fast_carpenter.tree_adapter import ArrayMethods
 
+from fast_carpenter.expressions import compile_expression
+
 
 class Collector():
     valid_ext = {'xlsx': 'excel', 'h5': 'hdf', 'msg': 'msgpack', 'dta': 'stata', 'pkl': 'pickle', 'p': 'pickle'}
@@ -163,6 +166,11 @@ class BinnedDataframe():
         the binning specification for each dimension, all bins for that
         dimension will be present.  Use `pad_missing: true` to force all bins
         to be present.
+      engine (str): How each chunk of data is histogrammed.  Either ``pandas``
+        (the default), which uses ``pandas.cut`` and a ``groupby``, or
+        ``numpy``, which computes bin indices with ``numpy.searchsorted`` and
+        counts with ``numpy.bincount``.  Either way the results are kept in
+        fixed-size arrays and only turned into a dataframe when collected.
 
     Other Parameters:
       name (str):  The name of this stage (handled automatically by fast-flow)
@@ -175,7 +183,8 @@ class BinnedDataframe():
     """
 
     def __init__(self, name, out_dir, binning, weights=None, dataset_col=True,
-                 pad_missing=False, file_format=None, observed=False, weight_data=False):
+                 pad_missing=False, file_format=None, observed=False, weight_data=False,
+                 engine="pandas"):
         self.name = name
         self.out_dir = out_dir
         ins, outs, binnings = cfg.create_binning_list(self.name, binning)
@@ -188,9 +197,16 @@ class BinnedDataframe():
         self._pad_missing = pad_missing
         self._file_format = cfg.create_file_format(self.name, file_format)
         self._observed = observed
-        self.contents = None
+        self._engine = cfg.create_engine(self.name, engine)
+        self._accumulator = None
         self.weight_data = weight_data
 
+    @property
+    def contents(self):
+        if self._accumulator is None:
+            return None
+        return self._accumulator.to_dataframe(observed=self._observed)
+
     def collector(self):
         outfilename = "tbl_"
         if self._dataset_col:
@@ -211,31 +227,46 @@ class BinnedDataframe():
         else:
             weights = None
 
-        data = ArrayMethods.to_pandas(chunk.tree, all_inputs)
-        data = explode(data)
-        if data is None or data.empty:
+        if not all_inputs:
+            return True
+        data = _flat_columns(chunk.tree, all_inputs)
+        if len(data[all_inputs[0]]) == 0:
+            return True
+
+        if self._accumulator is None:
+            self._accumulator = BinnedAccumulator(self._out_bin_dims, self._binnings,
+                                                  weights=self._weights.keys() if weights else None)
+
+        if self._engine == "numpy":
+            values = [compile_expression(dimension).evaluate(data) for dimension in self._bin_dims]
+            self._accumulator.fill(values, [data[w] for w in weights] if weights else None)
             return True
 
-        binned_values = _bin_values(data, dimensions=self._bin_dims,
+        binned_values = _bin_values(pd.DataFrame(data), dimensions=self._bin_dims,
                                     binnings=self._binnings,
                                     weights=weights,
                                     out_weights=self._weights.keys(),
                                     out_dimensions=self._out_bin_dims,
                                     observed=self._observed)
-        if self.contents is None:
-            self.contents = binned_values
-        else:
-            self.contents = self.contents.add(binned_values, fill_value=0)
-
+        self._accumulator.fill_dataframe(binned_values)
         return True
 
+    def branch_usage(self):
+        return self._bin_dims + list(self._weights.values()), []
+
+    def rewrite_expressions(self, substitutions):
+        self._bin_dims = [substitutions.get(dim, dim) for dim in self._bin_dims]
+        self._weights = {label: substitutions.get(weight, weight) for label, weight in self._weights.items()}
+        self.potential_inputs = set(sum((re.findall(r"\w+", dim) for dim in self._bin_dims), []))
+
     def merge(self, rhs):
-        if rhs.contents is None or len(rhs.contents) == 0:
-            return
-        if self.contents is None:
-            self.contents = rhs.contents
+        if rhs._accumulator is None:
             return
-        self.contents = self.contents.add(rhs.contents, fill_value=0)
+        if self._accumulator is None:
+            # start from empty arrays, so that filling this stage later leaves rhs as it is
+            self._accumulator = BinnedAccumulator(rhs._accumulator.dimensions, rhs._accumulator.binnings,
+                                                  weights=rhs._accumulator.weights)
+        self._accumulator.add(rhs._accumulator)
 
 
 count_label = "n"
@@ -281,40 +312,191 @@ def _bin_values(data, dimensions, binnings, weights, out_dimensions=None, out_we
     return histogram
 
 
-_explodable_types = (tuple, list, np.ndarray)
+class BinnedAccumulator(object):
+    """
+    Accumulates binned counts and sums of weights in fixed-size arrays.
+
+    Dimensions with a binning (including the under- and overflow bins) define
+    the shape of these arrays, whereas categorical dimensions are kept sparse,
+    with one set of arrays per combination of their observed values.  Adding
+    another accumulator is therefore an in-place array addition, and only
+    :meth:`to_dataframe` has to build a (Multi)Index.
+    """
+
+    def __init__(self, dimensions, binnings, weights=None):
+        self.dimensions = list(dimensions)
+        self.binnings = list(binnings)
+        self.weights = list(weights) if weights else []
+        self._categorical = [i for i, binning in enumerate(self.binnings) if binning is None]
+        self._binned = [i for i, binning in enumerate(self.binnings) if binning is not None]
+        self._edges = [np.append(self.binnings[i].left, self.binnings[i].right[-1]) for i in self._binned]
+        self.shape = tuple(len(edges) - 1 for edges in self._edges)
+        self.nbins = int(np.prod(self.shape, dtype=np.int64))
+        if self.weights:
+            self.columns = _make_column_labels(self.weights)
+        else:
+            self.columns = [count_label]
+        self.sums = {}
+
+    # at most this many (entry x column) elements are filled in one go
+    max_block_elements = 2 ** 22
+
+    def fill(self, values, weights=None):
+        """
+        Add one chunk of data.
+
+        Parameters:
+          values (list): One array of values per dimension, in the order the
+            dimensions were given.
+          weights (list): One array per weight, or ``None`` to only count.
+        """
+        values = [np.asarray(value) for value in values]
+        valid = np.ones(len(values[0]), dtype=bool)
+        bin_index = np.zeros(len(values[0]), dtype=np.int64)
+        for i, edges, nbins in zip(self._binned, self._edges, self.shape):
+            index = np.searchsorted(edges, values[i], side="right") - 1
+            valid &= (index >= 0) & (index < nbins)
+            bin_index = bin_index * nbins + index
+        for i in self._categorical:
+            if values[i].dtype.kind == "f":
+                valid &= ~np.isnan(values[i])
+        bin_index = bin_index[valid]
+
+        keys, group = _unique_combinations([values[i][valid] for i in self._categorical], len(bin_index))
+        linear_index = group * self.nbins + bin_index
+        size = len(keys) * self.nbins
+
+        if self.weights:
+            weights = [np.asarray(weight, dtype=np.float64)[valid] for weight in weights]
+        ncolumns = len(self.columns)
+        sums = np.zeros(size * ncolumns)
+        step = max(1, self.max_block_elements // ncolumns)
+        for start in range(0, len(linear_index), step):
+            stop = start + step
+            # one row per entry: the count, then each weight, then each weight squared
+            matrix = np.ones((len(linear_index[start:stop]), ncolumns))
+            if self.weights:
+                nweights = len(self.weights)
+                for i, weight in enumerate(weights):
+                    matrix[:, 1 + i] = weight[start:stop]
+                np.square(matrix[:, 1:1 + nweights], out=matrix[:, 1 + nweights:])
+            # a single bincount fills all columns, each entry adding to ncolumns adjacent cells
+            cells = (linear_index[start:stop, np.newaxis] * ncolumns + np.arange(ncolumns)).ravel()
+            sums += np.bincount(cells, weights=matrix.ravel(), minlength=size * ncolumns)
+        self._add_all(keys, sums.reshape(size, ncolumns))
+
+    def fill_dataframe(self, histogram):
+        """
+        Add a chunk that has already been binned into a dataframe, as produced
+        by ``_bin_values``.
+        """
+        index = histogram.index
+        bin_index = np.zeros(len(histogram), dtype=np.int64)
+        for i, nbins in zip(self._binned, self.shape):
+            intervals = pd.IntervalIndex(index.get_level_values(self.dimensions[i]))
+            bin_index = bin_index * nbins + self.binnings[i].get_indexer(intervals)
+        categories = [np.asarray(index.get_level_values(self.dimensions[i])) for i in self._categorical]
+        keys, group = _unique_combinations(categories, len(histogram))
+
+        sums = np.zeros((len(keys) * self.nbins, len(self.columns)))
+        np.add.at(sums, group * self.nbins + bin_index, histogram[self.columns].fillna(0).values)
+        self._add_all(keys, sums)
+
+    def _add_all(self, keys, sums):
+        sums = sums.reshape(len(keys), self.nbins, len(self.columns))
+        for key, contents in zip(keys, sums):
+            self._add(key, contents)
+
+    def add(self, other):
+        for key, contents in other.sums.items():
+            self._add(key, contents)
+
+    def _add(self, key, contents):
+        if key in self.sums:
+            self.sums[key] += contents
+        else:
+            self.sums[key] = contents.copy()
+
+    def to_dataframe(self, observed=False):
+        keys = sorted(self.sums)
+        if not observed and self._categorical:
+            categories = [sorted(set(key[i] for key in keys)) for i in range(len(self._categorical))]
+            keys = list(itertools.product(*categories))
+        if not keys:
+            return None
+
+        empty = np.zeros((self.nbins, len(self.columns)))
+        sums = np.concatenate([self.sums.get(key, empty) for key in keys])
+        key_index = np.repeat(np.arange(len(keys)), self.nbins)
+        bin_indices = [np.tile(index, len(keys)) for index in np.unravel_index(np.arange(self.nbins), self.shape)]
+        if observed:
+            nonzero = sums[:, 0] > 0
+            sums = sums[nonzero]
+            key_index = key_index[nonzero]
+            bin_indices = [index[nonzero] for index in bin_indices]
+
+        levels = [None] * len(self.dimensions)
+        for i, dim in enumerate(self._categorical):
+            values = np.array([key[i] for key in keys])
+            levels[dim] = values[key_index]
+        for dim, index in zip(self._binned, bin_indices):
+            levels[dim] = pd.Categorical.from_codes(index, categories=self.binnings[dim], ordered=True)
+        if len(levels) == 1:
+            index = pd.Index(levels[0], name=self.dimensions[0])
+        else:
+            index = pd.MultiIndex.from_arrays(levels, names=self.dimensions)
+
+        histogram = pd.DataFrame(sums, index=index, columns=self.columns)
+        histogram[count_label] = histogram[count_label].astype(np.int64)
+        return histogram
 
 
-def explode(df):
+def _unique_combinations(arrays, length):
+    codes = np.zeros(length, dtype=np.int64)
+    if not arrays:
+        return [()], codes
+    uniques = []
+    for array in arrays:
+        unique, inverse = np.unique(array, return_inverse=True)
+        uniques.append(unique)
+        codes = codes * len(unique) + inverse
+    combinations, group = np.unique(codes, return_inverse=True)
+    shape = tuple(len(unique) for unique in uniques)
+    keys = zip(*(unique[index] for unique, index in zip(uniques, np.unravel_index(combinations, shape))))
+    return [tuple(key) for key in keys], group
+
+
+def flatten_arrays(arrays):
     """
-    Based on this answer:
-    https://stackoverflow.com/questions/12680754/split-explode-pandas\
-    -dataframe-string-entry-to-separate-rows/40449726#40449726
+    Broadcasts a dictionary of (possibly jagged) arrays against each other and
+    flattens them into one numpy array per key.
+
+    Entries that are masked out in any of the arrays are dropped, as are
+    entries with no objects in the jagged arrays.
     """
-    if df is None or df.empty:
-        return df
-
-    # get the list columns
-    lst_cols = [col for col, dtype in df.dtypes.items() if is_object_dtype(dtype)]
-    # Be more specific about which objects are ok
-    lst_cols = [col for col in lst_cols if isinstance(df[col].iloc[0], _explodable_types)]
-    if not lst_cols:
-        return df
-
-    # all columns except `lst_cols`
-    idx_cols = df.columns.difference(lst_cols)
-
-    # check all lists have same length
-    lens = pd.DataFrame({col: df[col].str.len() for col in lst_cols})
-    different_length = (lens.nunique(axis=1) > 1).any()
-    if different_length:
+    names = list(arrays)
+    values = [ak.Array(arrays[name]) for name in names]
+    valid = np.ones(len(values[0]), dtype=bool)
+    for value in values:
+        valid &= ~ak.to_numpy(ak.is_none(value))
+    try:
+        values = ak.broadcast_arrays(*(value[valid] for value in values))
+    except ValueError:
         raise ValueError("Cannot bin multiple arrays with different jaggedness")
-    lens = lens[lst_cols[0]]
+    return {name: ak.to_numpy(ak.flatten(value, axis=None)) for name, value in zip(names, values)}
 
-    # create "exploded" DF
-    flattened = {col: df.loc[lens > 0, col].values for col in lst_cols}
-    flattened = {col: sum(map(list, vals), []) for col, vals in flattened.items()}
-    res = pd.DataFrame({col: np.repeat(df[col].values, lens) for col in idx_cols})
-    res = res.assign(**flattened)
 
-    # Check that rows are fully "exploded"
-    return explode(res)
+def _flat_columns(tree, keys):
+    """
+    Reads the variables to bin as flat numpy arrays, as for :func:`flatten_arrays`.
+
+    Where the tree provides an Arrow view of the selected entries (and pyarrow
+    is installed), the arrays are taken from its buffers.
+    """
+    if not has_pyarrow or not hasattr(tree, "as_arrow"):
+        return flatten_arrays(tree.arrays(keys, library="ak", how=dict))
+    try:
+        table = ArrayMethods.flatten_arrow(tree.as_arrow(keys).drop_null())
+    except ValueError:
+        raise ValueError("Cannot bin multiple arrays with different jaggedness")
+    return {name: column.to_numpy() for name, column in zip(table.column_names, table.columns)}
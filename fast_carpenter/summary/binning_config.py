@@ -108,3 +108,13 @@ def create_file_format(stage_name, file_format):
         # else we've got a single, scalar value
         file_format = [{'extension': file_format}]
     return file_format
+
+
+engines = ("pandas", "numpy")
+
+
+def create_engine(stage_name, engine):
+    if engine not in engines:
+        msg = "{}: unknown engine '{}', must be one of {}"
+        raise BadBinnedDataframeConfig(msg.format(stage_name, engine, ", ".join(engines)))
+    return engine
@@ -1,5 +1,9 @@
 import os
+import uuid
+import numpy as np
 import pandas as pd
+from .import_pyarrow import pyarrow
+from ..tree_adapter import ArrayMethods
 
 
 class Collector():
@@ -12,39 +16,66 @@ class Collector():
             return
 
         output = self._prepare_output(dataset_readers_list)
-        output.to_hdf(self.filename, key='df', mode='w')
+        if output is None:
+            return
+        output.to_csv(self.filename, index=False)
+        return output
 
     def _prepare_output(self, dataset_readers_list):
-        dataset_readers_list = [(d, [r.contents for r in readers]) for d, readers in dataset_readers_list if readers]
+        dataset_readers_list = [(d, readers) for d, readers in dataset_readers_list if readers]
         if len(dataset_readers_list) == 0:
             return None
 
-        return self._merge_dataframes(dataset_readers_list)
-
-    def _merge_dataframes(self, dataset_readers_list):
-
-        final_df = None
-        all_dfs = []
-        keys = []
+        return self._merge_file_lists(dataset_readers_list)
 
+    def _merge_file_lists(self, dataset_readers_list):
+        files = {}
         for dataset, readers in dataset_readers_list:
-            dataset_df = readers[0]
-            for df in readers[1:]:
-                if df is None:
-                    continue
-                dataset_df = dataset_df.add(df, fill_value=0.)
+            for reader in readers:
+                reader.end()
+                files.update({path: (dataset, path, nrows) for _, path, nrows in reader.files})
 
-            all_dfs.append(dataset_df)
-            keys.append(dataset)
-
-        final_df = pd.concat(all_dfs, keys=keys, names=['dataset'], sort=True)
-
-        return final_df.reset_index()
+        return pd.DataFrame(list(files.values()), columns=["dataset", "path", "nrows"])
 
 
 class EventByEventDataframe(object):
     """
-    Write out a pandas dataframe with event-level values
+    Writes out the event-level values of some variables, as Parquet files.
+
+    The selected events of each block are taken as an Arrow table sharing
+    the buffers of the data, and written as a row group of a Parquet file
+    belonging to this copy of the stage, so that the memory used does not
+    grow with the number of selected events.  The files of a dataset
+    are put in a ``dataset=<name>`` directory, so that the whole output can be
+    read back as a single (hive-partitioned) table, e.g. with
+    ``pandas.read_parquet``.  A list of the files written, with their dataset
+    and number of rows, is saved as a CSV manifest.
+
+    Parameters:
+      collections (list[str]): The variables to write out.
+      mask (str): The name of a boolean variable used to select further which
+        events are written out, e.g. one made by a
+        :class:`~fast_carpenter.SelectPhaseSpace` stage.
+      flatten (bool): If ``True``, variables with a list of values per event
+        are written with one row per element of the list, repeating the
+        values of the other variables.  All lists of an event must then have
+        the same length.  If ``False``, such variables are written as list
+        columns, with one row per event.
+
+    Other Parameters:
+      name (str):  The name of this stage (handled automatically by fast-flow)
+      out_dir (str):  Where to put the output files (handled automatically by
+          fast-flow)
+
+    Example:
+      ::
+
+        write_muons:
+          collections: [NMuon, Muon_Px, Muon_Py]
+          flatten: False
+
+    Raises:
+      ImportError: If pyarrow is not installed, once events are written out.
     """
 
     def __init__(self, name, out_dir, collections, mask=None, flatten=True):
@@ -53,34 +84,60 @@ class EventByEventDataframe(object):
         self.out_dir = out_dir
         self.mask = mask
         self.collections = collections
-        self.contents = None
-        self.df = None
         self.flatten = flatten
+        self.files = []
+        self._writer = None
 
     def event(self, chunk):
-        variables = chunk.tree.pandas.df(self.collections, flatten=self.flatten)
-
-        variables["hashed_filename"] = hash(chunk.config.inputPaths[0])
-
-        self.df = variables
-
-        if self.contents is None:
-            self.contents = self.df
-        else:
-            self.contents = pd.concat([self.contents, self.df])
-
+        keys = list(self.collections) + ([self.mask] if self.mask else [])
+        table = chunk.tree.as_arrow(keys)
+        if self.mask:
+            selected = pyarrow.compute.fill_null(table[self.mask], False)
+            table = table.filter(selected).drop([self.mask])
+        if self.flatten:
+            table = ArrayMethods.flatten_arrow(table)
+
+        hashed_filename = np.full(table.num_rows, hash(chunk.config.inputPaths[0]), dtype=np.int64)
+        table = table.append_column("hashed_filename", pyarrow.array(hashed_filename))
+        self._write(chunk.config.dataset.name, table)
         return True
 
+    def _write(self, dataset, table):
+        if self._writer is not None and self.files[-1][0] != dataset:
+            self.end()
+        if self._writer is None:
+            directory = os.path.join(self.out_dir, "df_" + self.name, "dataset=" + str(dataset))
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, uuid.uuid4().hex + ".parquet")
+            self._writer = pyarrow.parquet.ParquetWriter(path, table.schema)
+            self.files.append((dataset, path, 0))
+        elif table.schema != self._writer.schema:
+            table = table.cast(self._writer.schema)
+        self._writer.write_table(table)
+        dataset, path, nrows = self.files[-1]
+        self.files[-1] = (dataset, path, nrows + table.num_rows)
+
+    def end(self):
+        """ Closes the file being written, if any. """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __getstate__(self):
+        # an open file cannot be sent to another process: it is closed first, so
+        # that every file listed by the copy is complete, and later events go to a new file
+        self.end()
+        return self.__dict__.copy()
+
+    def branch_usage(self):
+        return list(self.collections) + ([self.mask] if self.mask else []), []
+
     def collector(self):
 
-        outfilename = "df_" + self.name + ".hd5"
+        outfilename = "df_" + self.name + "-manifest.csv"
         outfilename = os.path.join(self.out_dir, outfilename)
         return Collector(outfilename)
 
     def merge(self, rhs):
-        if rhs.contents is None or len(rhs.contents) == 0:
-            return
-        if self.contents is None:
-            self.contents = rhs.contents
-            return
-        self.contents = pd.concat([self.contents, rhs.contents])
+        rhs.end()
+        self.files += rhs.files
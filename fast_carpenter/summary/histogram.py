@@ -0,0 +1,294 @@
+"""
+Summarize the data as `boost-histogram <https://github.com/scikit-hep/boost-histogram>`_ histograms.
+"""
+import os
+import pickle
+import re
+import numpy as np
+import pandas as pd
+import six
+from . import binning_config as cfg
+from .binned_dataframe import _flat_columns, count_label
+from .import_boost_histogram import bh
+from fast_carpenter.expressions import compile_expression
+
+
+file_formats = {"pickle": ".pkl", "hdf5": ".h5"}
+
+
+class Collector():
+    def __init__(self, filename, by_dataset, file_format):
+        self.filename = filename
+        self.by_dataset = by_dataset
+        self.file_format = file_format
+
+    def collect(self, dataset_readers_list, doReturn=True, writeFiles=True):
+        if len(dataset_readers_list) == 0:
+            return None
+
+        output = self._prepare_output(dataset_readers_list)
+
+        if writeFiles:
+            for file_format in self.file_format:
+                filename = self.filename + file_formats[file_format]
+                if file_format == "pickle":
+                    with open(filename, "wb") as outfile:
+                        pickle.dump(output, outfile)
+                else:
+                    write_hdf5(filename, output)
+
+        if doReturn:
+            return output
+
+    def _prepare_output(self, dataset_readers_list):
+        by_dataset = {}
+        for dataset, readers in dataset_readers_list:
+            histograms = None
+            for reader in readers:
+                histograms = add_histograms(histograms, reader.histograms)
+            if histograms is not None:
+                by_dataset[dataset] = histograms
+
+        if self.by_dataset:
+            return by_dataset
+        total = None
+        for histograms in by_dataset.values():
+            total = add_histograms(total, histograms)
+        return total if total is not None else {}
+
+
+def add_histograms(lhs, rhs):
+    """
+    Adds two dictionaries of histograms, either of which may be None.
+
+    Histograms found on one side only, such as the weighted ones of simulated
+    datasets when merging them with real data, are copied over as they are.
+    """
+    if rhs is None:
+        return lhs
+    if lhs is None:
+        return {label: hist.copy() for label, hist in rhs.items()}
+    added = {label: hist + rhs[label] if label in rhs else hist for label, hist in lhs.items()}
+    added.update({label: hist.copy() for label, hist in rhs.items() if label not in lhs})
+    return added
+
+
+def write_hdf5(filename, histograms):
+    """
+    Writes a (nested) dictionary of histograms to an HDF5 file, with one group per histogram.
+
+    Each group holds the bin contents including the flow bins, one dataset
+    per field of the storage (e.g. ``value`` and ``variance``), and an
+    ``axis_<n>`` subgroup per axis with its name, label and edges or categories.
+    """
+    import h5py
+    with h5py.File(filename, "w") as outfile:
+        _write_group(outfile, histograms)
+
+
+def _write_group(group, histograms):
+    for key, value in histograms.items():
+        subgroup = group.create_group(str(key))
+        if isinstance(value, dict):
+            _write_group(subgroup, value)
+            continue
+        subgroup.attrs["storage"] = value.storage_type.__name__
+        view = value.view(flow=True)
+        if view.dtype.names:
+            for field in view.dtype.names:
+                if not field.startswith("_"):
+                    subgroup[field] = view[field]
+        else:
+            subgroup["values"] = view
+        for index, axis in enumerate(value.axes):
+            axis_group = subgroup.create_group("axis_{}".format(index))
+            axis_group.attrs["name"] = getattr(axis, "name", "")
+            axis_group.attrs["label"] = getattr(axis, "label", "")
+            if isinstance(axis, bh.axis.IntCategory):
+                axis_group["categories"] = np.array(list(axis), dtype=np.int64)
+                continue
+            axis_group["edges"] = axis.edges
+            axis_group.attrs["underflow"] = axis.traits.underflow
+            axis_group.attrs["overflow"] = axis.traits.overflow
+
+
+def bin_one_dimension(low=None, high=None, nbins=None, edges=None,
+                      overflow=True, underflow=True):
+    # - bins: {nbins: 6 , low: 1  , high: 5 , overflow: True}
+    # - bins: {edges: [0, 200., 900], overflow: True}
+    if all([x is not None for x in (nbins, low, high)]):
+        low, high, nbins = (pd.eval(low, engine='numexpr'),
+                            pd.eval(high, engine='numexpr'), pd.eval(nbins, engine='numexpr'))
+        return bh.axis.Regular(int(nbins), float(low), float(high), underflow=underflow, overflow=overflow)
+    elif edges:
+        return bh.axis.Variable(np.array(edges, "f"), underflow=underflow, overflow=overflow)
+    return None
+
+
+def create_file_format(stage_name, file_format):
+    if isinstance(file_format, six.string_types):
+        file_format = [file_format]
+    unknown = [fmt for fmt in file_format if fmt not in file_formats]
+    if unknown:
+        msg = "{}: unknown file format(s) {}, must be one of {}"
+        raise cfg.BadBinnedDataframeConfig(msg.format(stage_name, unknown, ", ".join(file_formats)))
+    return list(file_format)
+
+
+def _as_categories(stage_name, dimension, values):
+    """
+    Converts the values of a dimension without bins to the integers of its category axis.
+
+    Raises:
+      BadBinnedDataframeConfig: If any value is not a whole number, e.g. NaN or 2.5.
+    """
+    if values.dtype.kind in "biu":
+        return values.astype(np.int64)
+    integral = np.isfinite(values) & (values == np.round(values))
+    if not integral.all():
+        bad = values[~integral][0]
+        msg = "{}: '{}' has no bins, so its values must be whole numbers, but found {}; give it bins instead"
+        raise cfg.BadBinnedDataframeConfig(msg.format(stage_name, dimension, bad))
+    return values.astype(np.int64)
+
+
+class BuildHistogram(object):
+    """Produces binned and possibly weighted histograms using boost-histogram.
+
+    Can be parametrized in the same way as
+    :py:class:`fast_carpenter.BinnedDataframe`, but the counts are kept in
+    ``boost_histogram.Histogram`` objects: one called ``n`` with the number
+    of events in each bin, and one per weight with its sum of weights and sum
+    of squared weights (``Weight`` storage).  Each block is filled with the
+    compiled ``fill`` of boost-histogram and the results from different
+    workers are merged by adding the histograms, so only the bin contents
+    are passed around.
+
+    Dimensions without ``bins`` become growing integer category axes, so
+    their values must be whole numbers.
+
+    The histograms are written as a pickled dictionary, with a level per
+    dataset if ``dataset_col`` is true, which can be loaded back as
+    boost-histogram (or `hist <https://github.com/scikit-hep/hist>`_) objects, and/or
+    as an HDF5 file (see :func:`write_hdf5`, which needs ``h5py``).
+
+    Parameters:
+      binning (list[dict]): How to bin the data, as for
+        :py:class:`fast_carpenter.BinnedDataframe`.
+      weights (str or list[str], dict[str, str]): How to weight the
+        histograms, as for :py:class:`fast_carpenter.BinnedDataframe`.
+      mean (str): Optional.  An expression whose (weighted) mean is kept in
+        each bin as well, using the ``Mean`` and ``WeightedMean`` storages.
+      dataset_col (bool): Whether to keep separate histograms for each dataset.
+      weight_data (bool): Whether to apply the weights to real data as well.
+      threads (int): Optional.  The number of threads to fill each block with,
+        where ``0`` uses one thread per core.
+      file_format (str or list[str]): ``pickle`` (the default) and/or ``hdf5``.
+
+    Other Parameters:
+      name (str):  The name of this stage (handled automatically by fast-flow)
+      out_dir (str):  Where to put the output files (handled automatically by
+          fast-flow)
+
+    Example:
+      ::
+
+        jet_pt_histogram:
+          binning:
+            - {in: NJet, out: njet}
+            - {in: Jet_Pt, out: jet_pt, bins: {low: 0, high: 200, nbins: 20}}
+          weights: {weighted: EventWeight}
+          file_format: [pickle, hdf5]
+
+    Raises:
+      BadBinnedDataframeConfig: If there is an issue with the binning
+        description or the file format, or if a dimension without bins has
+        values that are not whole numbers.
+      ImportError: If boost-histogram is not installed.
+    """
+
+    def __init__(self, name, out_dir, binning, weights=None, mean=None, dataset_col=True,
+                 weight_data=False, threads=None, file_format="pickle"):
+        self.name = name
+        self.out_dir = out_dir
+        ins, outs, axes = cfg.create_binning_list(self.name, binning, make_bins=bin_one_dimension)
+        self._bin_dims = ins
+        self._out_bin_dims = outs
+        self._axes = []
+        for _in, _out, axis in zip(ins, outs, axes):
+            if axis is None:
+                axis = bh.axis.IntCategory([], growth=True)
+            axis.name, axis.label = _out, _in
+            self._axes.append(axis)
+        self._weights = cfg.create_weights(self.name, weights)
+        self._mean = mean
+        self._compile()
+        self._dataset_col = dataset_col
+        self.weight_data = weight_data
+        self.threads = threads
+        self._file_format = create_file_format(self.name, file_format)
+        self.histograms = None
+
+    def _compile(self):
+        self._dimensions = [compile_expression(dim) for dim in self._bin_dims]
+        self._sample = compile_expression(self._mean) if self._mean else None
+        expressions = self._bin_dims + ([self._mean] if self._mean else [])
+        self.potential_inputs = set(sum((re.findall(r"\w+", expression) for expression in expressions), []))
+
+    def _make_histograms(self, weighted):
+        unweighted, weighted_storage = bh.storage.Double, bh.storage.Weight
+        if self._mean:
+            unweighted, weighted_storage = bh.storage.Mean, bh.storage.WeightedMean
+        histograms = {count_label: bh.Histogram(*self._axes, storage=unweighted())}
+        if weighted:
+            for label in self._weights:
+                histograms[label] = bh.Histogram(*self._axes, storage=weighted_storage())
+        return histograms
+
+    def collector(self):
+        outfilename = "hist_"
+        if self._dataset_col:
+            outfilename += "dataset."
+        outfilename += ".".join(self._out_bin_dims)
+        outfilename += "--" + self.name
+        outfilename = os.path.join(self.out_dir, outfilename)
+        return Collector(outfilename, self._dataset_col, file_format=self._file_format)
+
+    def event(self, chunk):
+        weighted = bool(self._weights) and (chunk.config.dataset.eventtype == "mc" or self.weight_data)
+        weights = list(self._weights.values()) if weighted else []
+        all_inputs = [key for key in chunk.tree.keys() if key in self.potential_inputs] + weights
+        if not all_inputs:
+            return True
+        data = _flat_columns(chunk.tree, all_inputs)
+
+        if self.histograms is None:
+            self.histograms = self._make_histograms(weighted)
+
+        values = [np.asarray(dimension.evaluate(data)) for dimension in self._dimensions]
+        values = [_as_categories(self.name, dim, value) if isinstance(axis, bh.axis.IntCategory) else value
+                  for dim, value, axis in zip(self._bin_dims, values, self._axes)]
+        options = {}
+        if self._sample is not None:
+            options["sample"] = np.asarray(self._sample.evaluate(data))
+        if self.threads is not None:
+            options["threads"] = self.threads
+        for label, histogram in self.histograms.items():
+            if label == count_label:
+                histogram.fill(*values, **options)
+            else:
+                histogram.fill(*values, weight=data[self._weights[label]], **options)
+        return True
+
+    def branch_usage(self):
+        return self._bin_dims + ([self._mean] if self._mean else []) + list(self._weights.values()), []
+
+    def rewrite_expressions(self, substitutions):
+        self._bin_dims = [substitutions.get(dim, dim) for dim in self._bin_dims]
+        if self._mean:
+            self._mean = substitutions.get(self._mean, self._mean)
+        self._weights = {label: substitutions.get(weight, weight) for label, weight in self._weights.items()}
+        self._compile()
+
+    def merge(self, rhs):
+        self.histograms = add_histograms(self.histograms, rhs.histograms)
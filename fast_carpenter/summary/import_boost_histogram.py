@@ -0,0 +1,17 @@
+try:
+    import boost_histogram as bh
+    has_boost_histogram = True
+except ImportError as ex:
+    if "boost_histogram" not in str(ex):
+        raise
+
+    class BoostHistogramCatcher:
+        def __getattr__(self, attr):
+            msg = "boost-histogram is not installed but has been needed."
+            msg += "\nInstall it using pip or conda:"
+            msg += "\n\n       pip install boost-histogram"
+            msg += "\n\nor install fast-carpenter with the 'histogram' extra."
+            raise ImportError(msg)
+
+    bh = BoostHistogramCatcher()
+    has_boost_histogram = False
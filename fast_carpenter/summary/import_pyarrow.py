@@ -0,0 +1,19 @@
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.parquet
+    has_pyarrow = True
+except ImportError as ex:
+    if "pyarrow" not in str(ex):
+        raise
+
+    class PyarrowCatcher:
+        def __getattr__(self, attr):
+            msg = "pyarrow is not installed but has been needed."
+            msg += "\nInstall it using pip or conda:"
+            msg += "\n\n       pip install pyarrow"
+            msg += "\n\nor install fast-carpenter with the 'arrow' extra."
+            raise ImportError(msg)
+
+    pyarrow = PyarrowCatcher()
+    has_pyarrow = False
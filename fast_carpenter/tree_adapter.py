@@ -6,16 +6,23 @@ import logging
 from typing import Any, Callable, Dict, List, Optional, Protocol
 
 import awkward as ak
+from cachetools import LRUCache
 import numpy as np
 
+from .expressions import DEFAULT_FLATTENED_CACHE_SIZE, IdentityCache
+from .masks import PackedMask
+
 adapters: Dict[str, Callable] = {}
 DEFAULT_TREE_TO_DICT_ADAPTOR = "uproot4"
+# memory budget (in bytes) for branches read within one block
+DEFAULT_BRANCH_CACHE_SIZE = 512 * 1024 ** 2
 logger = logging.getLogger(__name__)
 
 LIBRARIES = {
     "awkward": ["ak", "ak.Array", "awkward"],
     "numpy": ["np", "np.ndarray", "numpy"],
     "pandas": ["pd", "pd.DataFrame", "pandas"],
+    "arrow": ["pa", "pa.Table", "pyarrow", "arrow"],
 }
 
 SUPPORTED_OUTPUT_TYPES = [dict, tuple, list]
@@ -43,6 +50,26 @@ class TreeLike(Protocol):
     pass
 
 
+class BranchCache(LRUCache):
+    """
+    Least-recently-used cache for branch arrays, bounded by the number of bytes held.
+    Arrays larger than the whole budget are not cached.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_BRANCH_CACHE_SIZE) -> None:
+        super().__init__(maxsize=maxsize, getsizeof=BranchCache.nbytes)
+
+    @staticmethod
+    def nbytes(array: Any) -> int:
+        return getattr(array, "nbytes", 0)
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        try:
+            super().__setitem__(key, value)
+        except ValueError:
+            logger.debug(f"Not caching {key}: {self.nbytes(value)} bytes exceeds cache size of {self.maxsize}")
+
+
 class TreeToDictAdaptor(abc.MutableMapping):
     """
     Provides a dict-like interface to a tree-like data object (e.g. ROOT TTree, uproot.tree, etc).
@@ -51,11 +78,18 @@ class TreeToDictAdaptor(abc.MutableMapping):
     tree: Any
     aliases: Dict[str, Any]
     extra_variables: Dict[str, Any]
+    branch_cache: BranchCache
+    flattened_cache: IdentityCache
 
-    def __init__(self, tree: Any, aliases: Dict[str, Any] = None) -> None:
+    def __init__(self, tree: Any, aliases: Dict[str, Any] = None,
+                 cache_size: int = DEFAULT_BRANCH_CACHE_SIZE,
+                 flattened_cache_size: int = DEFAULT_FLATTENED_CACHE_SIZE) -> None:
         self.tree = tree
         self.aliases = aliases if aliases else {}
         self.extra_variables = {}
+        self.branch_cache = BranchCache(cache_size)
+        # flat contents and broadcasts of the arrays read, see fast_carpenter.expressions.flatten
+        self.flattened_cache = IdentityCache(flattened_cache_size)
 
     def __getitem__(self, key: str) -> Any:
         """
@@ -64,6 +98,13 @@ class TreeToDictAdaptor(abc.MutableMapping):
         """
         return self.__m_getitem__(self.__resolve_key__(key))
 
+    def get_range(self, key: str, entry_start: Optional[int], entry_stop: Optional[int]) -> Any:
+        """
+        Get an item from the tree, only reading the entries in [entry_start, entry_stop).
+        Resolves aliases if defined.
+        """
+        return self.__m_getitem__(self.__resolve_key__(key), entry_start, entry_stop)
+
     def __setitem__(self, key, value) -> None:
         """
         Creates a new branch in the tree.
@@ -102,12 +143,23 @@ class TreeToDictAdaptor(abc.MutableMapping):
         else:
             raise ValueError(f"Trying to overwrite existing variable: {key}")
 
+    def delete_variable(self, key) -> None:
+        """
+        Drops a variable added with new_variable, e.g. a temporary that is no longer needed.
+        """
+        self.__delete_variable__(self.__resolve_key__(key))
+
     def evaluate(self, expression: str) -> Any:
         """
         Evaluate a string expression using the tree as the namespace.
         """
         raise NotImplementedError()
 
+    def reset_cache(self) -> None:
+        """ Drops all branches read so far, e.g. when moving on to the next block. """
+        self.branch_cache.clear()
+        self.flattened_cache.clear()
+
     @property
     def num_entries(self) -> int:
         """ Returns the number of entries in the tree. """
@@ -141,8 +193,8 @@ class Uproot3Methods(object):
     Provides uproot3-specific methods for the dict-like interface.
     """
 
-    def __m_getitem__(self, key):
-        return self.tree.array(key)
+    def __m_getitem__(self, key, entry_start=None, entry_stop=None):
+        return self.tree.array(key, entrystart=entry_start, entrystop=entry_stop)
 
     def __m_setitem__(self, key, value):
         self.tree.set_branch(key, value)
@@ -237,12 +289,18 @@ class Uproot4Methods(object):
     Provides uproot4-specific methods for the dict-like interface.
     """
 
-    def __m_getitem__(self, key):
+    def __m_getitem__(self, key, entry_start=None, entry_stop=None):
         if key in self.extra_variables:
             return self.extra_variables[key]
-        if hasattr(self.tree[key], "array"):
-            return self.tree[key].array()
-        return self.tree[key]
+        cache_key = (key, entry_start, entry_stop)
+        if cache_key in self.branch_cache:
+            return self.branch_cache[cache_key]
+        branch = self.tree[key]
+        if not hasattr(branch, "array"):
+            return branch[entry_start:entry_stop]
+        array = branch.array(entry_start=entry_start, entry_stop=entry_stop)
+        self.branch_cache[cache_key] = array
+        return array
 
     def __m_setitem__(self, key, value):
         self.tree.set_branch(key, value)
@@ -257,6 +315,9 @@ class Uproot4Methods(object):
         key = self.__resolve_special_tokens__(key)
         self.extra_variables[key] = value
 
+    def __delete_variable__(self, key) -> None:
+        self.extra_variables.pop(self.__resolve_special_tokens__(key), None)
+
     @property
     def num_entries(self) -> int:
         try:
@@ -272,26 +333,72 @@ class Uproot4Methods(object):
         """
         return ak.to_pandas(arraydict)
 
-    def array_dict(self, keys: List[str]) -> Dict[str, Any]:
+    @staticmethod
+    def arraydict_to_arrow(arraydict: Dict[str, Any]):
+        """
+        Converts a dictionary of arrays to a pyarrow Table, with one column per array.
+        The columns wrap the buffers of the arrays, so numbers and list offsets are not copied.
+        """
+        import pyarrow
+        columns = [ak.to_arrow(ak.Array(array)) for array in arraydict.values()]
+        return pyarrow.Table.from_arrays(columns, names=list(arraydict))
+
+    @staticmethod
+    def flatten_arrow(table):
+        """
+        Flattens the list columns of a pyarrow Table, giving a row per element of the lists in
+        which the values of the other columns are repeated, until no list columns are left.
+        All lists of a row must have the same length, and rows with empty or missing lists are dropped.
+        """
+        import pyarrow
+        import pyarrow.compute as pc
+
+        def is_list(column):
+            return pyarrow.types.is_list(column.type) or pyarrow.types.is_large_list(column.type)
+
+        table = table.combine_chunks()
+        while True:
+            lists = [name for name, column in zip(table.column_names, table.columns) if is_list(column)]
+            if not lists:
+                return table
+            lengths = pc.list_value_length(table[lists[0]])
+            for name in lists[1:]:
+                if not pc.all(pc.equal(pc.list_value_length(table[name]), lengths)).as_py():
+                    raise ValueError(f"Cannot flatten lists of different lengths: {lists[0]} and {name}")
+            parents = pc.list_parent_indices(table[lists[0]])
+            columns = [pc.list_flatten(table[name]) if name in lists else table[name].take(parents)
+                       for name in table.column_names]
+            table = pyarrow.table(columns, names=table.column_names).combine_chunks()
+
+    def array_dict(self, keys: List[str], entry_start: Optional[int] = None,
+                   entry_stop: Optional[int] = None) -> Dict[str, Any]:
         """
         Returns a dictionary of arrays for the given keys.
+        Branches that are neither extra variables nor already cached are read in a single call,
+        restricted to the entries in [entry_start, entry_stop).
         """
-        extra_arrays = None
-        _keys = keys.copy()
-        if self.extra_variables:
-            # check if any of the extra variables are included in the expressions
-            extra_vars = []
-            for name in self.extra_variables:
-                if name in keys:
-                    extra_vars.append(name)
-                    _keys.remove(name)
-            if extra_vars:
-                extra_arrays = {key: self.extra_variables[key] for key in extra_vars}
-
-        tree_arrays = self.tree.arrays(_keys, library="ak", how=dict)
-        if extra_arrays is not None:
-            tree_arrays.update(extra_arrays)
-        return tree_arrays
+        def cache_key(key):
+            return (key, entry_start, entry_stop)
+
+        to_read = [key for key in keys if key not in self.extra_variables and cache_key(key) not in self.branch_cache]
+        if to_read:
+            tree_arrays = self.tree.arrays(
+                to_read, entry_start=entry_start, entry_stop=entry_stop, library="ak", how=dict
+            )
+            for key, array in tree_arrays.items():
+                self.branch_cache[cache_key(key)] = array
+        else:
+            tree_arrays = {}
+
+        arrays = {}
+        for key in keys:
+            if key in self.extra_variables:
+                arrays[key] = self.extra_variables[key]
+            elif key in tree_arrays:
+                arrays[key] = tree_arrays[key]
+            else:
+                arrays[key] = self.branch_cache[cache_key(key)]
+        return arrays
 
     @staticmethod
     def array_exporter(dict_of_arrays, **kwargs):
@@ -313,6 +420,9 @@ class Uproot4Methods(object):
         if library in LIBRARIES["pandas"]:
             return Uproot4Methods.arraydict_to_pandas(dict_of_arrays)
 
+        if library in LIBRARIES["arrow"]:
+            return Uproot4Methods.arraydict_to_arrow(dict_of_arrays)
+
     def arrays(self, expressions, *args, **kwargs):
         if "outputtype" in kwargs:
             # renamed uproot3 -> uproot4
@@ -320,7 +430,9 @@ class Uproot4Methods(object):
             kwargs["how"] = outputtype
 
         operations = kwargs.get("operations", [])
-        tree_arrays = self.array_dict(keys=expressions)
+        entry_start = kwargs.pop("entry_start", None)
+        entry_stop = kwargs.pop("entry_stop", None)
+        tree_arrays = self.array_dict(keys=expressions, entry_start=entry_start, entry_stop=entry_stop)
         for operation in operations:
             for key, value in tree_arrays.items():
                 tree_arrays[key] = operation(value)
@@ -479,40 +591,50 @@ register("uproot4", TreeToDictAdaptorV1)
 
 class Ranger(object):
     """
-        TODO: range is just a different way of indexing --> refactor
+    Restricts access to a tree to the entries in [start, stop).
+    Branches are read with entry_start/entry_stop, so only the baskets of the current range are
+    read and decompressed, and all arrays (including new variables) have the length of the range.
     """
     tree: TreeToDictAdaptor
     start: int
     stop: int
     block_size: int
-    mask: Any
 
     def __init__(self, tree: TreeToDictAdaptor, start: int, stop: int) -> None:
         self.tree = tree
-        self.start = start
-        self.stop = stop
+        self.set_range(start, stop)
 
-        tree_size = tree.num_entries
-        self.block_size = stop - start if stop > start > 0 else tree_size
-        self.mask = np.ones(tree_size, dtype=bool)
-        if self.block_size < tree_size:
-            self.mask = np.zeros(tree_size, dtype=bool)
-            self.mask[start:stop] = True
+    def set_range(self, start: int, stop: int) -> None:
+        """
+        Moves the range to [start, stop). A negative stop means "until the end of the tree".
+        Variables defined for the previous range are dropped.
+        """
+        tree_size = self.tree.num_entries
+        if stop is None or stop < 0 or stop > tree_size:
+            stop = tree_size
+        self.start = min(max(start, 0), stop)
+        self.stop = stop
+        self.block_size = self.stop - self.start
+        self.tree.extra_variables.clear()
+        self.tree.flattened_cache.clear()
 
     @property
     def num_entries(self) -> int:
         """Returns the size of the range - overwrites tree.num_entries."""
         return self.block_size
 
+    @property
+    def flattened_cache(self) -> IdentityCache:
+        return self.tree.flattened_cache
+
     @property
     def unfiltered_num_entries(self) -> int:
         return self.tree.num_entries
 
     def __getitem__(self, key):
-        return ak.mask(self.tree[key], self.mask)
+        return self.tree.get_range(key, self.start, self.stop)
 
     def __setitem__(self, key, value):
-        # self.tree[key][self.start:self.stop] = value[self.start:self.stop]
         self.tree[key] = value
 
     def __delitem__(self, key):
@@ -528,38 +650,35 @@ class Ranger(object):
         return self[key]
 
     def arrays(self, *args, **kwargs):
-        operations = kwargs.pop("operations", [])
-        operations.append(lambda x: ak.mask(x, self.mask))
-        kwargs["operations"] = operations
+        kwargs["entry_start"] = self.start
+        kwargs["entry_stop"] = self.stop
         arrays = self.tree.arrays(*args, **kwargs)
         return arrays
 
     def new_variable(self, name, value):
-        import awkward as ak
-        if len(value) < self.tree.num_entries:
-            new_value = ak.concatenate(
-                [
-                    ak.Array([None] * self.start),
-                    value,
-                    ak.Array([None] * (self.tree.num_entries - self.stop))
-                ],
-                axis=0
-            )
-        else:
-            new_value = value
-        assert len(new_value) == self.tree.num_entries
-        self.tree.new_variable(name, new_value, context=self.tree)
+        if not isinstance(value, (ak.Array, np.ndarray)):
+            value = ak.from_awkward0(value)
+        self.tree.new_variable(name, value, context=self)
+
+    def delete_variable(self, name):
+        self.tree.delete_variable(name)
 
     def evaluate(self, expression, **kwargs):
         import awkward as ak
         return ak.numexpr.evaluate(expression, self, **kwargs)
 
+    def reset_cache(self):
+        self.tree.reset_cache()
+
     def keys(self):
         return self.tree.keys()
 
     def arrays_to_pandas(self, *args, **kwargs):
         return self.tree.arrays_to_pandas(*args, **kwargs)
 
+    def as_arrow(self, keys):
+        return ArrayMethods.arraydict_to_arrow(self.arrays(list(keys), how=dict))
+
 
 def combine_masks(masks):
     import awkward as ak
@@ -572,32 +691,46 @@ def combine_masks(masks):
 
 
 class Masked(object):
-    _mask: Any
+    """
+    Masked access to a range of entries. The mask is kept as a packed bitset and
+    arrays are returned as option-type arrays with the length of the full range.
+
+    The masked arrays are kept until the mask changes, so that repeated reads
+    of a variable return the same array (see :func:`fast_carpenter.expressions.flatten`).
+    """
+    _packed_mask: Optional[PackedMask]
     _tree: Ranger
+    _views: Dict[str, Any]
+    _saved_masks: List[Any]
 
     def __init__(self, tree: Ranger, mask: Any) -> None:
         self._tree = tree
-        self._mask = np.ones(tree.num_entries, dtype=bool) if mask is None else mask
-
-        if mask is not None and len(mask) < tree.unfiltered_num_entries:
-            self._mask = ak.concatenate(
-                [
-                    ak.Array([False] * tree.start),
-                    self._mask,
-                    ak.Array([False] * (tree.unfiltered_num_entries - tree.stop))
-                ],
-                axis=0
-            )
+        self._views = {}
+        self._saved_masks = []
+        if mask is None:
+            mask = PackedMask.ones(tree.num_entries)
+        elif isinstance(mask, (list, tuple)):
+            mask = np.asarray(mask, dtype=bool)
+        if len(mask) != tree.num_entries:
+            raise ValueError(f"Mask has length {len(mask)}, but the range has {tree.num_entries} entries")
+        self._packed_mask = PackedMask.from_bool(mask)
+
+    @property
+    def _mask(self):
+        if self._packed_mask is None:
+            return None
+        return self._packed_mask.to_bool()
 
     def __getitem__(self, key):
-        if self._mask is None:
+        if self._packed_mask is None:
             return self._tree[key]
-        try:
-            if len(self._mask) > len(self._tree):
-                return self._tree[key][self._tree.start:self._tree.stop].mask[self._mask]
-        except TypeError as e:
-            raise e
-        return self._tree[key].mask[self._mask]
+        mask = self._view(None, lambda: self._mask)
+        return self._view(key, lambda: self._tree[key].mask[mask])
+
+    def _view(self, key, make_view):
+        if key not in self._views:
+            self._views[key] = make_view()
+        return self._views[key]
 
     def __len__(self):
         return len(self._tree)
@@ -609,30 +742,65 @@ class Masked(object):
     def num_entries(self) -> int:
         return self._tree.num_entries
 
+    @property
+    def flattened_cache(self) -> IdentityCache:
+        return self._tree.flattened_cache
+
     def count_nonzero(self):
-        if self._mask is None:
+        if self._packed_mask is None:
             return len(self._tree)
-        return ak.count_nonzero(self._mask)
+        return self._packed_mask.count_nonzero()
 
     def apply_mask(self, mask):
-        if self._mask is None:
-            self._mask = mask
+        self._views.clear()
+        if self._packed_mask is None:
+            self._packed_mask = PackedMask.from_bool(mask)
         else:
-            self._mask = self._mask & mask
+            self._packed_mask = self._packed_mask & mask
 
     def reset_mask(self):
-        self._mask = None
+        self._views.clear()
+        self._packed_mask = None
+
+    def as_arrow(self, keys):
+        """
+        Returns the entries that pass the mask as a pyarrow Table, without copying the buffers
+        of the selected arrays (see :meth:`Uproot4Methods.arraydict_to_arrow`).
+        """
+        return ArrayMethods.arraydict_to_arrow(self.selected_arrays(keys))
+
+    def selected_arrays(self, keys):
+        """Returns a dictionary of arrays holding only the entries that pass the mask."""
+        arrays = self._tree.arrays(list(keys), how=dict)
+        if self._packed_mask is None:
+            return arrays
+        mask = self._view(None, lambda: self._mask)
+        return {key: array[mask] for key, array in arrays.items()}
+
+    def push_mask(self):
+        """Saves the current mask, to be brought back by :meth:`pop_mask`."""
+        self._saved_masks.append(self._packed_mask)
+
+    def pop_mask(self):
+        """Goes back to the mask saved by the last call to :meth:`push_mask`."""
+        self._views.clear()
+        self._packed_mask = self._saved_masks.pop()
+
+    def set_range(self, start, stop):
+        self._tree.set_range(start, stop)
+        self.reset_mask()
 
     def reset_cache(self):
-        pass
+        self._tree.reset_cache()
 
     def array(self, key):
         return self[key]
 
     def arrays(self, *args, **kwargs):
         operations = kwargs.pop("operations", [])
-        if self._mask is not None:
-            operations.append(lambda x: ak.mask(x, self._mask))
+        if self._packed_mask is not None:
+            mask = self._packed_mask.to_bool()
+            operations.append(lambda x: ak.mask(x, mask))
 
         kwargs["operations"] = operations
         arrays = self._tree.arrays(*args, **kwargs)
@@ -648,6 +816,209 @@ class Masked(object):
     def new_variable(self, name, value):
         self._tree.new_variable(name, value)
 
+    def delete_variable(self, name):
+        self._views.pop(name, None)
+        self._tree.delete_variable(name)
+
+
+class EntrySubset(object):
+    """
+    A read-only view of some of the entries of a tree, e.g. to evaluate an expression on fewer events.
+    """
+
+    def __init__(self, tree: Any, index: np.ndarray) -> None:
+        self._tree = tree
+        self._index = index
+
+    def __getitem__(self, key):
+        return self._tree[key][self._index]
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._tree
+
+    @property
+    def num_entries(self) -> int:
+        return len(self._index)
+
+    @property
+    def flattened_cache(self) -> Optional[IdentityCache]:
+        return getattr(self._tree, "flattened_cache", None)
+
+    def array(self, key):
+        return self[key]
+
+    def evaluate(self, expression, **kwargs):
+        return ak.numexpr.evaluate(expression, self, **kwargs)
+
+    def keys(self):
+        return self._tree.keys()
+
+
+class CompactMasked(Masked):
+    """
+    Masked access that keeps the indices (relative to the range) of the entries that survive the
+    mask, instead of a boolean mask. Arrays are returned physically compacted to the selected
+    entries, rather than as option-type arrays with the length of the full range.
+    """
+    _index: Optional[np.ndarray]
+
+    def __init__(self, tree: Ranger, mask: Any) -> None:
+        self._tree = tree
+        self._index = None
+        self._views = {}
+        self._saved_masks = []
+        if mask is not None:
+            self.apply_mask(mask)
+
+    @property
+    def _mask(self):
+        if self._index is None:
+            return None
+        mask = np.zeros(self._tree.num_entries, dtype=bool)
+        mask[self._index] = True
+        return mask
+
+    def __getitem__(self, key):
+        if self._index is None:
+            return self._tree[key]
+        return self._view(key, lambda: self._tree[key][self._index])
+
+    def __len__(self):
+        return self.num_entries
+
+    @property
+    def num_entries(self) -> int:
+        if self._index is None:
+            return self._tree.num_entries
+        return len(self._index)
+
+    def count_nonzero(self):
+        return self.num_entries
+
+    def apply_mask(self, mask):
+        if isinstance(mask, ak.Array):
+            mask = ak.to_numpy(ak.fill_none(mask, False))
+        mask = np.asarray(mask, dtype=bool)
+        if len(mask) != self.num_entries:
+            raise ValueError(f"Mask has length {len(mask)}, but there are {self.num_entries} selected entries")
+        self._views.clear()
+        if self._index is None:
+            self._index = np.flatnonzero(mask)
+        else:
+            self._index = self._index[mask]
+
+    def reset_mask(self):
+        self._views.clear()
+        self._index = None
+
+    def selected_arrays(self, keys):
+        return {key: self[key] for key in keys}
+
+    def push_mask(self):
+        self._saved_masks.append(self._index)
+
+    def pop_mask(self):
+        self._views.clear()
+        self._index = self._saved_masks.pop()
+
+    def arrays(self, *args, **kwargs):
+        operations = kwargs.pop("operations", [])
+        if self._index is not None:
+            operations.append(lambda x: x[self._index])
+
+        kwargs["operations"] = operations
+        return self._tree.arrays(*args, **kwargs)
+
+    def new_variable(self, name, value):
+        """
+        Adds a variable with one value per selected entry. It is stored for the full range, with
+        missing values for the entries that have been removed.
+        """
+        if self._index is None:
+            return self._tree.new_variable(name, value)
+        if len(value) != self.num_entries:
+            msg = f"New variable {name} does not have the right length: {len(value)} not {self.num_entries}"
+            raise ValueError(msg)
+        positions = np.full(self._tree.num_entries, -1, dtype=np.int64)
+        positions[self._index] = np.arange(len(self._index))
+        layout = ak.layout.IndexedOptionArray64(ak.layout.Index64(positions), ak.to_layout(value))
+        self._tree.new_variable(name, ak.Array(layout))
+
+
+class ChainedTree(object):
+    """
+    Presents several trees with the same branches as a single tree with a global entry index.
+
+    ``trees`` only needs to support ``len`` and indexing, so that the trees can be opened lazily.
+    """
+
+    def __init__(self, trees: Any) -> None:
+        self.trees = trees
+        self.offsets = np.cumsum([0] + [trees[i].num_entries for i in range(len(trees))])
+
+    @property
+    def num_entries(self) -> int:
+        return int(self.offsets[-1])
+
+    def keys(self, *args, **kwargs):
+        return self.trees[0].keys(*args, **kwargs)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __getitem__(self, key):
+        return ChainedBranch(self, key)
+
+    def segments(self, entry_start: Optional[int] = None, entry_stop: Optional[int] = None):
+        """
+        Yields (index of tree, local entry start, local entry stop) for the entries in [entry_start, entry_stop).
+        """
+        stop = self.num_entries if entry_stop is None else min(entry_stop, self.num_entries)
+        start = 0 if entry_start is None else min(max(entry_start, 0), stop)
+        first = int(np.searchsorted(self.offsets, start, side="right")) - 1
+        first = min(max(first, 0), len(self.trees) - 1)
+        for i in range(first, len(self.trees)):
+            offset = int(self.offsets[i])
+            if offset >= stop and i > first:
+                break
+            yield i, max(start - offset, 0), max(min(stop, int(self.offsets[i + 1])) - offset, 0)
+
+    def arrays(self, keys, entry_start: Optional[int] = None, entry_stop: Optional[int] = None, **kwargs):
+        """
+        Reads the given branches for the global entry range, as a dictionary of arrays.
+        """
+        kwargs["how"] = dict
+        parts = [self.trees[i].arrays(keys, entry_start=start, entry_stop=stop, **kwargs)
+                 for i, start, stop in self.segments(entry_start, entry_stop)]
+        return {key: _concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+class ChainedBranch(object):
+    """
+    One branch of a ChainedTree.
+    """
+
+    def __init__(self, chain: ChainedTree, key: str) -> None:
+        self.chain = chain
+        self.key = key
+
+    def array(self, entry_start: Optional[int] = None, entry_stop: Optional[int] = None, **kwargs):
+        trees = self.chain.trees
+        return _concatenate([trees[i][self.key].array(entry_start=start, entry_stop=stop, **kwargs)
+                             for i, start, stop in self.chain.segments(entry_start, entry_stop)])
+
+
+def _concatenate(arrays: List[Any]) -> Any:
+    if len(arrays) == 1:
+        return arrays[0]
+    return ak.concatenate(arrays)
+
 
 def create(arguments: Dict[str, Any]) -> TreeToDictAdaptor:
     """
@@ -679,14 +1050,25 @@ def create_ranged(arguments: Dict[str, Any]) -> Ranger:
 def create_masked(arguments: Dict[str, Any]) -> Masked:
     """
     Create a tree adapter with masked access.
+    With "compact" set, masked entries are removed from the arrays instead of being set to None.
     """
     args_copy = arguments.copy()
 
     mask = args_copy.pop("mask", None)
+    compact = args_copy.pop("compact", False)
     tree = create_ranged(args_copy)
 
+    if compact:
+        return CompactMasked(tree, mask)
     return Masked(tree, mask)
 
 
 def create_masked_multitree(arguments: Dict[str, Any]) -> Masked:
-    raise NotImplementedError("Multitree not yet implemented")
+    """
+    Create a tree adapter with masked access to several trees, chained one after the other.
+    """
+    args_copy = arguments.copy()
+
+    trees = args_copy.pop("trees")
+    args_copy["tree"] = ChainedTree(trees)
+    return create_masked(args_copy)
@@ -29,7 +29,8 @@ requirements = [
     'alphatwirl==0.25.5',
     'fast-flow>0.5.0',
     'fast-curator',
-    'awkward',
+    'awkward>=1.4,<2',
+    'cachetools',
     'coffea==0.7.9',
     'pandas>=1.1',
     'numpy==1.22.0; python_version < "3.9"',
@@ -39,6 +40,12 @@ requirements = [
     'uproot>=4.1.8',
     'uproot3>=3.14.0',
 ]
+extras = {
+    'arrow': ['pyarrow>=6'],
+    'histogram': ['boost-histogram>=1.0'],
+    'hdf5': ['h5py'],
+}
+extras['all'] = sorted(set(sum(extras.values(), [])))
 repositories = []
 
 setup_requirements = ['pytest-runner', ]
@@ -66,6 +73,7 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require=extras,
     dependency_links=repositories,
     license="Apache Software License 2.0",
     long_description=readme,  # + '\n\n' + history,
@@ -11,3 +11,87 @@ def wrapped_be(uproot4_tree):
 def test_contains(wrapped_be):
     assert "Muon_Py" in wrapped_be.tree
     assert "not_a_branch" not in wrapped_be.tree
+
+
+def test_blocks(uproot4_tree):
+    events = builder.BEventsWrapped(uproot4_tree, nevents_per_block=1000)
+    assert len(events) == 5
+
+    block_sizes = []
+    for block in events:
+        block_sizes.append(len(block.tree["NMuon"]))
+    assert block_sizes == [1000, 1000, 1000, 1000, 580]
+
+
+def test_blocks_prefetched(uproot4_tree):
+    from concurrent.futures import ThreadPoolExecutor
+    from fast_carpenter.data_import._prefetch import PrefetchingTree
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        tree = PrefetchingTree(uproot4_tree, executor, keys=["NMuon"])
+        events = builder.BEventsWrapped(tree, nevents_per_block=1000)
+
+        n_muons = []
+        for block in events:
+            n_muons.append(block.tree["NMuon"])
+            assert len(tree._prefetched) <= 2
+    assert not tree._prefetched
+    assert [len(n) for n in n_muons] == [1000, 1000, 1000, 1000, 580]
+    assert all(sum(n) == sum(uproot4_tree["NMuon"].array()[i * 1000:(i + 1) * 1000]) for i, n in enumerate(n_muons))
+
+
+def test_blocks_close_data_import(uproot4_tree, test_input_file):
+    from fast_carpenter.data_import import Uproot4DataImport
+    data_import = Uproot4DataImport(dict(prefetch=True))
+    tree = data_import.open([test_input_file])["events"]
+    events = builder.BEventsWrapped(tree, nevents_per_block=1000, data_import=data_import)
+    executor = data_import.executor
+
+    for block in events:
+        assert data_import._executor is executor
+    assert data_import._executor is None
+    assert executor._shutdown
+
+
+class CountingTree(object):
+    """ Counts the reads from a tree: one per call to ``arrays`` and one per branch read on its own. """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.bulk_reads = 0
+        self.branch_reads = 0
+
+    @property
+    def num_entries(self):
+        return self.tree.num_entries
+
+    def keys(self, *args, **kwargs):
+        return self.tree.keys(*args, **kwargs)
+
+    def __iter__(self):
+        return iter(self.tree)
+
+    def __len__(self):
+        return len(self.tree)
+
+    def arrays(self, *args, **kwargs):
+        self.bulk_reads += 1
+        return self.tree.arrays(*args, **kwargs)
+
+    def __getitem__(self, key):
+        self.branch_reads += 1
+        return self.tree[key]
+
+
+def test_blocks_read_once(uproot4_tree):
+    from fast_carpenter.data_import._prefetch import PrefetchingTree
+    counting = CountingTree(uproot4_tree)
+    tree = PrefetchingTree(counting, max_blocks=0, keys=["NMuon", "Muon_Px"])
+    events = builder.BEventsWrapped(tree, nevents_per_block=1000)
+
+    n_muons = []
+    for block in events:
+        n_muons.append(block.tree["NMuon"])
+        block.tree["Muon_Px"]
+    assert counting.bulk_reads == 5
+    assert counting.branch_reads == 0
+    assert [len(n) for n in n_muons] == [1000, 1000, 1000, 1000, 580]
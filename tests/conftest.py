@@ -83,6 +83,17 @@ def full_wrapped_masked_uproot4_tree(uproot4_tree, full_event_range):
         })
 
 
+@pytest.fixture
+def full_wrapped_compact_uproot4_tree(uproot4_tree, full_event_range):
+    from fast_carpenter import tree_adapter
+    return tree_adapter.create_masked(
+        {
+            "adapter": "uproot4", "tree": uproot4_tree,
+            "start": full_event_range.start_entry, "stop": full_event_range.stop_entry,
+            "compact": True,
+        })
+
+
 @pytest.fixture
 def at_least_two_muons(tmpdir):
     return stage.CutFlow("cut_at_least_one_muon", str(tmpdir), selection="NMuon > 1", weights="EventWeight")
@@ -114,6 +125,11 @@ def fake_sim_events(full_wrapped_masked_uproot4_tree):
     return FakeBEEvent(full_wrapped_masked_uproot4_tree, "mc")
 
 
+@pytest.fixture
+def fake_sim_events_compact(full_wrapped_compact_uproot4_tree):
+    return FakeBEEvent(full_wrapped_compact_uproot4_tree, "mc")
+
+
 # setting the default to uproot4
 input_tree = uproot4_tree
 wrapped_tree = wrapped_uproot4_tree
@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from fast_carpenter.data_import._prefetch import PrefetchingTree
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        yield executor
+
+
+def test_prefetch_known_keys(uproot4_tree, executor):
+    tree = PrefetchingTree(uproot4_tree, executor)
+    tree.prefetch(0, 100)
+    assert not tree._prefetched
+
+    first = tree.arrays(["NMuon", "Muon_Px"], entry_start=0, entry_stop=100, library="ak", how=dict)
+    assert len(first["Muon_Px"]) == 100
+    assert list(tree.known_keys) == ["NMuon", "Muon_Px"]
+
+    tree.prefetch(100, 200)
+    keys, future = tree._prefetched[(100, 200)]
+    assert keys == ["NMuon", "Muon_Px"]
+    prefetched = future.result()
+    second = tree["NMuon"].array(entry_start=100, entry_stop=200)
+    assert second is prefetched["NMuon"]
+    assert np.array_equal(second, uproot4_tree["NMuon"].array(entry_start=100, entry_stop=200))
+
+
+def test_prefetch_bounded(uproot4_tree, executor):
+    tree = PrefetchingTree(uproot4_tree, executor, max_blocks=2, keys=["NMuon"])
+    for start in range(0, 500, 100):
+        tree.prefetch(start, start + 100)
+    assert list(tree._prefetched) == [(200, 300), (300, 400), (400, 500)]
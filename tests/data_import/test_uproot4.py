@@ -0,0 +1,113 @@
+import pickle
+import numpy as np
+import pytest
+from fast_carpenter.data_import import _DATA_IMPORT_PLUGINS, get_data_import_plugin
+from fast_carpenter.data_import._uproot4 import DEFAULT_MAX_OPEN_FILES, FileHandlePool, Uproot4DataImport
+from fast_carpenter.branch_usage import BranchUsage
+from fast_carpenter.data_import._prefetch import PrefetchingTree
+from fast_carpenter.tree_adapter import ChainedTree, create_masked_multitree
+
+
+@pytest.fixture
+def data_import():
+    return Uproot4DataImport(dict(max_open_files=1))
+
+
+def test_open_single_file(data_import, test_input_file, uproot4_tree):
+    tree = data_import.open([test_input_file])["events"]
+    assert tree.num_entries == uproot4_tree.num_entries
+    assert data_import.open([test_input_file])["events"] is tree
+
+
+def test_open_multiple_files(data_import, test_input_file, uproot4_tree, tmpdir):
+    copy = str(tmpdir / "copy.root")
+    with open(test_input_file, "rb") as infile, open(copy, "wb") as outfile:
+        outfile.write(infile.read())
+
+    tree = data_import.open([test_input_file, copy])["events"]
+    n_entries = uproot4_tree.num_entries
+    assert isinstance(tree, ChainedTree)
+    assert tree.num_entries == 2 * n_entries
+    assert len(data_import.files) == 1
+
+    across_files = tree["NMuon"].array(entry_start=n_entries - 10, entry_stop=n_entries + 5)
+    expected = uproot4_tree["NMuon"].array()
+    assert np.array_equal(across_files, np.concatenate([expected[-10:], expected[:5]]))
+
+    arrays = tree.arrays(["NMuon", "Muon_Px"], entry_start=n_entries - 10, entry_stop=n_entries + 5)
+    assert np.array_equal(arrays["NMuon"], across_files)
+    assert len(arrays["Muon_Px"]) == 15
+
+
+def test_pickle_without_open_files(data_import, test_input_file):
+    data_import.open([test_input_file])["events"]
+    assert len(data_import.files) == 1
+    copied = pickle.loads(pickle.dumps(data_import))
+    assert len(copied.files) == 0
+    assert copied.max_open_files == 1
+
+
+def test_get_data_import_plugin():
+    plugin = get_data_import_plugin("uproot4", None)
+    assert isinstance(plugin, Uproot4DataImport)
+
+
+def test_create_masked_multitree(uproot4_tree):
+    n_entries = uproot4_tree.num_entries
+    tree = create_masked_multitree(dict(trees=[uproot4_tree, uproot4_tree], start=n_entries - 10,
+                                        stop=n_entries + 10, adapter="uproot4"))
+    assert tree.num_entries == 20
+    assert len(tree["NMuon"]) == 20
+
+
+def test_plugin_config(test_input_file, tmpdir):
+    cfg = tmpdir / "data_import.yml"
+    cfg.write("uproot4:\n  max_open_files: 3\n  prefetch: true\n"
+              "register:\n  my_uproot: fast_carpenter.data_import._uproot4.Uproot4DataImport\n")
+    plugin = get_data_import_plugin("my_uproot", str(cfg))
+    _DATA_IMPORT_PLUGINS.pop("my_uproot")
+    assert isinstance(plugin, Uproot4DataImport)
+    assert plugin.max_open_files == DEFAULT_MAX_OPEN_FILES
+    plugin = get_data_import_plugin("uproot4", str(cfg))
+    assert plugin.max_open_files == 3
+    assert plugin.prefetch
+    assert isinstance(plugin.open([test_input_file])["events"], PrefetchingTree)
+
+
+def test_open_with_branch_usage(data_import, test_input_file):
+    data_import.branch_usage = BranchUsage([(["NMuon > 1", "Muon_Px * not_a_branch"], [])])
+    tree = data_import.open([test_input_file])["events"]
+    assert isinstance(tree, PrefetchingTree)
+    assert list(tree.known_keys) == ["NMuon", "Muon_Px"]
+
+    tree.prefetch(0, 100)
+    _, future = tree._prefetched[(0, 100)]
+    assert future.done()
+    assert tree["Muon_Px"].array(entry_start=0, entry_stop=100) is future.result()["Muon_Px"]
+
+
+def test_pool_shared_between_threads(test_input_file, tmpdir):
+    from concurrent.futures import ThreadPoolExecutor
+    paths = [test_input_file]
+    for i in range(3):
+        copy = str(tmpdir / "copy_{}.root".format(i))
+        with open(test_input_file, "rb") as infile, open(copy, "wb") as outfile:
+            outfile.write(infile.read())
+        paths.append(copy)
+
+    pool = FileHandlePool(maxsize=2)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        trees = list(executor.map(lambda path: pool.tree(path, "events"), paths * 25))
+    assert len(pool) == 2
+    assert len(pool._trees) <= 2
+    assert all(tree.num_entries == trees[0].num_entries for tree in trees)
+
+
+def test_close_stops_prefetching(test_input_file):
+    data_import = Uproot4DataImport(dict(prefetch=True))
+    executor = data_import.executor
+    data_import.close()
+    assert executor._shutdown
+    assert data_import._executor is None
+    assert data_import.executor is not executor
+    data_import.close()
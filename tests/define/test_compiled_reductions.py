@@ -0,0 +1,46 @@
+import awkward as ak
+import numpy as np
+import pytest
+from fast_carpenter.define import compiled_reductions
+from fast_carpenter.define.reductions import JaggedNth
+from fast_carpenter.tree_adapter import ArrayMethods
+
+pytest.importorskip("numba")
+
+
+@pytest.fixture
+def jagged():
+    array = ak.Array([[0.0, 1.1, 2.2], [3.3, 4.4], [5.5], [], [9.9, -10.0, 11.0], [7.0]])
+    return ak.mask(array, np.array([True, True, False, True, True, True]))
+
+
+@pytest.mark.parametrize("method", compiled_reductions.SUPPORTED)
+def test_reduce(jagged, method):
+    expected = getattr(ak, method)(jagged, axis=1)
+    result = compiled_reductions.reduce(method, jagged)
+    assert ak.to_list(result) == pytest.approx(ak.to_list(expected))
+
+
+@pytest.mark.parametrize("index", [0, 1, -1, -2, 3])
+def test_nth(jagged, index):
+    padding = abs(index) + 1 if index >= 0 else abs(index)
+    result = compiled_reductions.nth(jagged, index, padding, np.nan, np.float64)
+    expected = ArrayMethods.fill_none(ArrayMethods.pad(jagged, padding), np.nan, axis=-1)[..., index]
+    assert ak.to_list(ak.fill_none(result, -1)) == pytest.approx(ak.to_list(ak.fill_none(expected, -1)),
+                                                                 nan_ok=True)
+
+
+def test_jagged_nth_uses_compiled(full_wrapped_masked_uproot4_tree):
+    full_wrapped_masked_uproot4_tree.reset_mask()
+    muon_px = full_wrapped_masked_uproot4_tree["Muon_Px"]
+    result = JaggedNth(0, np.nan)(muon_px)
+    assert isinstance(result.layout, ak.layout.NumpyArray)
+    assert result.layout.format == "d"
+    expected = ak.fill_none(ak.pad_none(muon_px, 1), np.nan)[:, 0]
+    assert np.allclose(ak.to_numpy(result), ak.to_numpy(expected), equal_nan=True)
+
+
+def test_not_lists():
+    assert compiled_reductions.reduce("sum", ak.Array([1, 2, 3])) is None
+    assert compiled_reductions.reduce("sum", ak.Array([[[1], [2]], []])) is None
+    assert compiled_reductions.reduce("prod", ak.Array([[1], [2]])) is None
@@ -125,3 +125,34 @@ def test_get_awkward_reduction():
     with pytest.raises(reductions.BadReductionConfig) as e_info:
         reductions.get_awkward_reduction("test_get_awkward_reduction", "non_existent_method")
     assert "Unknown method" in str(e_info.value)
+
+
+def test_without_compiled_reductions(monkeypatch):
+    import awkward as ak
+    from fast_carpenter.define import compiled_reductions
+    monkeypatch.setattr(compiled_reductions, "has_numba", False)
+    jagged = ak.Array([[1.0, 3.0], [], [2.0]])
+    assert ak.to_list(reductions.JaggedNth(1, np.nan)(jagged))[0] == 3.0
+    assert ak.to_list(reductions.JaggedMethod("max")(jagged)) == [3.0, None, 2.0]
+    assert ak.to_list(reductions.JaggedMethod("min")(jagged)) == [1.0, None, 2.0]
+
+
+@pytest.mark.parametrize("reduction, indices", [([0, 1, 2], [0, 1, 2]), ("0:3", [0, 1, 2]), ("1:6:2", [1, 3, 5]),
+                                                ([0, -1], None), ("sum", None), (0, None)])
+def test_get_indices(reduction, indices):
+    assert reductions.get_indices(reduction) == indices
+
+
+def test_jagged_nths(monkeypatch):
+    import awkward as ak
+    from fast_carpenter.define import compiled_reductions
+    jagged = ak.mask(ak.Array([[1.0, 3.0], [], [2.0], [4.0, 5.0, 6.0]]), np.array([True, True, False, True]))
+    get_three = reductions.get_awkward_reduction("test", [0, 1, 2])
+    for has_numba in (compiled_reductions.has_numba, False):
+        monkeypatch.setattr(compiled_reductions, "has_numba", has_numba)
+        columns = get_three(jagged)
+        assert len(columns) == 3
+        for index, column in enumerate(columns):
+            expected = reductions.JaggedNth(index, np.nan)(jagged)
+            assert ak.to_list(ak.fill_none(column, -1)) == pytest.approx(ak.to_list(ak.fill_none(expected, -1)),
+                                                                         nan_ok=True)
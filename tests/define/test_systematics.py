@@ -74,24 +74,59 @@ def test_normalize_one_variation():
     assert out["nominal"] == "just_a_string"
 
 
-def test_build_variations():
+def test_variation_names_and_values():
     pileup = dict(nominal="PILEUP", up="PILEUP_UP", down="PILEUP_DOWN")
     isolation = dict(nominal="Iso", up="IsoUp")
     another = dict(nominal="Blahblah", left="BlahblahLeft")
+    tree = FakeTree(PILEUP=np.arange(3), PILEUP_UP=np.arange(3) * 2, PILEUP_DOWN=np.arange(3) * 0.5,
+                    Iso=np.full(3, 3), IsoUp=np.full(3, 5), Blahblah=np.arange(1, 4), BlahblahLeft=np.arange(4, 7))
 
     all_vars = dict(pileup=pileup, isolation=isolation, another=another)
-    stage_name = "test_build_variations"
-    formulae = fast_syst._build_variations(stage_name, all_vars, out_fmt="Weight_{}_test")
-    assert len(formulae) == 5
-    assert isinstance(formulae, list)
-    assert all(map(lambda x: isinstance(x, dict) and len(x) == 1, formulae))
-    formulae = {list(i.keys())[0]: list(i.values())[0] for i in formulae}
-
-    def prep(string):
-        return set(string.split("*"))
-
-    assert prep(formulae["Weight_nominal_test"]) == prep("(PILEUP)*(Iso)*(Blahblah)")
-    assert prep(formulae["Weight_pileup_up_test"]) == prep("(PILEUP_UP)*(Iso)*(Blahblah)")
-    assert prep(formulae["Weight_pileup_down_test"]) == prep("(PILEUP_DOWN)*(Iso)*(Blahblah)")
-    assert prep(formulae["Weight_isolation_up_test"]) == prep("(PILEUP)*(IsoUp)*(Blahblah)")
-    assert prep(formulae["Weight_another_left_test"]) == prep("(PILEUP)*(Iso)*(BlahblahLeft)")
+    stage = fast_syst.SystematicWeights("test_variations", "somewhere", all_vars, out_format="Weight_{}_test",
+                                        extra_variations=["left"])
+    stage.event(FakeBEEvent(tree, "mc"))
+
+    expected = {"Weight_nominal_test": "PILEUP * Iso * Blahblah",
+                "Weight_pileup_up_test": "PILEUP_UP * Iso * Blahblah",
+                "Weight_pileup_down_test": "PILEUP_DOWN * Iso * Blahblah",
+                "Weight_isolation_up_test": "PILEUP * IsoUp * Blahblah",
+                "Weight_another_left_test": "PILEUP * Iso * BlahblahLeft"}
+    assert sorted(stage.branch_usage()[1]) == sorted(expected)
+    for name, formula in expected.items():
+        assert np.allclose(getattr(tree, name), tree.evaluate(formula))
+
+
+def test_variations_match_full_products(fake_file):
+    weights = dict(first={"nominal": "Varied1", "up": "Varied1Up"},
+                   second={"nominal": "NoVariation", "down": "Varied1__DOWN"},
+                   third="Varied1Up")
+    stage = fast_syst.SystematicWeights("factorized", "somewhere", weights)
+    stage.event(FakeBEEvent(fake_file, "mc"))
+
+    expected = {"weight_nominal": "Varied1 * NoVariation * Varied1Up",
+                "weight_first_up": "Varied1Up * NoVariation * Varied1Up",
+                "weight_second_down": "Varied1 * Varied1__DOWN * Varied1Up"}
+    for name, formula in expected.items():
+        assert np.allclose(getattr(fake_file, name), fake_file.evaluate(formula))
+    expressions, defined = stage.branch_usage()
+    assert "(Varied1Up)" in expressions
+    assert defined == ["weight_nominal", "weight_first_up", "weight_second_down"]
+
+
+def test_constant_weights(full_wrapped_masked_uproot4_tree):
+    tree = full_wrapped_masked_uproot4_tree
+    tree.reset_mask()
+    weights = dict(lumi={"nominal": "1", "up": "1.025", "down": "0.975"}, event="EventWeight")
+    stage = fast_syst.SystematicWeights("constant", "somewhere", weights)
+    stage.event(FakeBEEvent(tree, "mc"))
+
+    event_weight = np.asarray(tree["EventWeight"])
+    assert np.allclose(np.asarray(tree["weight_nominal"]), event_weight)
+    assert np.allclose(np.asarray(tree["weight_lumi_up"]), 1.025 * event_weight)
+    assert np.allclose(np.asarray(tree["weight_lumi_down"]), 0.975 * event_weight)
+
+    only_constants = fast_syst.SystematicWeights("only_constants", "somewhere",
+                                                 dict(lumi={"nominal": "1", "up": "1.025"}), out_format="lumi_{}")
+    only_constants.event(FakeBEEvent(tree, "mc"))
+    assert np.asarray(tree["lumi_nominal"]).tolist() == [1] * len(tree)
+    assert np.allclose(np.asarray(tree["lumi_lumi_up"]), 1.025)
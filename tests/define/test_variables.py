@@ -22,12 +22,79 @@ def test_calculation(name, define, mask, wrapped_tree):
     result = fast_vars.full_evaluate(wrapped_tree, **build(name, define))
 
     assert ak.count_nonzero(result) > 0
-    assert len(result) == wrapped_tree.unfiltered_num_entries
+    assert len(result) == wrapped_tree.num_entries
     if mask is None or "reduce" not in define:
         return
 
     define["mask"] = mask
     result_masked = fast_vars.full_evaluate(wrapped_tree, **build(name, define))
 
-    assert len(result_masked) == wrapped_tree.unfiltered_num_entries
+    assert len(result_masked) == wrapped_tree.num_entries
     assert ak.all(result_masked <= result)
+
+
+@pytest.mark.parametrize("masked", [False, True])
+def test_define_on_flat_contents(tmpdir, full_wrapped_masked_uproot4_tree, masked, monkeypatch):
+    import numpy as np
+    from fast_carpenter.testing import FakeBEEvent
+    tree = full_wrapped_masked_uproot4_tree
+    tree.reset_mask()
+    if masked:
+        tree.apply_mask(np.arange(tree.num_entries) % 3 > 0)
+    variables = [{"Electron_Pt": "sqrt(Electron_Px**2 + Electron_Py**2)"},
+                 {"Electron_PtOverMET": "sqrt(Electron_Px**2 + Electron_Py**2) / MET_px"},
+                 {"MET_twice": "2 * MET_px"},
+                 {"Electron_Pt2": "Electron_Pt * 2"},
+                 {"LeadElectronPt": {"reduce": 0, "formula": "Electron_Pt"}}]
+    expected = {name: ak.to_list(tree.evaluate(formula)) for var in variables
+                for name, formula in var.items() if isinstance(formula, str) and name != "Electron_Pt2"}
+
+    # every variable is computed by numexpr on the flat contents of its inputs, shared between the expressions
+    import fast_carpenter.expressions as expressions
+    from fast_carpenter.expressions import CompiledExpression
+    evaluate_flat = CompiledExpression._evaluate_flat
+    evaluate_together = fast_vars.evaluate_flat_together
+    flatten = expressions.flatten
+    not_flat, together, flattened = [], [], []
+
+    def record_evaluate_flat(self, *args):
+        result = evaluate_flat(self, *args)
+        if result is None:
+            not_flat.append(str(self))
+        return result
+
+    def record_evaluate_together(tree, group):
+        results = evaluate_together(tree, group)
+        together.append([str(expression) for expression, result in zip(group, results) if result is not None])
+        return results
+
+    def record_flatten(array, cache=None):
+        flattened.append(id(array))
+        return flatten(array, cache)
+    monkeypatch.setattr(CompiledExpression, "_evaluate_flat", record_evaluate_flat)
+    monkeypatch.setattr(fast_vars, "evaluate_flat_together", record_evaluate_together)
+    monkeypatch.setattr(expressions, "flatten", record_flatten)
+    fast_vars.Define("flat", str(tmpdir), variables).event(FakeBEEvent(tree, "data"))
+    assert not_flat == []
+    # the first three variables are independent, and flatten each of their three inputs once
+    assert together == [[formula for var in variables[:3] for formula in var.values()]]
+    assert len(flattened) == 3 + 2
+
+    for name, values in expected.items():
+        assert ak.to_list(tree[name]) == values
+    assert ak.to_list(tree["Electron_Pt2"]) == ak.to_list(tree["Electron_Pt"] * 2)
+
+
+def test_define_several_indices(tmpdir, full_wrapped_masked_uproot4_tree):
+    import numpy as np
+    from fast_carpenter.testing import FakeBEEvent
+    tree = full_wrapped_masked_uproot4_tree
+    define = fast_vars.Define("leading", str(tmpdir), [{"Jet{}_Px": {"reduce": "0:3", "formula": "Jet_Px"}},
+                                                       {"Muon_Px": {"reduce": [0, 1], "formula": "Muon_Px * 2"}}])
+    assert define.branch_usage()[1] == ["Jet0_Px", "Jet1_Px", "Jet2_Px", "Muon_Px_0", "Muon_Px_1"]
+    define.event(FakeBEEvent(tree, "data"))
+
+    for index in range(3):
+        expected = fast_vars.full_evaluate(tree, "Jet_Px", np.nan, reduction=fast_vars.get_awkward_reduction("", index))
+        assert ak.to_list(tree["Jet{}_Px".format(index)]) == pytest.approx(ak.to_list(expected), nan_ok=True)
+    assert len(tree["Muon_Px_1"]) == tree.num_entries
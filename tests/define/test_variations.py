@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from fast_carpenter.define.variables import Define
+from fast_carpenter.define import variations as fast_vary
+from fast_carpenter.selection.stage import CutFlow
+from fast_carpenter.testing import FakeBEEvent
+from fast_carpenter.tree_adapter import ArrayMethods
+
+
+def build_sequence(tmpdir, muon_px="Muon_Px", suffix=""):
+    return [
+        Define("scale" + suffix, str(tmpdir), [{"Muon_Px_up" + suffix: "Muon_Px * 1.5"}]),
+        fast_vary.ShapeVariations("muon_scale", str(tmpdir), {"Muon_Px": {"up": "Muon_Px_up"}}),
+        Define("muons" + suffix, str(tmpdir), [{"Muon_Pt" + suffix: "sqrt({} ** 2 + Muon_Py ** 2)".format(muon_px)},
+                                               {"LeadMuonPt" + suffix: {"reduce": 0, "formula": "Muon_Pt" + suffix}}]),
+        Define("jets" + suffix, str(tmpdir), [{"NJetTwice" + suffix: "NJet * 2"}]),
+        CutFlow("cuts" + suffix, str(tmpdir), selection="LeadMuonPt{} > 20".format(suffix)),
+        CutFlow("more_cuts" + suffix, str(tmpdir), selection="NJetTwice{} > 2".format(suffix)),
+    ]
+
+
+def test_rename_variables():
+    renames = {"Jet_Pt": "Jet_Pt_up", "HT": "HT__up"}
+    assert fast_vary.rename_variables("HT + sqrt(Jet_Pt ** 2) > Jet_PtMin", renames) == \
+        "HT__up + sqrt(Jet_Pt_up ** 2) > Jet_PtMin"
+
+
+def test_bad_config(tmpdir):
+    with pytest.raises(fast_vary.BadShapeVariationsConfig):
+        fast_vary.ShapeVariations("bad", str(tmpdir), {"Muon_Px": "Muon_Px_up"})
+    with pytest.raises(fast_vary.BadShapeVariationsConfig):
+        fast_vary.ShapeVariations("bad", str(tmpdir), {"Muon_Px": {"up": ["Muon_Px_up"]}})
+
+
+def test_expand_shape_variations(tmpdir):
+    sequence = fast_vary.expand_shape_variations(build_sequence(tmpdir))
+    assert [stage.name for stage in sequence] == [
+        "scale", "muons", "muons__muon_scale_up", "jets",
+        "cuts__begin_muon_scale_up", "cuts__muon_scale_up", "more_cuts__muon_scale_up", "cuts__end_muon_scale_up",
+        "cuts", "more_cuts"]
+    assert sequence[2].branch_usage() == (["sqrt(Muon_Px_up ** 2 + Muon_Py ** 2)", "Muon_Pt__muon_scale_up"],
+                                          ["Muon_Pt__muon_scale_up", "LeadMuonPt__muon_scale_up"])
+    # the unaffected jets stage is only repeated after the selection depending on the variation
+    assert sequence[6].branch_usage() == (["NJetTwice > 2"], [])
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_variation_matches_full_sequence(tmpdir, full_wrapped_masked_uproot4_tree,
+                                         full_wrapped_compact_uproot4_tree, compact):
+    tree = full_wrapped_compact_uproot4_tree if compact else full_wrapped_masked_uproot4_tree
+    tree.reset_mask()
+    chunk = FakeBEEvent(tree, "data")
+    sequence = fast_vary.expand_shape_variations(build_sequence(tmpdir))
+    for stage in sequence:
+        stage.event(chunk)
+    expanded = {stage.name: stage for stage in sequence}
+    nominal_selected = tree.count_nonzero()
+
+    # the nominal and varied sequences, written out in full
+    tree.reset_mask()
+    for stage in build_sequence(tmpdir, suffix="_nominal"):
+        stage.event(chunk)
+    assert tree.count_nonzero() == nominal_selected
+    tree.reset_mask()
+    reference = build_sequence(tmpdir, muon_px="Muon_Px_up_varied", suffix="_varied")
+    for stage in reference:
+        stage.event(chunk)
+
+    assert np.array_equal(ArrayMethods.fill_none(tree["LeadMuonPt__muon_scale_up"], -1).to_numpy(),
+                          ArrayMethods.fill_none(tree["LeadMuonPt_varied"], -1).to_numpy())
+    for name, stage in zip(("cuts", "more_cuts"), reference[-2:]):
+        varied = expanded[name + "__muon_scale_up"].selection.to_dataframe()
+        assert np.array_equal(varied.values, stage.selection.to_dataframe().values)
+    assert not np.array_equal(expanded["cuts"].selection.to_dataframe().values,
+                              expanded["cuts__muon_scale_up"].selection.to_dataframe().values)
@@ -202,3 +202,28 @@ def test_event_removal_3(config_3, monkeypatch):
     assert variables["NElectron"][mask].min() == 2.1
     assert variables["NJet"][mask].max() == -2.2
     assert variables["NJet"][mask].min() == -18
+
+
+def test_counter_increments(full_wrapped_tree, monkeypatch):
+    calls = []
+    extract_weights = filters.extract_weights
+
+    def counting_extract_weights(*args, **kwargs):
+        calls.append(args)
+        return extract_weights(*args, **kwargs)
+    monkeypatch.setattr(filters, "extract_weights", counting_extract_weights)
+
+    counters = [filters.Counter(["EventWeight"]) for _ in range(3)]
+    increments = filters.CounterIncrements(full_wrapped_tree, ["EventWeight"], is_mc=True)
+    increments.max_block_elements = len(full_wrapped_tree)
+    n_muon = full_wrapped_tree["NMuon"].to_numpy()
+    increments.add(counters[0])
+    increments.add(counters[1], n_muon > 1)
+    increments.add(counters[2], np.zeros(len(n_muon), dtype=bool))
+    increments.fill()
+    assert len(calls) == 1
+
+    weights = full_wrapped_tree["EventWeight"].to_numpy()
+    assert counters[0].counts == (4580, pytest.approx(weights.sum(), 1e-6))
+    assert counters[1].counts == (289, pytest.approx(weights[n_muon > 1].sum(), 1e-6))
+    assert counters[2].counts == (0, 0)
@@ -179,3 +179,79 @@ def test_sequential_stages(fake_data_events, tmpdir):
     assert fake_data_events.count_nonzero() == 2
     jet_py = fake_data_events.tree.array("Jet_Py")
     assert pytest.approx(ArrayMethods.flatten(jet_py)) == [49.641838, 45.008915, -78.01798, 60.730812]
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_cutflow_short_circuit(tmpdir, full_wrapped_masked_uproot4_tree, full_wrapped_compact_uproot4_tree, compact):
+    import numpy as np
+    from fast_carpenter.testing import FakeBEEvent
+    tree = full_wrapped_compact_uproot4_tree if compact else full_wrapped_masked_uproot4_tree
+    selection = {"All": ["NMuon > 1",
+                         {"Any": ["NJet > 1", "MET_px > 10", {"reduce": 0, "formula": "Muon_Px > 5"}]},
+                         "NElectron == 0"]}
+
+    tables, masks = {}, {}
+    for short_circuit in (None, 1.0):
+        tree.reset_mask()
+        cutflow = stage.CutFlow("cutflow_short_circuit", str(tmpdir), selection=selection,
+                                weights="EventWeight", short_circuit=short_circuit)
+        masks[short_circuit] = cutflow.selection(tree, is_mc=True)
+        cutflow.event(FakeBEEvent(tree, "mc"))
+        tables[short_circuit] = cutflow.selection.to_dataframe()
+
+    def as_bool(mask):
+        return ArrayMethods.fill_none(mask, False).to_numpy()
+    assert np.array_equal(as_bool(masks[None]), as_bool(masks[1.0]))
+
+    full, shorted = tables[None], tables[1.0]
+    for column in ("passed_incl", "totals_incl"):
+        assert np.allclose(full[column].values, shorted[column].values)
+    assert (shorted["passed_only_cut"].values <= full["passed_only_cut"].values + 1e-6).all()
+    assert (shorted["passed_only_cut"].values < full["passed_only_cut"].values).any()
+
+
+def test_cutflow_short_circuit_bad_config(tmpdir):
+    with pytest.raises(stage.BadCutflowConfig) as e:
+        stage.CutFlow("cutflow_bad", str(tmpdir), selection="NMuon > 1", short_circuit=2)
+    assert "short_circuit" in str(e)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_cutflow_optimize(tmpdir, full_wrapped_masked_uproot4_tree, full_wrapped_compact_uproot4_tree, compact):
+    import numpy as np
+    tree = full_wrapped_compact_uproot4_tree if compact else full_wrapped_masked_uproot4_tree
+    selection = {"All": ["NMuon > 1", "NJet > 1", "NElectron == 0", {"reduce": 0, "formula": "Muon_Px > 5"}]}
+
+    tree.reset_mask()
+    reference = stage.CutFlow("cutflow_reference", str(tmpdir), selection=selection, weights="EventWeight")
+    expected_mask = reference.selection(tree, is_mc=True)
+    expected = reference.selection.to_dataframe()
+
+    cutflow = stage.CutFlow("cutflow_optimize", str(tmpdir), selection=selection,
+                            weights="EventWeight", optimize=1)
+    cutflow.selection(tree, is_mc=True)
+    order = cutflow.selection.evaluation_order
+    assert sorted(order) == [0, 1, 2, 3]
+
+    mask = cutflow.selection(tree, is_mc=True)
+    assert np.array_equal(ArrayMethods.fill_none(expected_mask, False).to_numpy(), mask)
+
+    table = cutflow.selection.to_dataframe()
+    assert list(table.index) == list(expected.index)
+    # the All itself is counted as before, its reordered cuts are no longer known in the declared order
+    assert np.allclose(table.values[0], 2 * expected.values[0])
+    assert np.isnan(table.values[1:]).all()
+
+    other = stage.CutFlow("cutflow_optimize", str(tmpdir), selection=selection,
+                          weights="EventWeight", optimize=1)
+    other.selection(tree, is_mc=True)
+    other.merge(cutflow)
+    merged = other.selection.to_dataframe()
+    assert np.allclose(merged.values[0], 3 * expected.values[0])
+    assert np.isnan(merged.values[1:]).all()
+
+
+def test_cutflow_optimize_bad_config(tmpdir):
+    with pytest.raises(stage.BadCutflowConfig) as e:
+        stage.CutFlow("cutflow_bad", str(tmpdir), selection="NMuon > 1", optimize=0)
+    assert "optimize" in str(e)
@@ -1,5 +1,6 @@
 import pandas as pd
 import copy
+import pickle
 import numpy as np
 import pytest
 import fast_carpenter.summary.binned_dataframe as bdf
@@ -245,48 +246,6 @@ def test_BinnedDataframe_numexpr_similar_branch(binned_df_3, tmpdir, full_wrappe
     assert mean == pytest.approx(44.32584)
 
 
-def test_explode():
-    df = pd.DataFrame({'A': [[1, 2, 3], [9], [], [3, 4]], 'B': 1})
-    exploded = bdf.explode(df)
-    assert len(exploded) == 6
-    assert all(df.B == 1)
-    assert not df.isnull().any().any()
-
-    df["C"] = df.A.copy()
-    exploded = bdf.explode(df)
-    assert len(exploded) == 6
-    assert all(df.B == 1)
-    assert all(df.A == df.C)
-
-    df["D"] = [[1], [3], [4, 5], []]
-    with pytest.raises(ValueError) as e:
-        exploded = bdf.explode(df)
-    assert "different jaggedness" in str(e)
-
-    df2 = pd.DataFrame({'A': [[np.arange(i + 1) + j for i in range((j % 2) + 1)] for j in range(4)],
-                        'B': np.arange(4)[::-1],
-                        })
-    exploded = bdf.explode(df2)
-    assert len(exploded) == 8
-
-    df = pd.DataFrame({'number': [1, 8, 3], 'string': ['one', 'eight', 'three']})
-    exploded = bdf.explode(df)
-    assert len(exploded) == 3
-
-    df["list"] = [list(range(i)) for i in df.number]
-    exploded = bdf.explode(df)
-    assert len(exploded) == 1 + 8 + 3
-    assert np.array_equal(exploded.list, [0, 0, 1, 2, 3, 4, 5, 6, 7, 0, 1, 2])
-
-    exploded = bdf.explode(pd.DataFrame(columns=["one", "two", "3"]))
-    assert exploded.empty is True
-
-    df.index = np.arange(len(df)) + 100
-    exploded = bdf.explode(df)
-    assert len(exploded) == 1 + 8 + 3
-    assert np.array_equal(exploded.list, [0, 0, 1, 2, 3, 4, 5, 6, 7, 0, 1, 2])
-
-
 def test_densify_dataframe_integers():
     index = [("one", 1), ("one", 3), ("two", 2), ("three", 1), ("three", 2)]
     index = pd.MultiIndex.from_tuples(index, names=["foo", "bar"])
@@ -312,3 +271,116 @@ def test_densify_dataframe_intervals():
     assert out_df.loc[("two", pd.Interval(1, 2))].isna().all()
     assert out_df.loc[("two", pd.Interval(3, 4))].isna().all()
     assert out_df.loc[("three", pd.Interval(3, 4))].isna().all()
+
+
+@pytest.mark.parametrize("observed", [True, False])
+@pytest.mark.parametrize("eventtype", ["mc", "data"])
+def test_BinnedDataframe_numpy_engine(config_2, input_tree, observed, eventtype):
+    chunk = FakeBEEvent(input_tree, eventtype)
+    results = {}
+    for engine in ("pandas", "numpy"):
+        binned_dfs = [bdf.BinnedDataframe("binned_df_" + engine, out_dir="somewhere",
+                                          observed=observed, engine=engine, **config_2)
+                      for _ in range(2)]
+        for binned_df in binned_dfs:
+            binned_df.event(chunk)
+        binned_dfs[0].merge(binned_dfs[1])
+        dataset_readers_list = (("test_dataset", (binned_dfs[0],)),)
+        results[engine] = binned_dfs[0].collector()._prepare_output(dataset_readers_list)
+
+    assert results["numpy"]["n"].sum() == 4616 * 2
+    pd.testing.assert_frame_equal(results["numpy"].sort_index(), results["pandas"].sort_index(), check_dtype=False)
+
+
+@pytest.mark.parametrize("engine", ["pandas", "numpy"])
+def test_BinnedDataframe_engine_with_weights(config_1, input_tree, monkeypatch, engine):
+    calls = {"groupby": 0, "bincount": 0}
+
+    def counting(name, function):
+        def counted(*args, **kwargs):
+            calls[name] += 1
+            return function(*args, **kwargs)
+        return counted
+    monkeypatch.setattr(bdf, "_bin_values", counting("groupby", bdf._bin_values))
+    monkeypatch.setattr(bdf.BinnedAccumulator, "fill", counting("bincount", bdf.BinnedAccumulator.fill))
+
+    binned_df = bdf.BinnedDataframe("binned_df_1", out_dir="somewhere", engine=engine, **config_1)
+    binned_df.event(FakeBEEvent(input_tree, "mc"))
+    assert calls == ({"groupby": 1, "bincount": 0} if engine == "pandas" else {"groupby": 0, "bincount": 1})
+    assert binned_df.contents["EventWeight:sumw"].sum() == pytest.approx(231.91339)
+
+
+def test_BinnedDataframe_bad_engine(config_1):
+    with pytest.raises(bdf.cfg.BadBinnedDataframeConfig) as e:
+        bdf.BinnedDataframe("binned_df_1", out_dir="somewhere", engine="fortran", **config_1)
+    assert "engine" in str(e)
+
+
+def test_BinnedAccumulator_merge_in_place(config_1, input_tree):
+    chunk = FakeBEEvent(input_tree, "mc")
+    binned_df = make_binned_df_1(config_1)
+    binned_df.event(chunk)
+    other = pickle.loads(pickle.dumps(make_binned_df_1(dict(config_1, engine="numpy"))))
+    other.event(chunk)
+
+    sums = binned_df._accumulator.sums[()]
+    assert sums.shape == (31 * 4, 3)
+    binned_df.merge(other)
+    assert binned_df._accumulator.sums[()] is sums
+    assert binned_df.contents["n"].sum() == 4616 * 2
+
+
+def test_BinnedAccumulator_merge_into_empty(config_1, input_tree):
+    chunk = FakeBEEvent(input_tree, "mc")
+    binned_df = make_binned_df_1(config_1)
+    other = make_binned_df_1(config_1)
+    other.event(chunk)
+    binned_df.merge(other)
+    binned_df.event(chunk)
+    assert binned_df.contents["n"].sum() == 4616 * 2
+    assert other.contents["n"].sum() == 4616
+
+
+def test_flatten_arrays():
+    import awkward as ak
+    arrays = dict(jagged=ak.Array([[1, 2], [], None, [3]]),
+                  flat=ak.Array([10, 20, 30, 40]))
+    flattened = bdf.flatten_arrays(arrays)
+    assert flattened["jagged"].tolist() == [1, 2, 3]
+    assert flattened["flat"].tolist() == [10, 10, 40]
+
+    arrays["other"] = ak.Array([[1], [], [], [1, 2]])
+    with pytest.raises(ValueError) as e:
+        bdf.flatten_arrays(arrays)
+    assert "jaggedness" in str(e)
+
+
+def test_BinnedAccumulator_many_weights(monkeypatch):
+    rng = np.random.default_rng(3)
+    values = [rng.uniform(-1, 11, 1000), rng.integers(0, 3, 1000)]
+    weights = [rng.normal(1, 0.2, 1000) for _ in range(5)]
+    binning = pd.IntervalIndex.from_breaks(np.arange(0, 11, 2), closed="left")
+    names = ["w{}".format(i) for i in range(5)]
+
+    expected = bdf._bin_values(pd.DataFrame(dict(x=values[0], cat=values[1], **dict(zip(names, weights)))),
+                               dimensions=["x", "cat"], binnings=[np.arange(0, 11, 2), None],
+                               weights=names, observed=True)
+
+    monkeypatch.setattr(bdf.BinnedAccumulator, "max_block_elements", 1000)
+    accumulator = bdf.BinnedAccumulator(["x_bins", "cat"], [binning, None], weights=names)
+    accumulator.fill(values, weights)
+    result = accumulator.to_dataframe(observed=True)
+
+    assert list(result.columns) == list(expected.columns)
+    assert np.allclose(result.sort_index().values, expected.sort_index().values)
+
+
+def test_BinnedDataframe_arrow_view(binned_df_3, full_wrapped_tree, monkeypatch):
+    pytest.importorskip("pyarrow")
+    chunk = FakeBEEvent(full_wrapped_tree, "mc")
+    binned_df_3.event(chunk)
+    monkeypatch.setattr(bdf, "has_pyarrow", False)
+    without_arrow = copy.deepcopy(binned_df_3)
+    without_arrow._accumulator = None
+    without_arrow.event(chunk)
+    assert binned_df_3.contents.equals(without_arrow.contents)
@@ -1,6 +1,84 @@
+import awkward as ak
+import numpy as np
+import pandas as pd
+import pytest
 import fast_carpenter.summary.event_level_dataframe as edf
+from fast_carpenter.testing import FakeBEEvent
 
 
-def test_EventByEventDataframe(tmpdir):
-    # TODO: Make this a proper set of tests
-    assert hasattr(edf, "Collector")
+pytest.importorskip("pyarrow")
+
+
+def make_chunk(tree):
+    chunk = FakeBEEvent(tree, "mc")
+    chunk.config.dataset.name = "mc"
+    chunk.config.inputPaths = ["data.root"]
+    return chunk
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_EventByEventDataframe(tmpdir, full_wrapped_masked_uproot4_tree, full_wrapped_compact_uproot4_tree,
+                               compact):
+    tree = full_wrapped_compact_uproot4_tree if compact else full_wrapped_masked_uproot4_tree
+    tree.reset_mask()
+    selected = np.count_nonzero(tree["NMuon"].to_numpy() > 1)
+    tree.apply_mask(tree["NMuon"].to_numpy() > 1)
+    chunk = make_chunk(tree)
+
+    stage = edf.EventByEventDataframe("muons", str(tmpdir), ["NMuon", "Muon_Px"], flatten=False)
+    stage.event(chunk)
+    stage.event(chunk)
+    other = edf.EventByEventDataframe("muons", str(tmpdir), ["NMuon", "Muon_Px"], flatten=False)
+    other.event(chunk)
+    stage.merge(other)
+
+    manifest = stage.collector().collect([("mc", [stage])])
+    assert len(manifest) == 2
+    assert manifest.nrows.tolist() == [2 * selected, selected]
+    assert pd.read_csv(tmpdir / "df_muons-manifest.csv").equals(manifest)
+
+    df = pd.read_parquet(manifest.path[0])
+    assert len(df) == 2 * selected
+    assert (df.NMuon > 1).all()
+    assert df.Muon_Px.map(len).tolist() == df.NMuon.tolist()
+    assert "hashed_filename" in df.columns
+
+
+def test_EventByEventDataframe_flatten(tmpdir, full_wrapped_masked_uproot4_tree):
+    tree = full_wrapped_masked_uproot4_tree
+    tree.reset_mask()
+    chunk = make_chunk(tree)
+    tree.new_variable("Muon_IsFirst", ak.local_index(tree["Muon_Px"]) == 0)
+    tree.new_variable("HasMuons", tree["NMuon"] > 0)
+
+    stage = edf.EventByEventDataframe("muons", str(tmpdir), ["NMuon", "Muon_Px", "Muon_IsFirst"],
+                                      mask="HasMuons")
+    stage.event(chunk)
+    stage.end()
+    df = pd.read_parquet(stage.files[0][1])
+    assert len(df) == tree["NMuon"].to_numpy().sum()
+    assert df.Muon_IsFirst.sum() == np.count_nonzero(tree["NMuon"].to_numpy() > 0)
+
+
+def test_EventByEventDataframe_copy(tmpdir, full_wrapped_masked_uproot4_tree):
+    import copy
+    import pickle
+    tree = full_wrapped_masked_uproot4_tree
+    tree.reset_mask()
+    chunk = make_chunk(tree)
+
+    stage = edf.EventByEventDataframe("muons", str(tmpdir), ["NMuon"])
+    stage.event(chunk)
+    for copied in (copy.deepcopy(stage), pickle.loads(pickle.dumps(stage))):
+        assert copied._writer is None
+        assert copied.files == stage.files
+        # the files listed by a copy are complete
+        for _, path, nrows in copied.files:
+            assert len(pd.read_parquet(path)) == nrows
+    stage.event(chunk)
+    assert len(stage.files) == 2
+
+    manifest = stage.collector().collect([("mc", [stage])])
+    assert stage._writer is None
+    assert manifest.nrows.tolist() == [len(tree), len(tree)]
+    assert all(len(pd.read_parquet(path)) == len(tree) for path in manifest.path)
@@ -0,0 +1,102 @@
+import pickle
+import numpy as np
+import pytest
+import fast_carpenter.summary.binned_dataframe as bdf
+from fast_carpenter.summary.binning_config import BadBinnedDataframeConfig
+from . import dummy_binning_descriptions as binning
+from ..conftest import FakeBEEvent
+
+bh = pytest.importorskip("boost_histogram")
+import fast_carpenter.summary.histogram as fast_hist  # noqa: E402
+
+
+@pytest.fixture
+def config():
+    return dict(binning=[binning.bins_met_px, binning.bins_nmuon], weights=binning.weight_dict)
+
+
+def test_BuildHistogram_config(config):
+    stage = fast_hist.BuildHistogram("hist", "somewhere", **config)
+    assert [axis.name for axis in stage._axes] == ["met_px", "nmuon"]
+    assert isinstance(stage._axes[1], bh.axis.IntCategory)
+    assert stage.branch_usage() == (["MET_px", "NMuon", "EventWeight"], [])
+
+    with pytest.raises(BadBinnedDataframeConfig):
+        fast_hist.BuildHistogram("hist", "somewhere", file_format="root", **config)
+
+
+def test_BuildHistogram_matches_BinnedDataframe(config, tmpdir, full_wrapped_tree):
+    chunk = FakeBEEvent(full_wrapped_tree, "mc")
+    stage = fast_hist.BuildHistogram("hist", str(tmpdir), file_format=["pickle", "hdf5"], **config)
+    stage.event(chunk)
+    other = fast_hist.BuildHistogram("hist", str(tmpdir), **config)
+    other.event(chunk)
+    stage.merge(other)
+
+    binned = bdf.BinnedDataframe("binned", str(tmpdir), **config)
+    binned.event(chunk)
+    expected = binned.contents.groupby(level="met_px").sum()
+
+    histograms = stage.histograms
+    assert set(histograms) == {"n", "weighted"}
+    counts = histograms["n"].view(flow=True).sum(axis=1)
+    assert counts == pytest.approx(2 * expected["n"].values)
+    weighted = histograms["weighted"].view(flow=True).value.sum(axis=1)
+    assert weighted == pytest.approx(2 * expected["weighted:sumw"].values)
+
+    output = stage.collector().collect([("test_dataset", [stage])])
+    assert output["test_dataset"]["n"] == histograms["n"]
+    with open(str(tmpdir / "hist_dataset.met_px.nmuon--hist.pkl"), "rb") as infile:
+        assert pickle.load(infile)["test_dataset"]["weighted"] == histograms["weighted"]
+
+    h5py = pytest.importorskip("h5py")
+    with h5py.File(str(tmpdir / "hist_dataset.met_px.nmuon--hist.h5"), "r") as infile:
+        group = infile["test_dataset/weighted"]
+        assert np.array_equal(group["value"][()], histograms["weighted"].view(flow=True).value)
+        assert group["axis_0"].attrs["name"] == "met_px"
+        assert len(group["axis_0/edges"]) == 30
+
+
+def test_BuildHistogram_mean(tmpdir, full_wrapped_tree):
+    chunk = FakeBEEvent(full_wrapped_tree, "data")
+    stage = fast_hist.BuildHistogram("hist", str(tmpdir), binning=[binning.bins_nmuon], mean="MET_px",
+                                     weights="EventWeight", dataset_col=False)
+    stage.event(chunk)
+    assert set(stage.histograms) == {"n"}
+    output = stage.collector().collect([("data1", [stage]), ("data2", [stage])], writeFiles=False)
+    assert output["n"].view().count.sum() == 2 * len(full_wrapped_tree)
+    met = full_wrapped_tree["MET_px"].to_numpy()
+    nmuon = full_wrapped_tree["NMuon"].to_numpy()
+    assert output["n"][bh.loc(0)].value == pytest.approx(met[nmuon == 0].mean())
+
+
+@pytest.mark.parametrize("mc_first", [True, False])
+def test_BuildHistogram_mixed_data_mc(config, tmpdir, full_wrapped_tree, mc_first):
+    data = fast_hist.BuildHistogram("hist", str(tmpdir), dataset_col=False, **config)
+    data.event(FakeBEEvent(full_wrapped_tree, "data"))
+    mc = fast_hist.BuildHistogram("hist", str(tmpdir), dataset_col=False, **config)
+    mc.event(FakeBEEvent(full_wrapped_tree, "mc"))
+    assert set(data.histograms) == {"n"}
+    assert set(mc.histograms) == {"n", "weighted"}
+    expected_weighted = mc.histograms["weighted"].copy()
+
+    readers = [("mc", [mc]), ("data", [data])]
+    output = mc.collector().collect(readers if mc_first else readers[::-1], writeFiles=False)
+    assert set(output) == {"n", "weighted"}
+    assert output["n"].sum(flow=True) == 2 * len(full_wrapped_tree)
+    assert output["weighted"] == expected_weighted
+
+
+def test_BuildHistogram_categories(tmpdir, full_wrapped_tree):
+    chunk = FakeBEEvent(full_wrapped_tree, "data")
+    stage = fast_hist.BuildHistogram("hist", str(tmpdir), binning=[{"in": "NMuon * 1.0", "out": "nmuon"}])
+    stage.event(chunk)
+    assert stage.histograms["n"].sum() == len(full_wrapped_tree)
+
+    stage = fast_hist.BuildHistogram("hist", str(tmpdir), binning=[{"in": "NMuon / 2", "out": "nmuon"}])
+    with pytest.raises(BadBinnedDataframeConfig) as e:
+        stage.event(chunk)
+    assert "NMuon / 2" in str(e.value)
+
+    with pytest.raises(BadBinnedDataframeConfig):
+        fast_hist._as_categories("hist", "x", np.array([1., np.nan]))
@@ -0,0 +1,37 @@
+import fast_carpenter.summary.binned_dataframe as bdf
+from fast_carpenter.branch_usage import BranchUsage, sequence_branch_usage
+from fast_carpenter.define.systematics import SystematicWeights
+from fast_carpenter.define.variables import Define
+from fast_carpenter.selection.stage import CutFlow, SelectPhaseSpace
+
+
+def test_sequence_branch_usage(uproot4_tree):
+    sequence = [
+        Define("define", "somewhere", [{"Muon_Pt": "sqrt(Muon_Px ** 2 + Muon_Py ** 2)"},
+                                       {"NIsoMuon": {"reduce": "count_nonzero", "formula": "Muon_Iso < 0.1"}},
+                                       {"LeadJetPx": {"reduce": 0, "formula": "Jet_Px", "mask": "Jet_Py > 0"}}]),
+        SystematicWeights("weights", "somewhere", {"energy": "EventWeight"}),
+        SelectPhaseSpace("region", "somewhere", region_name="signal", selection="NIsoMuon > 0"),
+        CutFlow("cuts", "somewhere", selection={"All": ["signal", "NMuon > 1",
+                                                        {"reduce": 0, "formula": "Muon_Pt > 20"}]},
+                weights="weight_nominal"),
+        bdf.BinnedDataframe("binned", "somewhere", binning=[{"in": "MET_px"}, {"in": "Muon_Pt"}],
+                            weights="weight_nominal"),
+    ]
+    usage = sequence_branch_usage(sequence)
+    assert isinstance(usage, BranchUsage)
+
+    branches = usage.branches(uproot4_tree.keys())
+    assert set(branches) == {"Muon_Px", "Muon_Py", "Muon_Iso", "Jet_Px", "Jet_Py", "EventWeight", "NMuon", "MET_px"}
+
+
+def test_sequence_branch_usage_undeclared():
+    class NoUsage(object):
+        name = "no_usage"
+
+    assert sequence_branch_usage([NoUsage()]) is None
+
+
+def test_branch_usage_skips_defined():
+    usage = BranchUsage([(["a + b"], ["c"]), (["c * d"], [])])
+    assert usage.branches(["a", "b", "c", "d"]) == ["a", "b", "d"]
@@ -22,7 +22,7 @@ def test_get_branches(input_tree):
 def test_evaluate(wrapped_tree):
     Muon_py, Muon_pz = wrapped_tree.arrays(["Muon_Py", "Muon_Pz"], outputtype=tuple)
     mu_pt = expressions.evaluate(wrapped_tree, "sqrt(Muon_Px**2 + Muon_Py**2)")
-    assert len(mu_pt) == 4580
+    assert len(mu_pt) == 100
     assert ArrayMethods.filtered_len(mu_pt) == 100
     assert all(ArrayMethods.counts(mu_pt) == ArrayMethods.counts(Muon_py))
 
@@ -113,8 +113,121 @@ def test_preprocess_expression(input, expected):
     assert alias_dict == expected[1]
 
 
+@pytest.mark.parametrize("expression, value", [("1", 1), ("2 * 3", 6), ("1.025", 1.025), ("2 * pi", 2 * np.pi)])
+def test_constant_expression(full_wrapped_tree, expression, value):
+    result = expressions.evaluate(full_wrapped_tree, expression)
+    assert len(result) == len(full_wrapped_tree)
+    assert ArrayMethods.all(result == value, axis=None)
+
+    columns = {"NMuon": np.arange(5)}
+    assert len(expressions.evaluate(columns, expression)) == 5
+    with pytest.raises(ValueError):
+        expressions.evaluate({}, expression)
+
+
 def test_broadcast(wrapped_tree):
     expressions.evaluate(wrapped_tree, "NJet * Jet_Py + NElectron * Jet_Px")
 
     with pytest.raises(ValueError):
         expressions.evaluate(wrapped_tree, "Jet_Py + Muon_Px")
+
+
+def test_compile_expression_cached():
+    compiled = expressions.compile_expression("sqrt(Muon.Px**2 + Muon_Py**2) * pi")
+    assert expressions.compile_expression("sqrt(Muon.Px**2 + Muon_Py**2) * pi") is compiled
+    assert expressions.compile_expression(compiled) is compiled
+    assert compiled == "sqrt(Muon.Px**2 + Muon_Py**2) * pi"
+    assert compiled.cleaned == "sqrt(Muon__DOT__Px**2 + Muon_Py**2) * pi"
+    assert sorted(compiled.branches) == ["Muon.Px", "Muon_Py"]
+
+
+def test_compile_expression_bounded(monkeypatch):
+    from cachetools import LRUCache
+    monkeypatch.setattr(expressions, "_compiled_expressions", LRUCache(2))
+    first = expressions.compile_expression("NMuon > 1")
+    for i in range(3):
+        expressions.compile_expression("NMuon > {}".format(i + 2))
+    assert len(expressions._compiled_expressions) == 2
+    assert expressions.compile_expression("NMuon > 1") is not first
+
+
+def test_compiled_expression_reuses_program(full_wrapped_tree):
+    compiled = expressions.compile_expression("Muon_Px * NMuon > 0.3")
+    first = expressions.evaluate(full_wrapped_tree, compiled)
+    assert len(compiled._programs) == 1
+    second = expressions.evaluate(full_wrapped_tree, compiled)
+    assert len(compiled._programs) == 1
+    assert ArrayMethods.all(first == second, axis=None)
+
+    expected = full_wrapped_tree.evaluate("Muon_Px * NMuon > 0.3")
+    assert ArrayMethods.all(first == expected, axis=None)
+
+
+def test_compiled_expression_pickle():
+    import pickle
+    import numexpr
+    compiled = expressions.compile_expression("NMuon > 1")
+    compiled.program((("NMuon", numexpr.necompiler.getType(np.arange(3))),))
+    copied = pickle.loads(pickle.dumps(compiled))
+    assert copied == compiled
+    assert copied.names == compiled.names
+    assert copied._programs == {}
+
+
+@pytest.mark.parametrize("expression", ["Muon_Px * NMuon > 0.3", "sqrt(Jet_Px**2 + Jet_Py**2) * MET_px", "NJet * 2"])
+def test_evaluate_flat_matches_broadcast(full_wrapped_masked_uproot4_tree, expression):
+    import awkward as ak
+    tree = full_wrapped_masked_uproot4_tree
+    tree.apply_mask(np.arange(tree.num_entries) % 4 > 0)
+    compiled = expressions.compile_expression(expression)
+    flat = compiled.evaluate(tree)
+    assert ak.to_list(flat) == ak.to_list(tree.evaluate(expression))
+    assert flat.layout.__class__.__name__ == "IndexedOptionArray64"
+
+
+def test_flatten_cached(full_wrapped_masked_uproot4_tree):
+    tree = full_wrapped_masked_uproot4_tree
+    cache = tree.flattened_cache
+    tree.apply_mask(np.arange(tree.num_entries) % 2 > 0)
+    assert tree["Muon_Px"] is tree["Muon_Px"]
+    valid, offsets, contents = expressions.flatten(tree["Muon_Px"], cache)
+    assert expressions.flatten(tree["Muon_Px"], cache)[2] is contents
+    assert expressions.flatten(tree["Muon_Px"])[2] is not contents
+    assert np.count_nonzero(valid) == tree.count_nonzero()
+    assert len(contents) == offsets[-1]
+
+    n_muons = expressions.flatten(tree["NMuon"], cache)[2]
+    broadcast = expressions.broadcast_contents(n_muons, offsets, cache)
+    assert len(broadcast) == len(contents)
+    assert expressions.broadcast_contents(n_muons, offsets, cache) is broadcast
+
+    tree.apply_mask(np.arange(tree.num_entries) % 3 > 0)
+    assert expressions.flatten(tree["Muon_Px"], cache)[2] is not contents
+
+
+def test_identity_cache():
+    cache = expressions.IdentityCache(maxsize=1000)
+    small, large = np.arange(10), np.arange(1000)
+    doubled = cache.memoize([small], np.arange(10).__mul__(2).copy)
+    assert cache.memoize([small], np.ones(10).copy) is doubled
+    assert cache.currsize == doubled.nbytes
+
+    # values larger than the whole budget are computed, but not kept
+    cache.memoize([large], np.arange(1000).copy)
+    assert len(cache) == 1
+
+    # entries go as soon as their arrays do
+    del small
+    assert len(cache) == 0
+    assert cache.currsize == 0
+
+
+def test_flattened_cache_per_tree(full_wrapped_masked_uproot4_tree, full_wrapped_tree):
+    tree = full_wrapped_masked_uproot4_tree
+    tree.reset_mask()
+    expressions.evaluate(tree, "Muon_Px * NMuon")
+    assert len(tree.flattened_cache) > 0
+    assert full_wrapped_tree.flattened_cache is not tree.flattened_cache
+
+    tree.reset_cache()
+    assert len(tree.flattened_cache) == 0
@@ -0,0 +1,43 @@
+import awkward as ak
+import numpy as np
+import pytest
+from fast_carpenter.masks import PackedMask
+
+
+@pytest.fixture
+def bool_masks():
+    rng = np.random.default_rng(1)
+    return rng.random(1003) > 0.3, rng.random(1003) > 0.6
+
+
+def test_round_trip(bool_masks):
+    left, _ = bool_masks
+    packed = PackedMask.from_bool(left)
+    assert len(packed) == len(left)
+    assert packed.nbytes == 126
+    assert np.array_equal(packed.to_bool(), left)
+    assert packed.count_nonzero() == np.count_nonzero(left)
+
+
+def test_operators(bool_masks):
+    left, right = bool_masks
+    packed_left, packed_right = PackedMask.from_bool(left), PackedMask.from_bool(right)
+    assert np.array_equal((packed_left & packed_right).to_bool(), left & right)
+    assert np.array_equal((packed_left | right).to_bool(), left | right)
+    assert np.array_equal((~packed_left).to_bool(), ~left)
+    assert (~packed_left).count_nonzero() == np.count_nonzero(~left)
+
+    packed_left &= packed_right
+    assert packed_left == PackedMask.from_bool(left & right)
+
+
+def test_ones_and_missing():
+    assert PackedMask.ones(13).count_nonzero() == 13
+    assert (~PackedMask.ones(13)).count_nonzero() == 0
+    packed = PackedMask.from_bool(ak.Array([True, None, False, True]))
+    assert packed.to_bool().tolist() == [True, False, False, True]
+
+
+def test_length_mismatch():
+    with pytest.raises(ValueError):
+        PackedMask.ones(8) & PackedMask.ones(9)
@@ -0,0 +1,159 @@
+import ast
+import numpy as np
+import pytest
+from fast_carpenter.define.variables import Define
+from fast_carpenter.define import variations as fast_vary
+from fast_carpenter.selection.stage import CutFlow
+from fast_carpenter.subexpressions import (ComputeTemporaries, FreeTemporaries, eliminate_common_subexpressions,
+                                           find_common_subexpressions, _unparse)
+from fast_carpenter.summary.binned_dataframe import BinnedDataframe
+from fast_carpenter.testing import FakeBEEvent
+from fast_carpenter.tree_adapter import ArrayMethods
+
+
+@pytest.mark.parametrize("expression", [
+    "sqrt(a ** 2 + b ** 2) > 20", "(c > 1) & (e < 2)", "-a ** 2", "(-a) ** 2", "a ** b ** c", "(a ** b) ** c",
+    "a - (b - c)", "(a - b) - c", "~(a | b) & c", "a < b < c", "(a < b) == c", "where(x > 1, x, nan) * 1e-05",
+    "Muon.Px * 2", "not a and b or c", "a and (b or c)", "+a - -b",
+])
+def test_unparse(expression):
+    tree = ast.parse(expression, mode="eval")
+    text = _unparse(tree)
+    assert ast.dump(ast.parse(text, mode="eval")) == ast.dump(tree)
+    if hasattr(ast, "unparse"):
+        assert text == ast.unparse(tree)
+
+
+def test_find_common_subexpressions():
+    steps = [(["sqrt(a ** 2 + b ** 2)", "c > 1"], ["pt"]),
+             (["sqrt(a ** 2 + b ** 2) > 20", "d * pi"], []),
+             (["(c > 1) & (e < 2)", "2 * pi", "2 * pi"], [])]
+    temporaries, substitutions = find_common_subexpressions(steps)
+
+    assert [(temp.expression, temp.first_stage, temp.last_stage) for temp in temporaries] == [
+        ("sqrt(a ** 2 + b ** 2)", 0, 1),
+        ("c > 1", 0, 2),
+    ]
+    first, second = (temp.name for temp in temporaries)
+    assert substitutions[0] == {"sqrt(a ** 2 + b ** 2)": first, "c > 1": second}
+    assert substitutions[1] == {"sqrt(a ** 2 + b ** 2) > 20": first + " > 20"}
+    assert substitutions[2] == {"(c > 1) & (e < 2)": second + " & (e < 2)"}
+
+
+def test_find_common_subexpressions_nested():
+    steps = [(["a * b + c", "a * b"], []), (["(a * b + c) / 2", "a * b - 1"], [])]
+    temporaries, _ = find_common_subexpressions(steps)
+    outer, inner = [temp for temp in temporaries if "c" in temp.expression], \
+        [temp for temp in temporaries if "c" not in temp.expression]
+    assert len(outer) == len(inner) == 1
+    assert temporaries.index(inner[0]) < temporaries.index(outer[0])
+    assert inner[0].name in outer[0].expression
+
+
+def test_defined_variables_are_not_shared():
+    steps = [(["NMuon * 2", "a * 3 + 1"], ["a", "b"]), (["a * 3 > 2", "b * 3"], []), (["b * 3 + 1"], [])]
+    temporaries, substitutions = find_common_subexpressions(steps)
+    assert [(temp.expression, temp.first_stage, temp.last_stage) for temp in temporaries] == [("b * 3", 1, 2)]
+    assert substitutions[0] == {}
+
+
+def test_defined_variables_in_sequence(tmpdir, full_wrapped_masked_uproot4_tree):
+    sequence = eliminate_common_subexpressions([
+        Define("define", str(tmpdir), [{"a": "NMuon * 2"}, {"b": "a * 3 + 1"}]),
+        CutFlow("cuts", str(tmpdir), selection="a * 3 > 2"),
+    ])
+    assert [type(stage) for stage in sequence] == [Define, CutFlow]
+    tree = full_wrapped_masked_uproot4_tree
+    tree.reset_mask()
+    chunk = FakeBEEvent(tree, "data")
+    for stage in sequence:
+        stage.event(chunk)
+    assert np.array_equal(ArrayMethods.fill_none(tree["b"], -1).to_numpy(),
+                          ArrayMethods.fill_none(tree["NMuon"] * 6 + 1, -1).to_numpy())
+    assert tree.count_nonzero() == np.count_nonzero(ArrayMethods.fill_none(tree["NMuon"], 0).to_numpy() > 0)
+    for name in ("a", "b"):
+        tree.delete_variable(name)
+
+
+def test_unparsable_expressions_are_kept():
+    temporaries, substitutions = find_common_subexpressions([(["a >", "a >", "(x if y else z) + 1"] * 2, [])])
+    assert temporaries == []
+    assert substitutions == [{}]
+
+
+def build_sequence(tmpdir):
+    return [
+        Define("define", str(tmpdir), [{"Muon_Pt": "sqrt(Muon_Px ** 2 + Muon_Py ** 2)"},
+                                       {"LeadMuonPt": {"reduce": 0,
+                                                       "formula": "sqrt(Muon_Px ** 2 + Muon_Py ** 2) * 2"}}]),
+        CutFlow("cuts", str(tmpdir), selection={"All": ["NMuon > 1",
+                                                        {"reduce": 0,
+                                                         "formula": "sqrt(Muon_Px ** 2 + Muon_Py ** 2) > 20"}]}),
+    ]
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_eliminate_common_subexpressions(tmpdir, full_wrapped_masked_uproot4_tree, full_wrapped_compact_uproot4_tree,
+                                         compact):
+    tree = full_wrapped_compact_uproot4_tree if compact else full_wrapped_masked_uproot4_tree
+
+    results = {}
+    for share in (False, True):
+        sequence = build_sequence(tmpdir)
+        if share:
+            sequence = eliminate_common_subexpressions(sequence)
+            assert [type(stage) for stage in sequence] == [ComputeTemporaries, Define, CutFlow, FreeTemporaries]
+        tree.reset_mask()
+        chunk = FakeBEEvent(tree, "data")
+        for stage in sequence:
+            stage.event(chunk)
+        results[share] = (ArrayMethods.fill_none(tree["LeadMuonPt"], -1).to_numpy(),
+                          sequence[-2 if share else -1].selection.to_dataframe())
+        if share:
+            assert not [key for key in tree.keys() if key.startswith("_cse_")]
+        for name in ("Muon_Pt", "LeadMuonPt"):
+            tree.delete_variable(name)
+
+    assert np.array_equal(results[False][0], results[True][0])
+    assert results[False][1].equals(results[True][1])
+
+
+def build_varied_sequence(tmpdir):
+    return [
+        Define("scale", str(tmpdir), [{"Muon_Px_up": "Muon_Px * 1.5"}]),
+        fast_vary.ShapeVariations("muon_scale", str(tmpdir), {"Muon_Px": {"up": "Muon_Px_up"}}),
+        Define("muons", str(tmpdir), [{"LeadMuonPx": {"reduce": 0, "formula": "Muon_Px"}}]),
+        CutFlow("cuts", str(tmpdir), selection="LeadMuonPx < 20"),
+        Define("met", str(tmpdir), [{"METx": "MET_px * 2"}, {"METxy": "MET_px * 2 + MET_py"}]),
+        BinnedDataframe("binned", str(tmpdir), binning=[{"in": "METx", "bins": dict(low=-100, high=100, nbins=10)}]),
+    ]
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_shape_variations_are_barriers(tmpdir, full_wrapped_masked_uproot4_tree, full_wrapped_compact_uproot4_tree,
+                                       compact):
+    tree = full_wrapped_compact_uproot4_tree if compact else full_wrapped_masked_uproot4_tree
+
+    results = {}
+    for share in (False, True):
+        sequence = fast_vary.expand_shape_variations(build_varied_sequence(tmpdir))
+        if share:
+            sequence = eliminate_common_subexpressions(sequence)
+            names = [stage.name for stage in sequence]
+            # the variation and the nominal pass each compute their own temporaries
+            assert names.index("met__muon_scale_up__temporaries") < names.index("cuts__end_muon_scale_up")
+            assert names.index("met__temporaries") > names.index("cuts__end_muon_scale_up")
+        tree.reset_mask()
+        chunk = FakeBEEvent(tree, "data")
+        for stage in sequence:
+            stage.event(chunk)
+        binned = [stage for stage in sequence if stage.name == "binned"][0]
+        results[share] = (ArrayMethods.fill_none(tree["METx"], -1).to_numpy(), binned.contents)
+        if share:
+            assert not [key for key in tree.keys() if key.startswith("_cse_")]
+        for name in ("Muon_Px_up", "LeadMuonPx", "METx", "METxy"):
+            tree.delete_variable(name)
+            tree.delete_variable(name + "__muon_scale_up")
+
+    assert np.array_equal(results[False][0], results[True][0])
+    assert results[False][1].equals(results[True][1])
@@ -190,3 +190,52 @@ def test_arrays_as_np_lists(tree_under_test):
     tree_under_test.new_variable("Muon_momentum", muon_momentum)
     np_array = ArrayMethods.arrays_as_np_array(tree_under_test, ["Muon_Py", "Muon_Pz", "Muon_momentum"], how=dict)
     assert ak.all(np_array[-1] == muon_momentum)
+
+
+def test_branch_cache_reuses_arrays(uproot4_adapter):
+    muon_py = uproot4_adapter["Muon_Py"]
+    assert ("Muon_Py", None, None) in uproot4_adapter.branch_cache
+    assert uproot4_adapter["Muon_Py"] is muon_py
+
+    arrays = uproot4_adapter.arrays(["Muon_Py", "Muon_Pz"], how=dict)
+    assert arrays["Muon_Py"] is muon_py
+    assert uproot4_adapter["Muon_Pz"] is arrays["Muon_Pz"]
+
+
+def test_branch_cache_reset(masked_tree):
+    tree = masked_tree._tree.tree
+    masked_tree["Muon_Py"]
+    assert len(tree.branch_cache) == 1
+    masked_tree.reset_cache()
+    assert len(tree.branch_cache) == 0
+
+
+def test_branch_cache_memory_budget(uproot4_tree):
+    nbytes = uproot4_tree["Muon_Py"].array().nbytes
+    adapter = tree_adapter.create({"adapter": "uproot4", "tree": uproot4_tree, "cache_size": nbytes})
+    adapter["Muon_Py"]
+    assert list(adapter.branch_cache.keys()) == [("Muon_Py", None, None)]
+    adapter["Muon_Pz"]
+    assert list(adapter.branch_cache.keys()) == [("Muon_Pz", None, None)]
+    assert adapter.branch_cache.currsize <= nbytes
+
+    adapter["Jet_Px"]
+    assert ("Jet_Px", None, None) not in adapter.branch_cache
+
+
+def test_ranged_reads_only_range(uproot4_tree, uproot4_ranged_adapter, event_range):
+    muon_px = uproot4_ranged_adapter["Muon_Px"]
+    assert len(muon_px) == event_range.entries_in_block
+    expected = uproot4_tree["Muon_Px"].array(entry_start=event_range.start_entry, entry_stop=event_range.stop_entry)
+    assert ak.all(ak.flatten(muon_px) == ak.flatten(expected))
+
+    cached_ranges = [key[1:] for key in uproot4_ranged_adapter.tree.branch_cache.keys()]
+    assert cached_ranges == [(event_range.start_entry, event_range.stop_entry)]
+
+
+def test_ranged_set_range(uproot4_tree, uproot4_ranged_adapter):
+    uproot4_ranged_adapter.new_variable("Muon_Px_copy", uproot4_ranged_adapter["Muon_Px"])
+    uproot4_ranged_adapter.set_range(4500, -1)
+    assert len(uproot4_ranged_adapter) == 80
+    assert len(uproot4_ranged_adapter["Muon_Px"]) == 80
+    assert "Muon_Px_copy" not in uproot4_ranged_adapter
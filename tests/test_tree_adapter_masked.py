@@ -1,4 +1,10 @@
 import awkward as ak
+import numpy as np
+import pandas as pd
+import pytest
+
+import fast_carpenter.selection.stage as stage
+from fast_carpenter.tree_adapter import ArrayMethods
 
 
 def check_data(data, n_data, n_nonzero, n_mask):
@@ -57,3 +63,55 @@ def test_multi_mask(fake_data_events, full_wrapped_tree, at_least_two_muons, at_
     mask = fake_data_events.tree._mask
     assert ak.count_nonzero(mask) == 2
     assert ak.all(fake_data_events.tree["Muon_Pz"] == ak.mask(full_wrapped_tree["Muon_Pz"], mask))
+
+
+def test_compact_mask(fake_sim_events_compact, fake_sim_events, full_wrapped_tree, at_least_two_muons_plus, tmpdir):
+    compact_cutflow = stage.CutFlow(
+        "cutflow_2_compact", str(tmpdir),
+        selection={
+            "All": ["NMuon > 1", {"Any": ["NElectron > 1", "NJet > 1"]}, {"reduce": 1, "formula": "Muon_Px > 0.3"}]
+        },
+        weights="EventWeight",
+    )
+    at_least_two_muons_plus.event(fake_sim_events)
+    compact_cutflow.event(fake_sim_events_compact)
+
+    assert len(fake_sim_events_compact) == 2
+    assert fake_sim_events_compact.count_nonzero() == 2
+    index = fake_sim_events_compact.tree._index
+    assert index.dtype == np.int64
+    assert ak.all(fake_sim_events_compact.tree["Muon_Pz"] == full_wrapped_tree["Muon_Pz"][index])
+    muon_py, = fake_sim_events_compact.tree.arrays(["Muon_Py"], how=tuple)
+    assert ak.all(muon_py == full_wrapped_tree["Muon_Py"][index])
+
+    pd.testing.assert_frame_equal(compact_cutflow.selection.to_dataframe(),
+                                  at_least_two_muons_plus.selection.to_dataframe())
+
+
+def test_compact_mask_new_variable(fake_sim_events_compact, at_least_two_muons):
+    at_least_two_muons.event(fake_sim_events_compact)
+    tree = fake_sim_events_compact.tree
+    assert len(tree) == 289
+
+    n_muon = tree["NMuon"]
+    tree.new_variable("NMuon_copy", n_muon * 2)
+    assert ak.all(tree["NMuon_copy"] == n_muon * 2)
+
+    tree.reset_mask()
+    assert len(tree) == len(tree["NMuon"])
+    assert ak.count_nonzero(~ak.is_none(tree["NMuon_copy"])) == 289
+
+
+def test_as_arrow(fake_sim_events, fake_sim_events_compact, at_least_two_muons):
+    pytest.importorskip("pyarrow")
+    for events in (fake_sim_events, fake_sim_events_compact):
+        at_least_two_muons.event(events)
+        table = events.tree.as_arrow(["NMuon", "Muon_Px"])
+        assert table.column_names == ["NMuon", "Muon_Px"]
+        assert table.num_rows == 289
+        assert table["NMuon"].null_count == 0
+        assert min(table["NMuon"].to_pylist()) >= 2
+
+        flat = ArrayMethods.flatten_arrow(table)
+        assert flat.num_rows == sum(table["NMuon"].to_pylist())
+        assert flat["Muon_Px"].to_pylist() == sum(table["Muon_Px"].to_pylist(), [])
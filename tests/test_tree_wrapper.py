@@ -8,7 +8,7 @@ ArrayMethods = tree_adapter.Uproot4Methods
 
 def test_add_retrieve(wrapped_tree):
     muon_px = wrapped_tree.array("Muon_Px")
-    assert len(muon_px) == 4580
+    assert len(muon_px) == 100
     assert ArrayMethods.filtered_len(muon_px) == 100
 
     muon_py, muon_pz = wrapped_tree.arrays(["Muon_Py", "Muon_Pz"], outputtype=tuple)